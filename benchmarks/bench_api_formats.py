@@ -0,0 +1,64 @@
+"""
+Compares PGN and NDJSON ingestion: parsing + standardization of the same synthetic games.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_api_formats --games 100000
+
+Both formats must produce identical PGNGameHeaderStandardized records.
+"""
+
+import argparse
+import time
+
+from benchmarks.bench_pgn_parser import as_chunks
+from benchmarks.synthetic_data import generate_ndjson, generate_pgn
+from helpers.lichess_api_helper import LichessAPIHelper
+from helpers.pgn_parser_helper import PGNHeaderParser
+from helpers.pipeline_helper import PGNGameHeaderStandardized
+
+
+def standardize_pgn(chunks: list[str]) -> list[PGNGameHeaderStandardized]:
+    return [
+        PGNGameHeaderStandardized.from_pgn_header(header)
+        for header in PGNHeaderParser.parse_games_headers(chunks)
+    ]
+
+
+def standardize_ndjson(chunks: list[str]) -> list[PGNGameHeaderStandardized]:
+    return [
+        PGNGameHeaderStandardized.from_api_json(game)
+        for game in LichessAPIHelper.parse_games_json(chunks)
+    ]
+
+
+def measure(func, chunks: list[str]) -> tuple[list, float]:
+    started = time.perf_counter()
+    output = func(chunks)
+    return output, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark PGN vs NDJSON ingestion")
+    parser.add_argument("--games", type=int, default=100_000, help="Number of synthetic games")
+    args = parser.parse_args()
+
+    inputs = {
+        "pgn": (standardize_pgn, as_chunks(generate_pgn(args.games))),
+        "ndjson": (standardize_ndjson, as_chunks(generate_ndjson(args.games))),
+    }
+
+    outputs = {}
+    for api_format, (func, chunks) in inputs.items():
+        outputs[api_format], elapsed = measure(func, chunks)
+        size_mib = sum(len(chunk) for chunk in chunks) / 1024 / 1024
+        print(
+            f"{api_format:>6}: {args.games} games ({size_mib:.1f} MiB) in {elapsed:.2f}s, "
+            f"{args.games / elapsed:,.0f} games/sec"
+        )
+
+    if outputs["pgn"] != outputs["ndjson"]:
+        mismatch = next(i for i, (a, b) in enumerate(zip(outputs["pgn"], outputs["ndjson"])) if a != b)
+        raise SystemExit(
+            f"Output differs at game #{mismatch}:\n{outputs['pgn'][mismatch]}\n{outputs['ndjson'][mismatch]}"
+        )
+    print("Identical output: OK")
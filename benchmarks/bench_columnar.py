@@ -0,0 +1,76 @@
+"""
+Compares per-row standardization/personification (from_pgn_header + from_pgn_header_std)
+with the columnar batch transform (ColumnarHelper) on synthetic games.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_columnar --games 1000000 --batch-size 5000
+
+Games are parsed (not timed) and transformed batch by batch, like during export.
+"columnar" times the transform of column batches, "pivot" - building column batches
+from parsed PGNGameHeader objects (headers_to_table). Both paths must produce identical rows.
+"""
+
+import argparse
+import time
+from dataclasses import asdict
+from itertools import islice
+
+from benchmarks.synthetic_data import PLAYER, game_to_pgn, generate_games
+from helpers.columnar_helper import ColumnarHelper
+from helpers.pgn_parser_helper import PGNGameHeader, PGNHeaderParser
+from helpers.pipeline_helper import (
+    PGNGameHeaderPersonified,
+    PGNGameHeaderStandardized,
+)
+
+
+def transform_rows(headers: list[PGNGameHeader]) -> list[PGNGameHeaderPersonified]:
+    return [
+        PGNGameHeaderPersonified.from_pgn_header_std(
+            PGNGameHeaderStandardized.from_pgn_header(header), PLAYER
+        )
+        for header in headers
+    ]
+
+
+def iter_header_batches(games_count: int, batch_size: int):
+    games = generate_games(games_count)
+    while pgn_text := "".join(game_to_pgn(game) for game in islice(games, batch_size)):
+        yield list(PGNHeaderParser.parse_games_headers([pgn_text]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark row vs columnar transform")
+    parser.add_argument("--games", type=int, default=1_000_000, help="Number of synthetic games")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Games transformed at once")
+    args = parser.parse_args()
+
+    elapsed = {"rows": 0.0, "pivot": 0.0, "columnar": 0.0}
+    games_count = 0
+    for headers in iter_header_batches(args.games, args.batch_size):
+        started = time.perf_counter()
+        rows = transform_rows(headers)
+        elapsed["rows"] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        raw = ColumnarHelper.headers_to_table(headers)
+        elapsed["pivot"] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        table = ColumnarHelper.personify_batch(ColumnarHelper.standardize_batch(raw), PLAYER)
+        elapsed["columnar"] += time.perf_counter() - started
+
+        expected = [asdict(row) for row in rows]
+        if table.to_pylist() != expected:
+            actual = table.to_pylist()
+            mismatch = next(i for i, (a, b) in enumerate(zip(actual, expected)) if a != b)
+            raise SystemExit(
+                f"Output differs at game #{games_count + mismatch}:\n{expected[mismatch]}\n{actual[mismatch]}"
+            )
+        games_count += len(headers)
+
+    for path, path_elapsed in elapsed.items():
+        print(f"{path:>8}: {games_count} games in {path_elapsed:.2f}s, {games_count / path_elapsed:,.0f} games/sec")
+    print(f"Speedup of the transform: {elapsed['rows'] / elapsed['columnar']:.1f}x")
+    print(f"Speedup including pivot: {elapsed['rows'] / (elapsed['pivot'] + elapsed['columnar']):.1f}x")
+    print("Identical output: OK")
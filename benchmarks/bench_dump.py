@@ -0,0 +1,64 @@
+"""
+Measures ingestion of a Lichess monthly database dump (LichessDump) on a synthetic dump.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_dump --file /tmp/synthetic_dump.pgn.zst --games 2000000 --workers 4
+
+The dump (~2 KB of PGN per game, like the real ones) is generated once if the file doesn't exist:
+zstd-compressed for .zst files (requires zstandard), plain PGN otherwise. --games 2000000 gives
+a ~4 GB decompressed dump. Games of --cohort players (out of --players) are extracted, and
+the throughput is reported per game and per decompressed MB scanned.
+"""
+
+import argparse
+import os
+import time
+
+from benchmarks.synthetic_data import generate_dump
+from helpers.dump_helper import LichessDump, zstandard
+
+# games rendered and written at once while generating the dump
+WRITE_BATCH_GAMES = 10_000
+
+
+def write_dump(path: str, games_count: int, players: int) -> None:
+    games = generate_dump(games_count, players)
+    with open(path, "wb") as dump_file:
+        if path.endswith(".zst"):
+            # like the real dumps, compressed with long distance matching
+            params = zstandard.ZstdCompressionParameters.from_level(3, enable_ldm=True, window_log=27)
+            writer = zstandard.ZstdCompressor(compression_params=params).stream_writer(dump_file)
+        else:
+            writer = dump_file
+        with writer:
+            while text := "".join(game for _, game in zip(range(WRITE_BATCH_GAMES), games)):
+                writer.write(text.encode("utf-8"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingestion of a monthly database dump")
+    parser.add_argument("--file", default="synthetic_dump.pgn.zst", help="Dump to read (generated if missing)")
+    parser.add_argument("--games", type=int, default=1_000_000, help="Games of the generated dump")
+    parser.add_argument("--players", type=int, default=1000, help="Distinct players of the generated dump")
+    parser.add_argument("--cohort", type=int, default=10, help="Players whose games are extracted")
+    parser.add_argument("--perf-type", default=None, help="Comma-separated perf types to keep")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Parsing processes")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file):
+        print(f"Generating {args.games:,} games into '{args.file}'...")
+        started = time.perf_counter()
+        write_dump(args.file, args.games, args.players)
+        print(f"Generated in {time.perf_counter() - started:.1f}s, {os.path.getsize(args.file) / 2**20:,.0f} MiB on disk")
+
+    usernames = [f"player_{i}" for i in range(args.cohort)]
+    perf_types = args.perf_type.split(",") if args.perf_type else None
+    dump = LichessDump(args.file, usernames, perf_types)
+
+    started = time.perf_counter()
+    rows_count = sum(len(table) for table in dump.read(args.workers))
+    elapsed = time.perf_counter() - started
+
+    print(f"Scanned {dump.games_scanned:,} games ({dump.bytes_read / 2**20:,.0f} MiB of PGN) in {elapsed:.1f}s")
+    print(f"  {dump.games_scanned / elapsed:,.0f} games/sec, {dump.bytes_read / 2**20 / elapsed:,.0f} MiB/sec")
+    print(f"  {rows_count:,} games of {args.cohort} players extracted, {args.workers} worker(s)")
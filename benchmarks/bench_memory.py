@@ -0,0 +1,78 @@
+"""
+Measures memory held by personified game records (the form batches are kept in before writing).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_memory --games 200000
+
+"compact" - records as produced by the pipeline: slotted dataclasses sharing interned/cached
+values, "plain" - the same records copied into dict-based dataclasses with a fresh string
+per value (how records were stored before). Non-string values are shared by both, so
+the reduction is understated. Results are scaled to a million games.
+"""
+
+import argparse
+import gc
+import tracemalloc
+from dataclasses import astuple, fields, make_dataclass
+
+from benchmarks.bench_pgn_parser import as_chunks
+from benchmarks.synthetic_data import PLAYER, generate_pgn
+from helpers.pgn_parser_helper import PGNHeaderParser
+from helpers.pipeline_helper import PGNGameHeaderPersonified, PGNGameHeaderStandardized
+
+PlainPersonified = make_dataclass(
+    "PlainPersonified", [(field.name, field.type, None) for field in fields(PGNGameHeaderPersonified)]
+)
+
+
+def fresh_copy(value):
+    # slicing and concatenation give a new string object with the same value
+    if isinstance(value, str) and len(value) > 1:
+        return value[:1] + value[1:]
+    return value
+
+
+def build_compact(chunks: list[str]) -> list[PGNGameHeaderPersonified]:
+    return [
+        PGNGameHeaderPersonified.from_pgn_header_std(
+            PGNGameHeaderStandardized.from_pgn_header(header), PLAYER
+        )
+        for header in PGNHeaderParser.parse_games_headers(chunks)
+    ]
+
+
+def build_plain(records: list[PGNGameHeaderPersonified]) -> list:
+    return [PlainPersonified(*map(fresh_copy, astuple(record))) for record in records]
+
+
+def measure(build, *args) -> tuple[list, int]:
+    gc.collect()
+    tracemalloc.start()
+    output = build(*args)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return output, size
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark memory of in-memory game records")
+    parser.add_argument("--games", type=int, default=200_000, help="Number of synthetic games")
+    args = parser.parse_args()
+
+    chunks = as_chunks(generate_pgn(args.games))
+
+    compact, compact_size = measure(build_compact, chunks)
+    plain, plain_size = measure(build_plain, compact)
+    assert [astuple(record) for record in compact] == [astuple(record) for record in plain]
+
+    scale = 1_000_000 / len(compact)
+    for name, size in (("plain", plain_size), ("compact", compact_size)):
+        print(
+            f"{name:>8}: {size / len(compact):,.0f} bytes/game, "
+            f"{size * scale / 2**20:,.0f} MiB per million games"
+        )
+    print(f"Memory reduction: {1 - compact_size / plain_size:.0%}")
+
+    for name, info in PGNGameHeaderStandardized.cache_info().items():
+        print(f"{name:>20}: {info.hits} hits, {info.misses} misses, {info.currsize} cached")
@@ -0,0 +1,61 @@
+"""
+Measures movetext analysis (MovetextAnalyzer, used by --with-moves) with 1..N worker processes.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_movetext --games 20000 --workers 1,2,4,8 --mode chess
+
+Games are generated with moves and [%clk] comments, parsed with movetext kept and analyzed
+in batches like the export does (--batch-size). Throughput should grow close to linearly with
+the number of workers, up to the number of cores.
+"""
+
+import argparse
+import os
+import time
+
+from benchmarks.synthetic_data import game_to_pgn, generate_games
+from helpers.movetext_helper import MovetextAnalyzer
+from helpers.pgn_parser_helper import PGNHeaderParser, PGNParserMode
+from helpers.pipeline_helper import PipelineHelper
+
+
+def measure(headers: list, workers: int, mode: str, batch_size: int) -> float:
+    """Elapsed time of analyzing all games (worker processes are started before the clock starts)"""
+    with MovetextAnalyzer(workers, mode) as analyzer:
+        analyzer.analyze(headers[: 2 * batch_size])  # warm-up
+        started = time.perf_counter()
+        for batch in PipelineHelper.batched(headers, batch_size):
+            analyzer.analyze(batch)
+        return time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark movetext analysis in worker processes")
+    parser.add_argument("--games", type=int, default=20_000, help="Number of synthetic games")
+    parser.add_argument(
+        "--workers",
+        default=",".join(str(2**i) for i in range(os.cpu_count().bit_length()) if 2**i <= os.cpu_count()),
+        help="Comma-separated numbers of worker processes to compare",
+    )
+    parser.add_argument(
+        "--mode",
+        default=PGNParserMode.FAST,
+        choices=[PGNParserMode.FAST, PGNParserMode.CHESS],
+        help="Movetext parser: fast (regex tokenizer) or chess (python-chess move replay)",
+    )
+    parser.add_argument("--batch-size", type=int, default=5000, help="Games per analyzed batch")
+    args = parser.parse_args()
+
+    pgn_text = "".join(game_to_pgn(game, moves=True) for game in generate_games(args.games))
+    headers = list(PGNHeaderParser.parse_games_headers([pgn_text], keep_movetext=True))
+    print(f"{len(headers):,} games, {len(pgn_text) / 2**20:.1f} MiB of PGN, {os.cpu_count()} CPU(s), mode {args.mode}")
+
+    baseline = None
+    for workers in map(int, args.workers.split(",")):
+        elapsed = measure(headers, workers, args.mode, args.batch_size)
+        games_per_sec = len(headers) / elapsed
+        baseline = baseline or games_per_sec
+        print(
+            f"  {workers:>3} worker(s): {games_per_sec:>10,.0f} games/sec, "
+            f"speedup {games_per_sec / baseline:.2f}x"
+        )
@@ -0,0 +1,59 @@
+"""
+Compares header-only PGN parser with python-chess read_game on a synthetic file.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_pgn_parser --games 100000
+
+Target: the fast parser should be at least 5x faster (games/sec) than read_game.
+"""
+
+import argparse
+import time
+
+from benchmarks.synthetic_data import generate_pgn
+from helpers.pgn_parser_helper import PGNHeaderParser, PGNParserMode
+
+SPEEDUP_TARGET = 5.0
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def as_chunks(text: str) -> list[str]:
+    """Slices text the way it arrives from network"""
+    return [text[i : i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
+
+
+def measure(pgn_text: str, mode: str, repeats: int = 3) -> tuple[int, float]:
+    """Returns number of parsed games and the best elapsed time of several runs"""
+    chunks = as_chunks(pgn_text)
+    best_elapsed = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        games_count = sum(1 for _ in PGNHeaderParser.parse_games_headers(chunks, mode))
+        best_elapsed = min(best_elapsed, time.perf_counter() - started)
+    return games_count, best_elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark PGN header parsers")
+    parser.add_argument("--games", type=int, default=100_000, help="Number of synthetic games")
+    args = parser.parse_args()
+
+    pgn_text = generate_pgn(args.games)
+    print(f"Synthetic PGN: {args.games} games, {len(pgn_text) / 1024 / 1024:.1f} MiB")
+
+    results = {}
+    for mode in (PGNParserMode.CHESS, PGNParserMode.FAST):
+        games_count, elapsed = measure(pgn_text, mode)
+        results[mode] = games_count / elapsed
+        print(f"{mode:>6}: {games_count} games in {elapsed:.2f}s, {results[mode]:,.0f} games/sec")
+
+    speedup = results[PGNParserMode.FAST] / results[PGNParserMode.CHESS]
+    status = "OK" if speedup >= SPEEDUP_TARGET else "BELOW TARGET"
+    print(f"Speedup: {speedup:.1f}x (target {SPEEDUP_TARGET:.0f}x) - {status}")
+
+    # both parsers must agree on every game
+    sample = as_chunks(pgn_text[: len(pgn_text) // 10])
+    list(PGNHeaderParser.parse_games_headers(sample, PGNParserMode.VERIFY))
+    print("Verification against read_game: OK")
@@ -0,0 +1,103 @@
+"""
+Measures building and querying the position index (PositionIndex) of an output.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_positions --file /tmp/positions_bench.parquet --games 300000 --workers 4
+
+A parquet output of synthetic games with backfilled moves (<output>.details.parquet) is generated
+once if the file doesn't exist. The index is built over the first --max-ply plies, then positions
+at every ply of a few games are queried. Synthetic games share a handful of openings, so early
+positions are reached by a large part of all games. Queries for all players read the precomputed
+totals of the position; --player queries aggregate over every game of the position, so they're
+timed separately. Target: well under a millisecond per query.
+"""
+
+import argparse
+import os
+import statistics
+import time
+from itertools import islice
+
+import pyarrow as pa
+
+from benchmarks.synthetic_data import PLAYER, game_to_json_with_moves, game_to_pgn, generate_games
+from helpers.backfill_helper import GameDetails
+from helpers.columnar_helper import ColumnarHelper
+from helpers.pgn_parser_helper import PGNHeaderParser
+from helpers.pipeline_helper import ParquetSink
+from helpers.position_index_helper import DEFAULT_MAX_PLY, PositionIndex
+
+GENERATE_BATCH_GAMES = 10_000
+
+
+def write_output(path: str, games_count: int) -> None:
+    games = generate_games(games_count)
+    details = GameDetails(path, "parquet")
+    details_tables = []
+    with ParquetSink(path) as sink:
+        while batch := list(islice(games, GENERATE_BATCH_GAMES)):
+            headers = list(PGNHeaderParser.parse_games_headers(["".join(map(game_to_pgn, batch))]))
+            sink.write(ColumnarHelper.transform_headers(headers, PLAYER))
+            details_tables.append(
+                pa.Table.from_pylist(
+                    [
+                        GameDetails.from_api_json(game_to_json_with_moves(game, clocks=False, evals=False))
+                        for game in batch
+                    ]
+                )
+            )
+    details.merge(pa.concat_tables(details_tables))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the position index")
+    parser.add_argument("--file", default="positions_bench.parquet", help="Output to index (generated if missing)")
+    parser.add_argument("--games", type=int, default=300_000, help="Games of the generated output")
+    parser.add_argument("--max-ply", type=int, default=DEFAULT_MAX_PLY, help="Plies indexed per game")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes building the index")
+    parser.add_argument("--queried-games", type=int, default=20, help="Games whose positions are queried")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file):
+        print(f"Generating {args.games:,} games with moves into '{args.file}'...")
+        started = time.perf_counter()
+        write_output(args.file, args.games)
+        print(f"Generated in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    index = PositionIndex.build(args.file, "parquet", args.max_ply, args.workers)
+    elapsed = time.perf_counter() - started
+    index_size = os.path.getsize(PositionIndex.index_path(args.file))
+    print(
+        f"Built in {elapsed:.1f}s ({index.games.num_rows / elapsed:,.0f} games/sec, {args.workers} worker(s)): "
+        f"{index.entries_count:,} game positions, {index.positions_count:,} (position, player) totals, {index_size / 2**20:.1f} MiB"
+    )
+
+    # queries go through the memory-mapped file, like in a fresh process
+    index = PositionIndex(args.file)
+    moves = GameDetails(args.file, "parquet").load()["Moves"].to_pylist()[: args.queried_games]
+    positions = [
+        PositionIndex.position_hash(moves=game_moves.split()[:ply])
+        for game_moves in moves
+        for ply in range(args.max_ply + 1)
+    ]
+    for player in (None, PLAYER):
+        latencies, games_matched = [], 0
+        for position_hash in positions:
+            # query() without replaying the moves: lookup and aggregation only
+            started = time.perf_counter()
+            stats = index.stats(position_hash, player)
+            latencies.append(time.perf_counter() - started)
+            games_matched += stats.Games
+
+        latencies.sort()
+        print(
+            f"{len(positions):,} queries ({'player ' + player if player else 'all players'}), "
+            f"{games_matched / len(positions):,.0f} games per position on average: "
+            f"median {statistics.median(latencies) * 1e6:,.0f} us, "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:,.0f} us, max {latencies[-1] * 1e6:,.0f} us"
+        )
+
+    started = time.perf_counter()
+    stats = index.query(moves=moves[0].split()[:4])
+    print(f"Full query with move replay: {(time.perf_counter() - started) * 1e6:,.0f} us - {stats}")
@@ -0,0 +1,122 @@
+"""
+Startup cost of export_games.py: time spent importing modules (python -X importtime) for --help,
+an argument error and a small CSV export, against import budgets.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --runs 10 --help-budget-ms 60 --export-budget-ms 300
+
+Every scenario runs in a new process --runs times, medians are reported. "imports" is the import
+time of the script's own modules (commands, helpers and their dependencies) - the interpreter's
+startup (site, encodings) is the same for any script and isn't counted. "csv setup" imports what
+a CSV export imports before its first request (arguments and the export command module); the whole
+"csv export" also imports modules loaded lazily while it runs (e.g. pandas, imported by pyarrow for
+the cube aggregation). --help and argument errors mustn't import any of HEAVY_MODULES.
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.bench_suite import fake_server
+
+# top-level modules imported by any python process before the script runs
+INTERPRETER_MODULES = {"site", "encodings", "_frozen_importlib_external", "zipimport", "io", "_signal", "_abc"}
+
+HEAVY_MODULES = ["pyarrow", "pandas", "duckdb", "numpy", "chess", "urllib3"]
+
+IMPORT_LINE_REGEX = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def parse_importtime(stderr: str) -> dict[str, int]:
+    """Cumulative import time (us) of every top-level import of `-X importtime` output"""
+    imports = {}
+    for line in stderr.splitlines():
+        match = IMPORT_LINE_REGEX.match(line)
+        if match and len(match.group(3)) == 1:
+            imports[match.group(4)] = imports.get(match.group(4), 0) + int(match.group(2))
+    return imports
+
+
+def loaded_modules(stderr: str) -> set[str]:
+    return {match.group(4) for line in stderr.splitlines() if (match := IMPORT_LINE_REGEX.match(line))}
+
+
+def run_scenario(command: list[str], env: dict) -> dict:
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, "-X", "importtime", *command], env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    imports = parse_importtime(process.stderr)
+    modules = loaded_modules(process.stderr)
+    return {
+        "exit_code": process.returncode,
+        "wall_ms": wall * 1000,
+        "imports_ms": sum(us for name, us in imports.items() if name not in INTERPRETER_MODULES) / 1000,
+        "heavy": [name for name in HEAVY_MODULES if name in modules],
+    }
+
+
+def median_of(runs: list[dict], key: str) -> float:
+    return statistics.median(run[key] for run in runs)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup (import) time of export_games.py")
+    parser.add_argument("--runs", type=int, default=5, help="Runs of every scenario (medians are reported)")
+    parser.add_argument(
+        "--help-budget-ms", type=float, default=60.0, help="Budget of imports for --help and argument errors"
+    )
+    parser.add_argument(
+        "--export-budget-ms",
+        type=float,
+        default=300.0,
+        help="Budget of the CSV export setup (pyarrow itself takes ~100 ms of it on a slow machine)",
+    )
+    args = parser.parse_args()
+
+    env = {key: value for key, value in os.environ.items() if key not in ("LICHESS_TOKEN", "LICHESS_BASE_URL")}
+    with tempfile.TemporaryDirectory() as folder, fake_server(100, None) as base_url:
+        export_env = {**env, "LICHESS_TOKEN": "benchmark", "LICHESS_BASE_URL": base_url}
+        export_args = ["--start-date", "2024-01-01", "--end-date", "2024-12-31", "--max-games", "50"]
+        export_games = ["export_games.py"]
+        scenarios = [
+            # name, command, environment, budget of imports (ms; None - not checked), no heavy modules allowed
+            ("help", [*export_games, "--help"], env, args.help_budget_ms, True),
+            ("stats help", [*export_games, "stats", "--help"], env, args.help_budget_ms, True),
+            ("serve help", [*export_games, "serve", "--help"], env, args.help_budget_ms, True),
+            ("no token", [*export_games, "--username", "benchmark_player", *export_args], env, args.help_budget_ms, True),
+            # arguments parsed, the export command module imported - before the first request
+            ("csv setup", ["-c", "import commands.arguments, commands.export"], env, args.export_budget_ms, False),
+            (
+                "csv export",
+                [*export_games, "--username", "benchmark_player", "--folder", folder, "--format", "csv", *export_args],
+                export_env,
+                None,
+                False,
+            ),
+        ]
+
+        print(f"{'scenario':>12} {'exit':>4} {'wall':>9} {'imports':>9}  heavy modules loaded")
+        over_budget = []
+        for name, command, scenario_env, budget, light in scenarios:
+            runs = [run_scenario(command, scenario_env) for _ in range(args.runs)]
+            imports = median_of(runs, "imports_ms")
+            print(
+                f"{name:>12} {runs[0]['exit_code']:>4} {median_of(runs, 'wall_ms'):>6.0f} ms {imports:>6.0f} ms  "
+                f"{', '.join(runs[0]['heavy']) or '-'}"
+            )
+            if budget is not None and imports > budget:
+                over_budget.append(f"{name}: {imports:.0f} ms (budget {budget:.0f} ms)")
+            if light and runs[0]["heavy"]:
+                over_budget.append(f"{name}: imports {', '.join(runs[0]['heavy'])}")
+
+    if over_budget:
+        print("Over budget:")
+        print("\n".join(over_budget))
+        exit(1)
+    print("All scenarios within budget")
@@ -0,0 +1,334 @@
+"""
+Benchmark suite of the export pipeline: games/sec and memory growth of every stage at several sizes,
+saved as JSON so runs before and after a change can be compared.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_suite --sizes 10000,100000,1000000 --output bench_results.json
+    python -m benchmarks.bench_suite --sizes 10000,100000 --baseline bench_results.json
+
+For every size a fake Lichess server (fake_lichess_server.py, in its own process, so its memory
+isn't counted) serves that many synthetic games of one user. Stages run one after another, batch
+by batch like the export does:
+    fetch - download of the PGN stream through LichessAPIHelper (into a temporary file)
+    parse - PGN headers of the downloaded games (PGNHeaderParser)
+    standardize, personify - per-row dataclasses or columnar batches (--transforms)
+    write_csv, write_parquet - sinks of the output formats (--formats)
+RSS growth of a stage is the highest resident memory of this process sampled while a step of the
+stage (a batch) ran minus the resident memory when the step started - the memory the stage itself
+takes, not the memory earlier stages and batches left allocated (the process RSS only ever grows
+along the run, so its absolute peak would be charged to whichever stage runs last).
+
+With --baseline, every stage is compared with the same stage of an earlier run; a throughput drop
+or RSS growth above --tolerance (relative, of at least RSS_GROWTH_FLOOR_MIB) is reported as a
+regression (exit code 1). Stages of 10k games
+take milliseconds, so compare the larger sizes - or several runs - before trusting a small change.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+# imported lazily by the helpers: loaded upfront, or their import would count to the first batch of a stage
+import pyarrow.compute  # noqa: F401
+import pyarrow.parquet  # noqa: F401
+
+from benchmarks.synthetic_data import START_TIMESTAMP_MSEC
+from helpers.columnar_helper import ColumnarHelper
+from helpers.lichess_api_helper import APIParams_GetGames, LichessAPIHelper
+from helpers.pgn_parser_helper import PGNHeaderParser
+from helpers.pipeline_helper import PGNGameHeaderPersonified, PGNGameHeaderStandardized, PipelineHelper
+
+STAGES = ["fetch", "parse", "standardize", "personify", "write_csv", "write_parquet"]
+TRANSFORMS = ["rows", "columnar"]
+FORMATS = ["csv", "parquet"]
+
+READ_CHUNK_SIZE = 64 * 1024
+RSS_SAMPLE_INTERVAL = 0.005  # seconds
+# RSS growths below it are noise of the allocator: changes of them are relative to at least this
+RSS_GROWTH_FLOOR_MIB = 1.0
+
+# the fake server plays the user's games from START_TIMESTAMP_MSEC on, a game every ~15 minutes
+SERVED_PERIOD_MSEC = 100 * 365 * 24 * 3600 * 1000
+
+
+def current_rss() -> int:
+    """Resident memory of this process in bytes (the peak so far where /proc isn't available)"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class StagesRecorder:
+    """
+    Wall time and RSS growth per stage (the largest of its steps, see the module docstring);
+    a background thread samples RSS while a step runs
+    """
+
+    def __init__(self):
+        self.elapsed = defaultdict(float)
+        self.rss_growth = defaultdict(int)
+        # highest RSS sampled during the running step, None - no step is running
+        self.step_peak_rss: Optional[int] = None
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.sampler.start()
+
+    def sample(self) -> None:
+        while not self.stopped.wait(RSS_SAMPLE_INTERVAL):
+            rss = current_rss()
+            with self.lock:
+                if self.step_peak_rss is not None:
+                    self.step_peak_rss = max(self.step_peak_rss, rss)
+
+    @contextmanager
+    def measure(self, stage: str):
+        start_rss = current_rss()
+        with self.lock:
+            self.step_peak_rss = start_rss
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.elapsed[stage] += time.perf_counter() - started
+            rss = current_rss()
+            with self.lock:
+                peak_rss = max(self.step_peak_rss, rss)
+                self.step_peak_rss = None
+            self.rss_growth[stage] = max(self.rss_growth[stage], peak_rss - start_rss)
+
+    def measured(self, stage: str, items: Iterator) -> Iterator:
+        """Yields the items, time spent getting each of them counts to the stage"""
+        iterator = iter(items)
+        while True:
+            with self.measure(stage):
+                item = next(iterator, None)
+            if item is None:
+                return
+            yield item
+
+    def close(self) -> None:
+        self.stopped.set()
+        self.sampler.join()
+
+
+@contextmanager
+def fake_server(games: int, throttle_every: Optional[int]):
+    """Fake Lichess server with `games` games per user in a child process, yields its base URL"""
+    command = [sys.executable, "-u", "-m", "benchmarks.fake_lichess_server", "--port", "0", "--games", str(games)]
+    if throttle_every:
+        command += ["--throttle-every", str(throttle_every)]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    try:
+        # "Serving fake Lichess API at http://127.0.0.1:<port>/"
+        yield process.stdout.readline().split()[-1]
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def fetch(recorder: StagesRecorder, base_url: str, username: str, file_path: str) -> int:
+    """Downloads all games of the user into the file, returns the number of bytes received"""
+    api_helper = LichessAPIHelper("benchmark-token", base_url=base_url)
+    params = APIParams_GetGames(
+        rated=True,
+        opening=True,
+        moves=False,
+        since=START_TIMESTAMP_MSEC,
+        until=START_TIMESTAMP_MSEC + SERVED_PERIOD_MSEC,
+    )
+    # the server generates games of a user on the first request - not a part of the download
+    "".join(api_helper.get_stream(f"api/games/user/{username}", APIParams_GetGames(**params, max=1)))
+
+    size = 0
+    with open(file_path, "w", encoding="utf-8") as pgn_file:
+        for chunk in recorder.measured("fetch", api_helper.get_stream(f"api/games/user/{username}", params)):
+            pgn_file.write(chunk)
+            size += len(chunk)
+    return size
+
+
+def read_chunks(file_path: str) -> Iterator[str]:
+    with open(file_path, encoding="utf-8") as pgn_file:
+        while chunk := pgn_file.read(READ_CHUNK_SIZE):
+            yield chunk
+
+
+def transform_and_write(
+    recorder: StagesRecorder,
+    file_path: str,
+    username: str,
+    transform: str,
+    formats: list[str],
+    output_folder: str,
+    batch_size: int,
+) -> int:
+    """Parses, transforms and writes the downloaded games batch by batch, returns the number of games"""
+    headers = PGNHeaderParser.parse_games_headers(read_chunks(file_path))
+    sinks = {
+        output_format: PipelineHelper.open_sink(output_format, os.path.join(output_folder, f"games.{output_format}"))
+        for output_format in formats
+    }
+    games_count = 0
+    for batch in recorder.measured("parse", PipelineHelper.batched(headers, batch_size)):
+        if transform == "columnar":
+            with recorder.measure("standardize"):
+                games_std = ColumnarHelper.standardize_batch(ColumnarHelper.headers_to_table(batch))
+            with recorder.measure("personify"):
+                games = ColumnarHelper.personify_batch(games_std, username)
+        else:
+            with recorder.measure("standardize"):
+                games_std = [PGNGameHeaderStandardized.from_pgn_header(header) for header in batch]
+            with recorder.measure("personify"):
+                games = [PGNGameHeaderPersonified.from_pgn_header_std(game, username) for game in games_std]
+        for output_format, sink in sinks.items():
+            with recorder.measure(f"write_{output_format}"):
+                sink.write(games)
+        games_count += len(batch)
+
+    for output_format, sink in sinks.items():
+        with recorder.measure(f"write_{output_format}"):
+            sink.close()
+    return games_count
+
+
+def run_size(games: int, args: argparse.Namespace) -> list[dict]:
+    """Results of all stages of all transforms for a server with `games` games"""
+    results = []
+    username = f"bench_{games}"
+    with tempfile.TemporaryDirectory(prefix="bench_suite_") as folder:
+        pgn_path = os.path.join(folder, "games.pgn")
+        with fake_server(games, args.throttle_every) as base_url:
+            fetch_recorder = StagesRecorder()
+            size = fetch(fetch_recorder, base_url, username, pgn_path)
+            fetch_recorder.close()
+        print(f"{games:,} games: {size / 2**20:,.1f} MiB of PGN downloaded in {fetch_recorder.elapsed['fetch']:.1f}s")
+
+        for transform in args.transforms.split(","):
+            recorder = StagesRecorder()
+            output_folder = os.path.join(folder, transform)
+            os.makedirs(output_folder)
+            games_count = transform_and_write(
+                recorder, pgn_path, username, transform, args.formats.split(","), output_folder, args.batch_size
+            )
+            recorder.close()
+            if not results:  # the download doesn't depend on the transform
+                results.append(stage_result(fetch_recorder, "fetch", games_count, "-"))
+            results += [
+                stage_result(recorder, stage, games_count, transform)
+                for stage in STAGES
+                if stage in recorder.elapsed
+            ]
+    return results
+
+
+def stage_result(recorder: StagesRecorder, stage: str, games_count: int, transform: str) -> dict:
+    elapsed = recorder.elapsed[stage]
+    return {
+        "games": games_count,
+        "transform": transform,
+        "stage": stage,
+        "seconds": round(elapsed, 4),
+        "games_per_sec": round(games_count / elapsed) if elapsed else None,
+        "rss_growth_mib": round(recorder.rss_growth[stage] / 2**20, 1),
+    }
+
+
+def result_key(result: dict) -> tuple:
+    return result["games"], result["transform"], result["stage"]
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    """Prints every stage next to the baseline, returns descriptions of the regressions"""
+    baseline_by_key = {result_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = baseline_by_key.get(result_key(result))
+        if before is None or not before["games_per_sec"] or not result["games_per_sec"]:
+            continue
+        speed_change = result["games_per_sec"] / before["games_per_sec"] - 1
+        name = f"{result['games']:>9,} {result['transform']:>8} {result['stage']:>13}"
+        # baselines saved before RSS growth was measured have the absolute peak RSS of the process only
+        if "rss_growth_mib" not in before:
+            print(f"{name}: games/sec {speed_change:+7.1%}, RSS growth not in the baseline")
+        else:
+            rss_change = (result["rss_growth_mib"] - before["rss_growth_mib"]) / max(
+                before["rss_growth_mib"], RSS_GROWTH_FLOOR_MIB
+            )
+            print(f"{name}: games/sec {speed_change:+7.1%}, RSS growth {rss_change:+7.1%}")
+            if rss_change > tolerance:
+                regressions.append(f"{name}: {rss_change:+.1%} RSS growth")
+        if speed_change < -tolerance:
+            regressions.append(f"{name}: {speed_change:+.1%} games/sec")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        output = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark suite of the export pipeline stages")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated numbers of games")
+    parser.add_argument("--transforms", default=",".join(TRANSFORMS), help="Comma-separated transforms to run")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="Comma-separated output formats to write")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Games transformed and written at once")
+    parser.add_argument("--throttle-every", type=int, default=None, help="Fake server replies 429 to every N-th request")
+    parser.add_argument("--output", default="bench_results.json", help="File to save the results into (JSON)")
+    parser.add_argument("--baseline", default=None, help="Results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Relative change reported as a regression")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPU(s), Python {platform.python_version()}, commit {git_commit()}")
+    results = []
+    for games in map(int, args.sizes.split(",")):
+        results += run_size(games, args)
+
+    print(f"{'games':>9} {'transform':>8} {'stage':>13} {'games/sec':>12} {'RSS growth':>10}")
+    for result in results:
+        print(
+            f"{result['games']:>9,} {result['transform']:>8} {result['stage']:>13} "
+            f"{result['games_per_sec'] or 0:>12,} {result['rss_growth_mib']:>7,.1f} MiB"
+        )
+
+    run = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "batch_size": args.batch_size,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as output_file:
+        json.dump(run, output_file, indent=2)
+    print(f"Results saved to '{args.output}'")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        print(f"Compared with '{args.baseline}' (commit {baseline.get('commit')}, {baseline.get('created')}):")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"Regressions over {args.tolerance:.0%}:")
+            print("\n".join(regressions))
+            exit(1)
+        print("No regressions")
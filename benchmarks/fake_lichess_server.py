@@ -0,0 +1,231 @@
+"""
+Local stand-in for the Lichess games API, serving synthetic games (see synthetic_data.py).
+
+Supports GET api/games/user/{username} with since/until/max/sort/moves/clocks, PGN or NDJSON
+(Accept: application/x-ndjson), POST api/games/export/_ids (NDJSON with moves, clocks and evals
+of games already served to some user), and can inject failures:
+    throttle_every - every N-th request gets 429 Too Many Requests
+    disconnect_after - response stream is cut after N games (for the first disconnect_count requests;
+                       POST responses are cut in half)
+
+Usage (from the repository root):
+    python -m benchmarks.fake_lichess_server --port 8765 --games 10000 --throttle-every 5
+    LICHESS_BASE_URL=http://127.0.0.1:8765/ python export_games.py --username benchmark_player ...
+"""
+
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qsl, urlparse
+
+from benchmarks.synthetic_data import game_to_json, game_to_json_with_moves, game_to_pgn, generate_games
+
+
+# ids per request accepted by POST api/games/export/_ids
+EXPORT_BY_IDS_MAX_IDS = 300
+
+
+class FakeLichessServer:
+    def __init__(
+        self,
+        games_per_user: int = 1000,
+        port: int = 0,
+        throttle_every: Optional[int] = None,
+        retry_after: int = 1,
+        disconnect_after: Optional[int] = None,
+        disconnect_count: int = 1,
+    ):
+        self.games_per_user = games_per_user
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.disconnect_after = disconnect_after
+        self.disconnect_count = disconnect_count
+
+        self.games_by_user: dict[str, list[dict]] = {}
+        self.games_by_id: dict[str, dict] = {}
+        self.exported_by_ids_count = 0
+        self.requests_count = 0
+        self.throttled_count = 0
+        self.disconnected_count = 0
+        self.lock = threading.Lock()
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}/"
+
+    def user_games(self, username: str) -> list[dict]:
+        with self.lock:
+            if username not in self.games_by_user:
+                seed = sum(map(ord, username))
+                games = list(generate_games(self.games_per_user, player=username, seed=seed))
+                for game in games:
+                    self.games_by_id[game["id"]] = game
+                # games of users generated before against this one are this user's games too
+                # (e.g. exporting benchmark_player and then one of its opponents)
+                shared = [
+                    game
+                    for game in self.games_by_id.values()
+                    if username in (game["players"]["white"]["name"], game["players"]["black"]["name"])
+                ]
+                self.games_by_user[username] = sorted(shared, key=lambda game: game["createdAt"])
+            return self.games_by_user[username]
+
+    def select_games(self, username: str, query: dict) -> list[dict]:
+        def int_param(name: str, default: int) -> int:
+            value = query.get(name)
+            return int(value) if value not in (None, "", "None") else default
+
+        since, until = int_param("since", 0), int_param("until", 2**63)
+        games = [game for game in self.user_games(username) if since <= game["createdAt"] <= until]
+        if query.get("sort") != "dateAsc":
+            games.reverse()
+        return games[: int_param("max", len(games))]
+
+    def _next_request_fault(self) -> Optional[str]:
+        with self.lock:
+            self.requests_count += 1
+            if self.throttle_every and self.requests_count % self.throttle_every == 0:
+                self.throttled_count += 1
+                return "throttle"
+            if self.disconnect_after is not None and self.disconnected_count < self.disconnect_count:
+                self.disconnected_count += 1
+                return "disconnect"
+            return None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                path = url.path.strip("/").split("/")
+                if path[:3] != ["api", "games", "user"] or len(path) != 4:
+                    self.send_error(404)
+                    return
+
+                fault = server._next_request_fault()
+                if fault == "throttle":
+                    self.send_response(429)
+                    self.send_header("Retry-After", str(server.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                query = dict(parse_qsl(url.query))
+                games = server.select_games(path[3], query)
+                # like Lichess: moves are included unless moves=false, clocks only with clocks=true
+                moves, clocks = query.get("moves") != "False", query.get("clocks") == "True"
+                ndjson = "application/x-ndjson" in self.headers.get("Accept", "")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson" if ndjson else "application/x-chess-pgn")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                for games_sent, game in enumerate(games):
+                    text = json.dumps(game_to_json(game)) + "\n" if ndjson else game_to_pgn(game, moves, clocks)
+                    if fault == "disconnect" and games_sent == server.disconnect_after:
+                        # half of the next game, then the connection drops without the closing chunk
+                        self._write_chunk(text[: len(text) // 2].encode())
+                        self.close_connection = True
+                        return
+                    self._write_chunk(text.encode())
+                self._write_chunk(b"")
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                if url.path.strip("/") != "api/games/export/_ids":
+                    self.send_error(404)
+                    return
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+
+                fault = server._next_request_fault()
+                if fault == "throttle":
+                    self.send_response(429)
+                    self.send_header("Retry-After", str(server.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                game_ids = [game_id.strip() for game_id in body.split(",") if game_id.strip()]
+                if len(game_ids) > EXPORT_BY_IDS_MAX_IDS:
+                    self.send_error(400, f"At most {EXPORT_BY_IDS_MAX_IDS} ids")
+                    return
+
+                query = dict(parse_qsl(url.query))
+                with server.lock:
+                    # unknown ids are skipped, like by Lichess
+                    games = [server.games_by_id[game_id] for game_id in game_ids if game_id in server.games_by_id]
+                    server.exported_by_ids_count += len(games)
+                text = "".join(
+                    json.dumps(
+                        game_to_json_with_moves(
+                            game, clocks=query.get("clocks") != "False", evals=query.get("evals") != "False"
+                        )
+                    )
+                    + "\n"
+                    for game in games
+                ).encode()
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Content-Length", str(len(text)))
+                self.end_headers()
+                if fault == "disconnect":
+                    # half of the body, then the connection drops
+                    self.wfile.write(text[: len(text) // 2])
+                    self.close_connection = True
+                    return
+                self.wfile.write(text)
+
+            def _write_chunk(self, data: bytes) -> None:
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FakeLichessServer":
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Lichess games API with synthetic data")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--games", type=int, default=1000, help="Number of games per user")
+    parser.add_argument("--throttle-every", type=int, default=None, help="Reply 429 to every N-th request")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After of 429 responses (seconds)")
+    parser.add_argument("--disconnect-after", type=int, default=None, help="Cut response stream after N games")
+    parser.add_argument("--disconnect-count", type=int, default=1, help="Number of requests to cut")
+    args = parser.parse_args()
+
+    server = FakeLichessServer(
+        games_per_user=args.games,
+        port=args.port,
+        throttle_every=args.throttle_every,
+        retry_after=args.retry_after,
+        disconnect_after=args.disconnect_after,
+        disconnect_count=args.disconnect_count,
+    )
+    print(f"Serving fake Lichess API at {server.base_url}")
+    server.httpd.serve_forever()
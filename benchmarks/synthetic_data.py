@@ -0,0 +1,329 @@
+"""
+Synthetic Lichess-like game data for benchmarks.
+
+Games are generated as plain dicts (close to the shape of the Lichess JSON API)
+and rendered into the PGN or NDJSON format returned by api/games/user/{username}.
+"""
+
+import json
+import random
+from datetime import datetime, timezone
+from typing import Iterator
+
+PLAYER = "benchmark_player"
+
+# (initial seconds, increment seconds, lichess speed)
+TIME_CONTROLS = [
+    (15, 0, "ultraBullet"),
+    (30, 0, "bullet"),
+    (60, 0, "bullet"),
+    (60, 1, "bullet"),
+    (120, 1, "bullet"),
+    (180, 0, "blitz"),
+    (180, 2, "blitz"),
+    (300, 0, "blitz"),
+    (300, 3, "blitz"),
+    (600, 0, "rapid"),
+    (600, 5, "rapid"),
+    (900, 10, "rapid"),
+    (1800, 0, "classical"),
+    (1800, 20, "classical"),
+]
+
+OPENINGS = [
+    ("B90", "Sicilian Defense: Najdorf Variation, English Attack"),
+    ("B20", "Sicilian Defense"),
+    ("B01", "Scandinavian Defense: Mieses-Kotroc Variation"),
+    ("C00", "French Defense: Knight Variation"),
+    ("C02", "French Defense: Advance Variation, Paulsen Attack"),
+    ("B12", "Caro-Kann Defense: Advance Variation, Botvinnik-Carls Defense"),
+    ("C50", "Italian Game: Giuoco Pianissimo, Normal"),
+    ("C42", "Russian Game: Stafford Gambit"),
+    ("D02", "Queen's Pawn Game: London System"),
+    ("D37", "Queen's Gambit Declined: Harrwitz Attack, Main Line"),
+    ("A00", "Van't Kruijs Opening"),
+    ("A40", "Englund Gambit Complex: Hartlaub-Charlick Gambit"),
+    ("E60", "King's Indian Defense: Normal Variation, King's Knight Variation"),
+    ("C44", "Scotch Game"),
+]
+
+TITLES = [None] * 40 + ["GM", "IM", "FM", "CM", "NM", "WGM", "LM", "BOT"]
+
+# lichess game status -> weight
+STATUSES = [("resign", 45), ("mate", 20), ("outoftime", 25), ("draw", 6), ("stalemate", 1), ("timeout", 3)]
+
+TERMINATIONS = {
+    "resign": "Normal",
+    "mate": "Normal",
+    "draw": "Normal",
+    "stalemate": "Normal",
+    "outoftime": "Time forfeit",
+    "timeout": "Time forfeit",
+}
+
+SPEED_NAMES = {
+    "ultraBullet": "UltraBullet",
+    "bullet": "Bullet",
+    "blitz": "Blitz",
+    "rapid": "Rapid",
+    "classical": "Classical",
+}
+
+GAME_ID_ALPHABET = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789"
+
+# 2024-01-01 00:00:00 UTC
+START_TIMESTAMP_MSEC = 1704067200000
+
+
+def generate_games(
+    count: int,
+    player: str = PLAYER,
+    start_msec: int = START_TIMESTAMP_MSEC,
+    seed: int = 42,
+) -> Iterator[dict]:
+    """Yields count games of the player in chronological order"""
+    rnd = random.Random(seed)
+    statuses, status_weights = zip(*STATUSES)
+    created_at = start_msec
+    rating = 1500
+
+    for _ in range(count):
+        created_at += rnd.randint(30_000, 1_800_000)
+        initial, increment, speed = rnd.choice(TIME_CONTROLS)
+        # games from a position (or too short to be classified) have no known opening
+        opening = None if rnd.random() < 0.02 else dict(zip(("eco", "name"), rnd.choice(OPENINGS)))
+        status = rnd.choices(statuses, status_weights)[0]
+
+        opponent_title = rnd.choice(TITLES)
+        opponent = {
+            "name": f"opponent_{rnd.randint(1, 5000)}",
+            "rating": max(600, rating + rnd.randint(-300, 300)),
+            "title": opponent_title,
+        }
+        me = {"name": player, "rating": rating, "title": None}
+
+        if status in ("draw", "stalemate"):
+            winner = None
+        else:
+            winner = rnd.choice(["white", "black"])
+
+        player_is_white = rnd.random() < 0.5
+        white, black = (me, opponent) if player_is_white else (opponent, me)
+
+        diff = rnd.randint(3, 12)
+        if winner is None:
+            white["ratingDiff"], black["ratingDiff"] = rnd.randint(-2, 2), rnd.randint(-2, 2)
+        elif winner == "white":
+            white["ratingDiff"], black["ratingDiff"] = diff, -diff
+        else:
+            white["ratingDiff"], black["ratingDiff"] = -diff, diff
+        rating += me["ratingDiff"]
+
+        # rated games with missing rating diff happen (e.g. provisional ratings)
+        if rnd.random() < 0.01:
+            white.pop("ratingDiff")
+            black.pop("ratingDiff")
+
+        yield {
+            "id": "".join(rnd.choices(GAME_ID_ALPHABET, k=8)),
+            "rated": True,
+            "variant": "standard",
+            "speed": speed,
+            "perf": speed,
+            "createdAt": created_at,
+            "status": status,
+            "players": {"white": white, "black": black},
+            "winner": winner,
+            "opening": opening,
+            "clock": {"initial": initial, "increment": increment},
+        }
+
+
+def game_to_pgn(game: dict, moves: bool = False, clocks: bool = True) -> str:
+    """Renders a generated game the way Lichess exports it with opening=True (and moves, clocks as requested)"""
+    created = datetime.fromtimestamp(game["createdAt"] / 1000, tz=timezone.utc)
+    white, black = game["players"]["white"], game["players"]["black"]
+    if game["winner"] == "white":
+        result = "1-0"
+    elif game["winner"] == "black":
+        result = "0-1"
+    else:
+        result = "1/2-1/2"
+
+    tags = [
+        ("Event", f"{'Rated' if game['rated'] else 'Casual'} {SPEED_NAMES[game['speed']]} game"),
+        ("Site", f"https://lichess.org/{game['id']}"),
+        ("Date", created.strftime("%Y.%m.%d")),
+        ("Round", "-"),
+        ("White", white["name"]),
+        ("Black", black["name"]),
+        ("Result", result),
+        ("GameId", game["id"]),
+        ("UTCDate", created.strftime("%Y.%m.%d")),
+        ("UTCTime", created.strftime("%H:%M:%S")),
+        ("WhiteElo", str(white["rating"])),
+        ("BlackElo", str(black["rating"])),
+    ]
+    if "ratingDiff" in white:
+        tags.append(("WhiteRatingDiff", f"{white['ratingDiff']:+d}"))
+        tags.append(("BlackRatingDiff", f"{black['ratingDiff']:+d}"))
+    if white["title"]:
+        tags.append(("WhiteTitle", white["title"]))
+    if black["title"]:
+        tags.append(("BlackTitle", black["title"]))
+    tags += [
+        ("Variant", "Standard"),
+        ("TimeControl", f"{game['clock']['initial']}+{game['clock']['increment']}"),
+        ("ECO", game["opening"]["eco"] if game["opening"] else "?"),
+        ("Opening", game["opening"]["name"] if game["opening"] else "?"),
+        ("Termination", TERMINATIONS[game["status"]]),
+    ]
+
+    header = "".join(f'[{name} "{value}"]\n' for name, value in tags)
+    if moves:
+        return f"{header}\n{movetext(game, clocks)} {result}\n\n\n"
+    return f"{header}\n{result}\n\n\n"
+
+
+def generate_pgn(count: int, player: str = PLAYER, seed: int = 42) -> str:
+    return "".join(game_to_pgn(game) for game in generate_games(count, player, seed=seed))
+
+
+def game_to_json(game: dict) -> dict:
+    """Renders a generated game the way Lichess exports it as NDJSON with opening=True"""
+
+    def player_to_json(player: dict) -> dict:
+        user = {"name": player["name"], "id": player["name"].lower()}
+        if player["title"]:
+            user["title"] = player["title"]
+        output = {"user": user, "rating": player["rating"]}
+        if "ratingDiff" in player:
+            output["ratingDiff"] = player["ratingDiff"]
+        return output
+
+    output = {
+        "id": game["id"],
+        "rated": game["rated"],
+        "variant": game["variant"],
+        "speed": game["speed"],
+        "perf": game["perf"],
+        "createdAt": game["createdAt"],
+        "lastMoveAt": game["createdAt"] + 60_000,
+        "status": game["status"],
+        "players": {
+            "white": player_to_json(game["players"]["white"]),
+            "black": player_to_json(game["players"]["black"]),
+        },
+        "clock": {
+            "initial": game["clock"]["initial"],
+            "increment": game["clock"]["increment"],
+            "totalTime": game["clock"]["initial"] + 40 * game["clock"]["increment"],
+        },
+    }
+    if game["opening"]:
+        output["opening"] = {"eco": game["opening"]["eco"], "name": game["opening"]["name"], "ply": 6}
+    if game["winner"]:
+        output["winner"] = game["winner"]
+    return output
+
+
+def game_to_json_with_moves(game: dict, clocks: bool = True, evals: bool = True) -> dict:
+    """Renders a generated game like game_to_json, with moves (and clocks, server analysis) as requested"""
+    output = game_to_json(game)
+    plies = generate_moves(game)
+    output["moves"] = " ".join(move for move, _ in plies)
+    if clocks:
+        output["clocks"] = [clock * 100 for _, clock in plies]  # centiseconds
+    analysis = generate_analysis(game, len(plies)) if evals else None
+    if analysis is not None:
+        output["analysis"] = analysis
+    return output
+
+
+def generate_ndjson(count: int, player: str = PLAYER, seed: int = 42) -> str:
+    return "".join(
+        json.dumps(game_to_json(game)) + "\n" for game in generate_games(count, player, seed=seed)
+    )
+
+
+# legal openings (Ruy Lopez Breyer, Sicilian Najdorf, Queen's Gambit Declined, King's Indian)
+# ending with both kings castled short, after which the kings shuffle between the corners
+OPENING_LINES = [
+    "e4 e5 Nf3 Nc6 Bb5 a6 Ba4 Nf6 O-O Be7 Re1 b5 Bb3 d6 c3 O-O h3 Nb8 d4 Nbd7".split(),
+    "e4 c5 Nf3 d6 d4 cxd4 Nxd4 Nf6 Nc3 a6 Be2 e5 Nb3 Be7 O-O O-O Be3 Be6 Qd2 Nbd7".split(),
+    "d4 d5 c4 e6 Nc3 Nf6 Bg5 Be7 e3 O-O Nf3 h6 Bh4 b6 Be2 Bb7 O-O Nbd7 Rc1 c5".split(),
+    "d4 Nf6 c4 g6 Nc3 Bg7 e4 d6 Nf3 O-O Be2 e5 O-O Nc6 d5 Ne7 Ne1 Nd7 Nd3 f5".split(),
+]
+SHUFFLE_PLIES = "Kh1 Kh8 Kg1 Kg8".split()
+
+DUMP_SKIPPED_TAGS = ("[Date ", "[Round ", "[GameId ", "[Variant ")
+
+
+def generate_moves(game: dict) -> list[tuple[str, int]]:
+    """
+    (SAN, clock left after the move in seconds) of every ply of a generated game: legal moves,
+    10 to 60 moves long, with about a tenth of the games ending in time trouble
+    """
+    rnd = random.Random(game["id"])
+    initial, increment = game["clock"]["initial"], game["clock"]["increment"]
+    opening = rnd.choice(OPENING_LINES)
+    plies_count = rnd.randint(20, 120)
+    # share of the initial time spent over the game
+    time_used = rnd.uniform(0.95, 1.0) if rnd.random() < 0.1 else rnd.uniform(0.2, 0.8)
+
+    clocks = [initial, initial]
+    plies = []
+    for ply in range(plies_count):
+        if ply < len(opening):
+            move = opening[ply]
+        else:
+            move = SHUFFLE_PLIES[(ply - len(opening)) % len(SHUFFLE_PLIES)]
+        spent = initial * time_used / (plies_count / 2) * rnd.uniform(0.5, 1.5)
+        clocks[ply % 2] = max(0.0, clocks[ply % 2] - spent + increment)
+        plies.append((move, int(clocks[ply % 2])))
+    return plies
+
+
+def movetext(game: dict, clocks: bool = True) -> str:
+    """Movetext of a generated game as in Lichess PGN exports, with [%clk] comments"""
+    tokens = []
+    for ply, (move, clock) in enumerate(generate_moves(game)):
+        tokens.append(f"{ply // 2 + 1}." if ply % 2 == 0 else f"{ply // 2 + 1}...")
+        tokens.append(move)
+        if clocks:
+            tokens.append(f"{{ [%clk {clock // 3600}:{clock // 60 % 60:02d}:{clock % 60:02d}] }}")
+    return " ".join(tokens)
+
+
+def generate_analysis(game: dict, plies_count: int) -> list[dict] | None:
+    """Lichess server analysis of a generated game (evals per ply) - for about half of the games"""
+    rnd = random.Random(game["id"])
+    if rnd.random() < 0.5:
+        return None
+    analysis, evaluation = [], 20
+    for _ in range(plies_count - 1):
+        evaluation += rnd.randint(-60, 60)
+        analysis.append({"eval": evaluation})
+    analysis.append({"mate": rnd.choice([1, -1, 2])} if rnd.random() < 0.3 else {"eval": evaluation})
+    return analysis
+
+
+def game_to_dump_pgn(game: dict) -> str:
+    """
+    Renders a generated game the way Lichess monthly database dumps have it: no Date/Round/GameId/Variant
+    tags (standard games) and movetext with clock comments
+    """
+    lines = game_to_pgn(game, moves=True).rstrip("\n").splitlines()
+    return "\n".join(line for line in lines if not line.startswith(DUMP_SKIPPED_TAGS)) + "\n\n"
+
+
+def generate_dump(count: int, players: int, games_per_player_block: int = 1000) -> Iterator[str]:
+    """
+    Yields count games of a dump with `players` distinct players (player_0, player_1, ...),
+    in blocks of games of one player against random opponents
+    """
+    for block in range(0, count, games_per_player_block):
+        player = f"player_{block // games_per_player_block % players}"
+        block_size = min(games_per_player_block, count - block)
+        for game in generate_games(block_size, player, seed=block):
+            yield game_to_dump_pgn(game)
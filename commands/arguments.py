@@ -0,0 +1,670 @@
+# Arguments of all commands. Only light modules are imported here - pyarrow, duckdb and
+# python-chess are loaded by the command chosen, after its arguments are parsed (see export_games.py)
+
+import argparse
+import os
+from typing import Callable, Optional
+
+from helpers.imports_helper import lazy_import
+from helpers.options_helper import (
+    DEFAULT_CACHE_MAX_SIZE,
+    DEFAULT_MAX_PLY,
+    DEFAULT_QUEUE_SIZE,
+    EXPORT_BY_IDS_MAX_IDS,
+    OUTPUT_FORMATS,
+    PARQUET_COMPRESSION,
+    PARQUET_COMPRESSIONS,
+    PARQUET_ROW_GROUP_SIZE,
+    PROGRESS_INTERVAL,
+    SERVE_MAX_MEMORY,
+    SERVE_PORT,
+    STATS_REPORT_NAMES,
+    APIFormat,
+    ChessPerfType,
+    PGNParserMode,
+)
+
+dotenv = lazy_import("dotenv")
+
+
+class Transform:
+    ROWS = "rows"  # dataclass per game (reference implementation)
+    COLUMNAR = "columnar"  # Arrow compute over whole batches, see ColumnarHelper
+
+    ALL = [ROWS, COLUMNAR]
+
+
+def lichess_settings() -> tuple[Optional[str], Optional[str]]:
+    """Lichess API token and base url - another server with the same API, e.g. benchmarks/fake_lichess_server.py"""
+    dotenv.load_dotenv()
+    return os.environ.get("LICHESS_TOKEN"), os.environ.get("LICHESS_BASE_URL")
+
+
+def read_usernames(args: argparse.Namespace) -> list[str]:
+    """Users to export from --username (comma-separated) and --usernames-file"""
+    usernames = []
+    if args.username:
+        usernames += [username.strip() for username in args.username.split(",")]
+    if args.usernames_file:
+        with open(args.usernames_file, encoding="utf-8") as usernames_file:
+            usernames += [line.strip() for line in usernames_file]
+
+    # drop empty lines and duplicates, keeping the order
+    return list(dict.fromkeys(username for username in usernames if username))
+
+
+def check_export_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    """Checks of the export arguments which don't need the export itself (no heavy imports)"""
+    lichess_api_token, _ = lichess_settings()
+    if not lichess_api_token and not args.offline:
+        parser.error("LICHESS_TOKEN is not set - see .env_default")
+    if args.offline and not args.cache_dir:
+        parser.error("--offline requires --cache-dir")
+    if args.archive and (args.api_format != APIFormat.PGN.value or args.combined):
+        parser.error("--archive is supported for the pgn API format and per-user output files only")
+    if not read_usernames(args):
+        parser.error("at least one user is required: use --username or --usernames-file")
+    if args.transform == Transform.COLUMNAR and args.api_format != APIFormat.PGN.value:
+        parser.error("--transform columnar is supported for the pgn API format only")
+    if args.combined and args.incremental:
+        parser.error("--incremental is supported for per-user output files only")
+    if args.store and (args.combined or args.archive):
+        parser.error("--store can't be combined with --combined or --archive")
+    if args.with_moves and args.api_format != APIFormat.PGN.value:
+        parser.error("--with-moves is supported for the pgn API format only")
+    for option in ["shards", "concurrency", "users_concurrency"]:
+        if getattr(args, option) < 1:
+            parser.error(f"--{option.replace('_', '-')} must be at least 1")
+
+
+# Options shared by several commands, added to their parsers as argparse parents
+
+
+def users_arguments() -> argparse.ArgumentParser:
+    """Users whose games are exported (see read_usernames)"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--username",
+        required=False,
+        help="Lichess user whose games are exported (comma-separated list for several users)",
+    )
+    parser.add_argument(
+        "--usernames-file",
+        required=False,
+        default=None,
+        help="File with Lichess users whose games are exported, one username per line",
+    )
+    parser.add_argument(
+        "--perf-type",
+        required=False,
+        default=None,
+        help=f"Comma-separated games type to export. Valid values: {', '.join(variant.value for variant in ChessPerfType)}",
+    )
+    return parser
+
+
+def output_arguments(
+    default_format: str = "csv", folder_help: str = "Output folder name"
+) -> argparse.ArgumentParser:
+    """Format and folder of written outputs"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--format",
+        required=False,
+        help="Output format: csv, parquet, dataset (directory of parquet files partitioned "
+        "by Player/Year/Month/TimeControlType) or duckdb (database file, games are upserted "
+        "into the games table)",
+        default=default_format,
+        choices=OUTPUT_FORMATS,
+    )
+    parser.add_argument(
+        "--folder",
+        required=False,
+        help=folder_help,
+        default="output",
+    )
+    return parser
+
+
+def parquet_arguments() -> argparse.ArgumentParser:
+    """Layout of parquet/dataset outputs"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--row-group-size",
+        required=False,
+        default=PARQUET_ROW_GROUP_SIZE,
+        type=int,
+        help="Parquet/dataset output: number of games per row group",
+    )
+    parser.add_argument(
+        "--compression",
+        required=False,
+        default=PARQUET_COMPRESSION,
+        choices=PARQUET_COMPRESSIONS,
+        help="Parquet/dataset output: compression codec of the columns",
+    )
+    return parser
+
+
+def exported_output_arguments() -> argparse.ArgumentParser:
+    """Exported output read by the command"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--file",
+        required=True,
+        help="Exported output, e.g. output/masslove.parquet",
+    )
+    parser.add_argument(
+        "--format",
+        required=False,
+        default=None,
+        choices=OUTPUT_FORMATS,
+        help="Format of the output (by default - from the file extension)",
+    )
+    return parser
+
+
+def api_arguments() -> argparse.ArgumentParser:
+    """Requests to Lichess API: rate limit and retries"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--requests-per-second",
+        required=False,
+        default=1.0,
+        type=float,
+        help="Maximum rate of requests to Lichess API, shared by all the command's downloads",
+    )
+    parser.add_argument(
+        "--max-retries",
+        required=False,
+        default=5,
+        type=int,
+        help="Retries of a failed request or a broken download (with exponential backoff, "
+        "a minute of cool-down after 429 Too Many Requests); 0 - fail on the first error",
+    )
+    return parser
+
+
+def transform_arguments() -> argparse.ArgumentParser:
+    """Format of games requested from the API and how they are standardized"""
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument(
+        "--api-format",
+        required=False,
+        default=APIFormat.PGN.value,
+        choices=[api_format.value for api_format in APIFormat],
+        help="Format of games requested from Lichess API: pgn or ndjson (JSON per game, no PGN parsing)",
+    )
+    parser.add_argument(
+        "--transform",
+        required=False,
+        default=Transform.ROWS,
+        choices=Transform.ALL,
+        help="How games are standardized: rows (game by game) or columnar (whole batches at once, "
+        "faster; pgn API format only)",
+    )
+    return parser
+
+
+def export_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="export_games.py [export]",
+        description="Export games of Lichess users from the API into an output file (the default command)",
+        epilog=f"other commands (export_games.py <command> -h for their options): {', '.join(list(COMMANDS)[1:])}",
+        parents=[users_arguments(), output_arguments(), transform_arguments(), parquet_arguments(), api_arguments()],
+    )
+    parser.add_argument(
+        "--filename",
+        required=False,
+        help="Output file name (for several users: name of the combined output file)",
+        default=None,
+    )
+    parser.add_argument(
+        "--max-games",
+        required=False,
+        default=None,
+        type=int,
+        help="Maximum number of games to export",
+    )
+    parser.add_argument(
+        "--start-date",
+        required=True,
+        help="Start date in YYYY-MM-DD format",
+    )
+    parser.add_argument(
+        "--end-date",
+        required=True,
+        help="End date in YYYY-MM-DD format",
+    )
+    parser.add_argument(
+        "--pgn-parser",
+        required=False,
+        default=PGNParserMode.FAST,
+        choices=PGNParserMode.ALL,
+        help="PGN headers parser: fast (header-only tokenizer), chess (python-chess read_game) "
+        "or verify (both, failing on any difference); also used for movetext with --with-moves",
+    )
+    parser.add_argument(
+        "--with-moves",
+        required=False,
+        action="store_true",
+        help="Download moves with clocks and add game length and clock usage columns (PlyCount, "
+        "PlayerTimeLeft, PlayerAvgMoveTime, PlayerMovesUnder10s, ...); pgn API format only",
+    )
+    parser.add_argument(
+        "--moves-workers",
+        required=False,
+        default=os.cpu_count(),
+        type=int,
+        help="Number of processes analyzing movetext with --with-moves (1 - in the transform threads)",
+    )
+    parser.add_argument(
+        "--incremental",
+        required=False,
+        action="store_true",
+        help="Only download games newer than the ones already in the output file and append them. "
+        "Progress is kept in <output file>.state.json",
+    )
+    parser.add_argument(
+        "--shards",
+        required=False,
+        default=1,
+        type=int,
+        help="Split the period into this many time windows downloaded in parallel (1 - single request)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        required=False,
+        default=2,
+        type=int,
+        help="Maximum number of time windows downloaded at the same time (used with --shards)",
+    )
+    parser.add_argument(
+        "--combined",
+        required=False,
+        action="store_true",
+        help="Several users: write all games into one output file (see Player column) "
+        "instead of a file per user",
+    )
+    parser.add_argument(
+        "--store",
+        required=False,
+        default=None,
+        help="Several users (e.g. a club): store every game once, in canonical White/Black form, "
+        "in this game store folder instead of writing outputs - see the store command",
+    )
+    parser.add_argument(
+        "--users-concurrency",
+        required=False,
+        default=2,
+        type=int,
+        help="Several users: number of users exported at the same time",
+    )
+    parser.add_argument(
+        "--batch-size",
+        required=False,
+        default=5000,
+        type=int,
+        help="Number of games transformed and written to the output file at once",
+    )
+    parser.add_argument(
+        "--transform-workers",
+        required=False,
+        default=2,
+        type=int,
+        help="Number of threads transforming batches of games (per user) while next batches are "
+        "downloaded and previous ones are written",
+    )
+    parser.add_argument(
+        "--queue-size",
+        required=False,
+        default=DEFAULT_QUEUE_SIZE,
+        type=int,
+        help="Number of downloaded chunks / parsed batches buffered between pipeline stages",
+    )
+    parser.add_argument(
+        "--archive",
+        required=False,
+        action="store_true",
+        help="Keep raw PGN of downloaded games in <output file>.pgn.gz (with an index), "
+        "so the output can be re-derived with the reprocess command without downloading",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        required=False,
+        default=None,
+        help="Folder to cache raw API responses for periods entirely in the past in "
+        "(they never change, so re-runs don't download them again)",
+    )
+    parser.add_argument(
+        "--cache-max-size",
+        required=False,
+        default=DEFAULT_CACHE_MAX_SIZE // 2**20,
+        type=int,
+        help="Maximum size of the response cache (MiB), least recently used responses are evicted",
+    )
+    parser.add_argument(
+        "--offline",
+        required=False,
+        action="store_true",
+        help="Don't download anything, serve the export from the response cache only (see --cache-dir)",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        required=False,
+        default=PROGRESS_INTERVAL,
+        type=float,
+        help="Seconds between progress lines (games exported, games/sec, ETA)",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        required=False,
+        default=None,
+        help="File to keep the export metrics in as JSON (progress, per-stage wall/CPU time, requests, "
+        "retries, throttle waits, bytes received), updated with every progress line",
+    )
+    parser.add_argument(
+        "--profile",
+        required=False,
+        default=None,
+        help="Profile the export (all pipeline threads) with cProfile, save the statistics into this "
+        "file (see python -m pstats) and print the hottest functions",
+    )
+    return parser
+
+
+def stats_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="export_games.py stats",
+        description="Print stats of exported games from the aggregate cube kept next to the output",
+        parents=[exported_output_arguments()],
+    )
+    parser.add_argument(
+        "--report",
+        required=False,
+        default=None,
+        choices=STATS_REPORT_NAMES,
+        help="Report to print (by default - all of them)",
+    )
+    parser.add_argument(
+        "--check",
+        required=False,
+        action="store_true",
+        help="Recompute the aggregates from all exported games and compare them with the cube",
+    )
+    return parser
+
+
+def reprocess_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="export_games.py reprocess",
+        description="Re-run standardization and personification over a raw PGN archive (see --archive)",
+    )
+    parser.add_argument(
+        "--archive",
+        required=True,
+        help="Raw PGN archive kept by export with --archive, e.g. output/masslove.parquet.pgn.gz",
+    )
+    parser.add_argument(
+        "--output",
+        required=False,
+        default=None,
+        help="Output to (re)create, e.g. output/masslove.parquet; its extension is the output format",
+    )
+    parser.add_argument(
+        "--workers",
+        required=False,
+        default=os.cpu_count(),
+        type=int,
+        help="Number of worker processes, each processes its own range of archive frames",
+    )
+    parser.add_argument(
+        "--pgn-parser",
+        required=False,
+        default=PGNParserMode.FAST,
+        choices=PGNParserMode.ALL,
+        help="PGN headers parser, see export",
+    )
+    parser.add_argument(
+        "--game-id",
+        required=False,
+        default=None,
+        help="Print raw PGN of a single archived game instead of reprocessing",
+    )
+    return parser
+
+
+def dump_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="export_games.py dump",
+        description="Export games of the users from a monthly Lichess database dump "
+        "(https://database.lichess.org/, .pgn.zst or plain .pgn) into one combined output",
+        parents=[users_arguments(), output_arguments(), parquet_arguments()],
+    )
+    parser.add_argument(
+        "--file",
+        required=True,
+        help="Database dump, e.g. lichess_db_standard_rated_2024-01.pgn.zst",
+    )
+    parser.add_argument(
+        "--filename",
+        required=False,
+        default="games",
+        help="Output file name (without extension)",
+    )
+    parser.add_argument(
+        "--workers",
+        required=False,
+        default=os.cpu_count(),
+        type=int,
+        help="Number of worker processes parsing chunks of the dump (1 - parse in the main process)",
+    )
+    return parser
+
+
+def backfill_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="export_games.py backfill",
+        description="Fetch moves, clocks and server analysis of already exported games by their ids "
+        "(POST api/games/export/_ids) and store them keyed by game id next to the output",
+        parents=[exported_output_arguments(), api_arguments()],
+    )
+    parser.add_argument(
+        "--where",
+        required=False,
+        default=None,
+        help="Only games matching this SQL condition over the output columns, "
+        "e.g. \"OpeningFamily = 'Sicilian Defense' AND ResultLose = 1\"",
+    )
+    parser.add_argument(
+        "--ids-file",
+        required=False,
+        default=None,
+        help="File with ids of the games (e.g. a query result), one per line, instead of --where",
+    )
+    parser.add_argument(
+        "--refresh",
+        required=False,
+        action="store_true",
+        help="Fetch games which have been backfilled before again",
+    )
+    parser.add_argument(
+        "--batch-size",
+        required=False,
+        default=EXPORT_BY_IDS_MAX_IDS,
+        type=int,
+        help=f"Games per request (at most {EXPORT_BY_IDS_MAX_IDS})",
+    )
+    parser.add_argument(
+        "--concurrency",
+        required=False,
+        default=2,
+        type=int,
+        help="Maximum number of requests at the same time",
+    )
+    return parser
+
+
+def positions_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="export_games.py positions",
+        description="Player's results after an exact position (any move order), from the position index "
+        "of games with known moves (backfilled, or exported with --with-moves --archive)",
+        parents=[exported_output_arguments()],
+    )
+    parser.add_argument(
+        "--build",
+        required=False,
+        action="store_true",
+        help="(Re)build the index into <output file>.positions.idx before querying",
+    )
+    parser.add_argument(
+        "--max-ply",
+        required=False,
+        default=DEFAULT_MAX_PLY,
+        type=int,
+        help="Build: positions after up to this many plies of every game are indexed",
+    )
+    parser.add_argument(
+        "--workers",
+        required=False,
+        default=os.cpu_count(),
+        type=int,
+        help="Build: number of processes replaying the moves",
+    )
+    parser.add_argument(
+        "--fen",
+        required=False,
+        default=None,
+        help="Position to look up (by default - the initial position)",
+    )
+    parser.add_argument(
+        "--moves",
+        required=False,
+        default=None,
+        help="Moves from --fen (or the initial position) to the position, SAN or UCI, e.g. \"e4 c5 Nf3 d6\"",
+    )
+    parser.add_argument(
+        "--player",
+        required=False,
+        default=None,
+        help="Only games of this player (combined outputs)",
+    )
+    parser.add_argument(
+        "--games",
+        required=False,
+        action="store_true",
+        help="Also list the games which reached the position",
+    )
+    return parser
+
+
+def store_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="export_games.py store",
+        description="Games of a player from the game store (see export --store), personified on demand: "
+        "printed, or written into an output of any format",
+    )
+    parser.add_argument(
+        "--folder",
+        required=True,
+        help="Game store folder, e.g. output/club.store",
+    )
+    parser.add_argument(
+        "--player",
+        required=True,
+        help="Player whose point of view the games are seen from (exact Lichess username)",
+    )
+    parser.add_argument(
+        "--opponent",
+        required=False,
+        default=None,
+        help="Only games against this opponent (head-to-head)",
+    )
+    parser.add_argument(
+        "--opponents",
+        required=False,
+        action="store_true",
+        help="List the player's opponents with the number of games against each of them instead",
+    )
+    parser.add_argument(
+        "--output",
+        required=False,
+        default=None,
+        help="Write the player's games into this output, e.g. output/masslove.parquet; "
+        "its extension is the output format",
+    )
+    return parser
+
+
+def check_serve_args(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    lichess_api_token, _ = lichess_settings()
+    if not lichess_api_token:
+        parser.error("LICHESS_TOKEN is not set - see .env_default")
+    if args.transform == Transform.COLUMNAR and args.api_format != APIFormat.PGN.value:
+        parser.error("--transform columnar is supported for the pgn API format only")
+
+
+def serve_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="export_games.py serve",
+        description="Local HTTP/JSON service: incremental syncs of players into per-player outputs and "
+        "the standard stats reports over any period, answered from player datasets kept in memory",
+        parents=[
+            output_arguments("parquet", "Folder of the players' outputs (<player>.<format>, synced incrementally)"),
+            transform_arguments(),
+            api_arguments(),
+        ],
+    )
+    parser.add_argument(
+        "--host",
+        required=False,
+        default="127.0.0.1",
+        help="Address to listen on",
+    )
+    parser.add_argument(
+        "--port",
+        required=False,
+        default=SERVE_PORT,
+        type=int,
+        help="Port to listen on",
+    )
+    parser.add_argument(
+        "--start-date",
+        required=True,
+        help="Start date (YYYY-MM-DD) of the games of a player synced for the first time",
+    )
+    parser.add_argument(
+        "--perf-type",
+        required=False,
+        default=None,
+        help=f"Comma-separated games type to sync. Valid values: {', '.join(variant.value for variant in ChessPerfType)}",
+    )
+    parser.add_argument(
+        "--max-memory",
+        required=False,
+        default=SERVE_MAX_MEMORY // 2**20,
+        type=int,
+        help="Memory for player datasets (MiB), least recently used players are evicted",
+    )
+    parser.add_argument(
+        "--syncs-concurrency",
+        required=False,
+        default=2,
+        type=int,
+        help="Number of players synced at the same time (further syncs wait)",
+    )
+    return parser
+
+
+# command -> its arguments parser and the checks of parsed arguments, the first one is the default
+COMMANDS: dict[str, tuple[Callable[[], argparse.ArgumentParser], Optional[Callable]]] = {
+    "export": (export_parser, check_export_args),
+    "stats": (stats_parser, None),
+    "reprocess": (reprocess_parser, None),
+    "dump": (dump_parser, None),
+    "backfill": (backfill_parser, None),
+    "positions": (positions_parser, None),
+    "store": (store_parser, None),
+    "serve": (serve_parser, check_serve_args),
+}
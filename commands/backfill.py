@@ -0,0 +1,71 @@
+import argparse
+import os
+import time
+
+import pyarrow as pa
+
+from commands.arguments import lichess_settings
+from helpers.backfill_helper import GameDetails
+from helpers.lichess_api_helper import LichessAPIHelper
+from helpers.urllib3_helper import RateLimiter, RetryPolicy
+
+# backfilled batches of games stored at once
+BACKFILL_MERGE_BATCHES = 20
+
+
+def run(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """`backfill` command: moves, clocks and evals of selected exported games, fetched by game id"""
+    output_format = args.format or os.path.splitext(args.file)[1].lstrip(".")
+    if not os.path.exists(args.file):
+        parser.error(f"'{args.file}' doesn't exist")
+    if args.where and args.ids_file:
+        parser.error("use either --where or --ids-file")
+    lichess_api_token, lichess_base_url = lichess_settings()
+    if not lichess_api_token:
+        parser.error("LICHESS_TOKEN is not set - see .env_default")
+
+    details = GameDetails(args.file, output_format)
+    if args.ids_file:
+        with open(args.ids_file, encoding="utf-8") as ids_file:
+            # game urls work as well
+            lines = (LichessAPIHelper.game_id_from_site(line.strip()) for line in ids_file if line.strip())
+            game_ids = list(dict.fromkeys(lines))
+    else:
+        game_ids = GameDetails.select_game_ids(args.file, output_format, args.where)
+    if not args.refresh:
+        backfilled_ids = details.backfilled_ids()
+        game_ids = [game_id for game_id in game_ids if game_id not in backfilled_ids]
+    print(f"Backfilling {len(game_ids)} games of '{args.file}'...")
+
+    api_helper = LichessAPIHelper(
+        lichess_api_token,
+        max_connections=args.concurrency,
+        rate_limiter=RateLimiter(args.requests_per_second),
+        retry_policy=RetryPolicy(max_retries=args.max_retries),
+        base_url=lichess_base_url,
+    )
+    started = time.perf_counter()
+    games_count = 0
+    fetched = []
+    try:
+        for table in GameDetails.fetch(api_helper, game_ids, args.concurrency, args.batch_size):
+            fetched.append(table)
+            games_count += len(table)
+            print(f"{games_count} games backfilled...")
+            # stored regularly (each time into a new part file), so an interrupted backfill
+            # continues where it stopped
+            if len(fetched) >= BACKFILL_MERGE_BATCHES:
+                details.add(pa.concat_tables(fetched))
+                fetched = []
+    finally:
+        if fetched:
+            details.add(pa.concat_tables(fetched))
+        # the details file is rewritten once, with the details of all the parts
+        details.compact()
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Done! Details of {games_count} games ({len(game_ids) - games_count} not found) have been merged "
+        f"into {'the game_details table' if output_format == 'duckdb' else repr(GameDetails.details_path(args.file))} "
+        f"in {elapsed:.1f}s"
+    )
@@ -0,0 +1,50 @@
+import argparse
+import os
+import time
+
+from commands.arguments import read_usernames
+from commands.export import save_cube
+from helpers.dump_helper import LichessDump
+from helpers.lichess_api_helper import LichessAPIHelper
+from helpers.pipeline_helper import PipelineHelper
+from helpers.stats_helper import AggregateCube
+
+
+def run(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """`dump` command: games of the users from a local Lichess database dump, without the API"""
+    usernames = read_usernames(args)
+    if not usernames:
+        parser.error("at least one user is required: use --username or --usernames-file")
+    try:
+        perf_types = LichessAPIHelper.validate_perf_types(args.perf_type)
+    except ValueError as e:
+        parser.error(str(e))
+    if not os.path.exists(args.file):
+        parser.error(f"'{args.file}' doesn't exist")
+
+    os.makedirs(args.folder, exist_ok=True)
+    output_filename = os.path.join(args.folder, f"{args.filename}.{args.format}")
+    dump = LichessDump(args.file, usernames, perf_types.split(",") if perf_types else None)
+
+    started = time.perf_counter()
+    games_count = 0
+    cube = AggregateCube()
+    with PipelineHelper.open_sink(
+        args.format,
+        output_filename,
+        row_group_size=args.row_group_size,
+        compression=args.compression,
+    ) as sink:
+        for table in dump.read(args.workers):
+            if len(table):
+                sink.write(table)
+                cube.add(table)
+                games_count += len(table)
+            print(f"{dump.games_scanned:,} games scanned, {games_count:,} games exported...")
+    save_cube(cube, output_filename, args.format)
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Done! {games_count} games of {len(usernames)} users have been saved to '{output_filename}'. "
+        f"Scanned {dump.games_scanned:,} games in {elapsed:.1f}s ({dump.games_scanned / elapsed:,.0f} games/sec)"
+    )
@@ -0,0 +1,550 @@
+import os
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timezone
+from typing import Callable, Hashable, Iterator
+
+import pyarrow as pa
+
+from commands.arguments import Transform, lichess_settings, read_usernames
+from helpers.archive_helper import PGNArchive, PGNArchiveWriter
+from helpers.cache_helper import ResponseCache, ResponseCacheMiss
+from helpers.columnar_helper import ColumnarHelper
+from helpers.movetext_helper import MovetextAnalyzer
+from helpers.lichess_api_helper import (
+    APIFormat,
+    GameT,
+    LichessAPIHelper,
+    APIParams_GetGames,
+    PGNGameHeader,
+)
+from helpers.incremental_helper import IncrementalState
+from helpers.pipeline_helper import (
+    PipelineHelper,
+    PGNGameHeaderStandardized,
+    PGNGameHeaderPersonified,
+    output_schema,
+)
+from helpers.progress_helper import ExportProgress, ThreadsProfiler
+from helpers.stages_helper import PipelineMetrics, parallel_map, prefetch
+from helpers.stats_helper import AggregateCube
+from helpers.store_helper import GameStore
+from helpers.urllib3_helper import RateLimiter, RetryPolicy
+
+# per-stage counters of the whole run (all users), printed at the end of export
+pipeline_metrics = PipelineMetrics()
+
+# process pool deriving features from movetext of games exported --with-moves (None - no moves)
+movetext_analyzer: MovetextAnalyzer | None = None
+
+# live progress (and --metrics-json) of the export, updated with every written batch
+export_progress: ExportProgress | None = None
+
+
+def game_key(game: PGNGameHeader | PGNGameHeaderStandardized) -> tuple[Hashable, str]:
+    """(time of the game, game id) of a downloaded game - PGN header or standardized game of the ndjson API format"""
+    if isinstance(game, PGNGameHeader):
+        return LichessAPIHelper.pgn_game_key(game)
+    return game.UTCDateTime, LichessAPIHelper.game_id_from_site(game.Site)
+
+
+def iter_games_windows(
+    api_helper: LichessAPIHelper,
+    fetch_games: Callable[[APIParams_GetGames], Iterator[GameT]],
+    params: APIParams_GetGames,
+    args: argparse.Namespace,
+) -> Iterator[GameT]:
+    if args.shards > 1:
+        # time windows are downloaded concurrently and merged back in the original order
+        return api_helper.iter_games_sharded(
+            fetch_games,
+            game_key,
+            params,
+            shards=args.shards,
+            concurrency=args.concurrency,
+        )
+    return fetch_games(params)
+
+
+def iter_games_raw(
+    api_helper: LichessAPIHelper,
+    username: str,
+    params: APIParams_GetGames,
+    args: argparse.Namespace,
+    archive: PGNArchiveWriter | None = None,
+) -> Iterator[PGNGameHeader | PGNGameHeaderStandardized]:
+    """Downloaded games to transform: PGN headers, or standardized games for the ndjson API format"""
+
+    def fetch_games(params: APIParams_GetGames) -> Iterator[PGNGameHeader | PGNGameHeaderStandardized]:
+        if args.api_format == APIFormat.NDJSON.value:
+            # JSON objects carry typed values, so they are mapped straight to the standardized form
+            return (
+                PGNGameHeaderStandardized.from_api_json(item)
+                for item in api_helper.iter_games_json(username, params)
+            )
+        return api_helper.iter_games_headers(
+            username, params, args.pgn_parser, archive.add if archive else None
+        )
+
+    return iter_games_windows(api_helper, fetch_games, params, args)
+
+
+def transform_batch(
+    games: list[PGNGameHeader | PGNGameHeaderStandardized], username: str, args: argparse.Namespace
+) -> list[PGNGameHeaderPersonified] | pa.Table:
+    """Batch of downloaded games -> batch of personified games to write"""
+    # game length and clock usage, computed by worker processes while this thread waits
+    features = movetext_analyzer.analyze(games) if movetext_analyzer else None
+
+    if args.transform == Transform.COLUMNAR:
+        features_table = MovetextAnalyzer.to_table(features) if features is not None else None
+        return ColumnarHelper.transform_headers(games, username, features_table)
+
+    games_std = games
+    if args.api_format == APIFormat.PGN.value:
+        # 'Standardize' - type conversion, normalization (like time control conversion from 180+0 to 3+0)
+        games_std = [PGNGameHeaderStandardized.from_pgn_header(item) for item in games]
+    if features is not None:
+        games_std = [item.apply(game_std) for item, game_std in zip(features, games_std)]
+
+    # Instead of generic game Info with White and Black, we converting to Player's (the one we exporting for) perspective
+    return [PGNGameHeaderPersonified.from_pgn_header_std(item, username) for item in games_std]
+
+
+def standardize_new_games(
+    games: list[PGNGameHeader | PGNGameHeaderStandardized], args: argparse.Namespace, store: GameStore
+) -> pa.Table:
+    """Batch of downloaded games -> table of standardized games which are not in the store yet"""
+    # games shared with users exported before (or at the same time) are transformed once
+    games = [game for game in games if not store.contains(LichessAPIHelper.game_id_from_site(game.Site))]
+    features = movetext_analyzer.analyze(games) if movetext_analyzer and games else None
+
+    if args.transform == Transform.COLUMNAR:
+        features_table = MovetextAnalyzer.to_table(features) if features is not None else None
+        return ColumnarHelper.standardize_batch(ColumnarHelper.headers_to_table(games), features_table)
+
+    games_std = games
+    if args.api_format == APIFormat.PGN.value:
+        games_std = [PGNGameHeaderStandardized.from_pgn_header(item) for item in games]
+    if features is not None:
+        games_std = [item.apply(game_std) for item, game_std in zip(features, games_std)]
+    return GameStore.to_table(games_std)
+
+
+def iter_games_batches(
+    api_helper: LichessAPIHelper,
+    username: str,
+    params: APIParams_GetGames,
+    args: argparse.Namespace,
+    incremental_state: IncrementalState | None = None,
+    archive: PGNArchiveWriter | None = None,
+) -> Iterator[list[PGNGameHeader | PGNGameHeaderStandardized]]:
+    """Batches of downloaded games, parsed by a background thread while the next ones are downloaded"""
+    # Games are streamed from lichess API one by one and written in batches,
+    # so memory usage stays flat regardless of number of exported games
+    games = iter_games_raw(api_helper, username, params, args, archive)
+    if incremental_state:
+        games = incremental_state.filter_new_games(games)
+
+    return prefetch(
+        PipelineHelper.batched(games, args.batch_size),
+        args.queue_size,
+        pipeline_metrics.stage("parse"),
+    )
+
+
+def iter_batches_pers(
+    api_helper: LichessAPIHelper,
+    username: str,
+    params: APIParams_GetGames,
+    args: argparse.Namespace,
+    incremental_state: IncrementalState | None = None,
+    archive: PGNArchiveWriter | None = None,
+) -> Iterator[list[PGNGameHeaderPersonified] | pa.Table]:
+    """
+    Batches of personified games to write: lists of dataclasses, or Arrow tables with --transform columnar.
+    Raw PGN of downloaded games goes to the archive, if given.
+
+    Stages run concurrently, connected by bounded queues: download (see LichessAPIHelper prefetch) ->
+    parse into batches (background thread) -> transform (--transform-workers threads) -> write (caller).
+    """
+    games_batches = iter_games_batches(api_helper, username, params, args, incremental_state, archive)
+    return parallel_map(
+        lambda batch: transform_batch(batch, username, args),
+        games_batches,
+        args.transform_workers,
+        pipeline_metrics.stage("transform"),
+    )
+
+
+def write_batch(sink, cube: AggregateCube, batch: list[PGNGameHeaderPersonified] | pa.Table) -> None:
+    started, cpu_started = time.perf_counter(), time.thread_time()
+    sink.write(batch)
+    cube.add(batch)
+    pipeline_metrics.stage("write").record(
+        len(batch), busy=time.perf_counter() - started, cpu=time.thread_time() - cpu_started
+    )
+
+
+def report_progress(username: str, games_count: int, batch: list[PGNGameHeaderPersonified] | pa.Table) -> None:
+    """Updates the live progress with a written batch of the user's games"""
+    if export_progress is not None:
+        games_times = [utc_datetime for _, utc_datetime in PipelineHelper.games_keys(batch)]
+        export_progress.update(username, games_count, games_times)
+
+
+def save_cube(cube: AggregateCube, output_filename: str, output_format: str, incremental: bool = False) -> None:
+    """Saves aggregate cube of the (already committed) output"""
+    if output_format == "duckdb" and not incremental:
+        # rows of re-exported games are replaced in the database, so they'd be counted twice - recount.
+        # Incremental exports only add games newer than the exported ones (see IncrementalState)
+        cube = AggregateCube.from_output(output_filename, output_format)
+    cube.save(output_filename)
+
+
+def export_player_games(
+    api_helper: LichessAPIHelper,
+    username: str,
+    params: APIParams_GetGames,
+    args: argparse.Namespace,
+    output_filename: str,
+) -> int:
+    """Exports games of one user into its own output file, returns number of exported games"""
+    params = APIParams_GetGames(**params)
+
+    incremental_state = None
+    if args.incremental:
+        incremental_state = IncrementalState.load(output_filename, username, args.format)
+        params["since"] = incremental_state.since(params["since"])
+        print(
+            f"[{username}] Incremental mode: {incremental_state.games_count} games already exported, "
+            f"downloading games since {datetime.fromtimestamp(params['since'] / 1000, tz=timezone.utc)}"
+        )
+    if export_progress is not None:
+        export_progress.start_user(username, params["since"])
+
+    # aggregates of the games already in the output are updated with the new ones
+    cube = AggregateCube.load(output_filename, args.format) if args.incremental else AggregateCube()
+
+    archive_writer = nullcontext()
+    if args.archive:
+        archive_writer = PGNArchiveWriter(
+            PGNArchive.archive_path_for(output_filename),
+            username,
+            append=args.incremental,
+            with_moves=args.with_moves,
+        )
+
+    games_count = 0
+    with archive_writer as archive, PipelineHelper.open_sink(
+        args.format,
+        output_filename,
+        append=args.incremental,
+        row_group_size=args.row_group_size,
+        compression=args.compression,
+        with_moves=args.with_moves,
+    ) as sink:
+        for batch in iter_batches_pers(api_helper, username, params, args, incremental_state, archive):
+            write_batch(sink, cube, batch)
+            games_count += len(batch)
+            if incremental_state:
+                for site, utc_datetime in PipelineHelper.games_keys(batch):
+                    incremental_state.add_game(site, utc_datetime)
+            report_progress(username, games_count, batch)
+
+    # state is saved only after the output is committed, see IncrementalState
+    if incremental_state:
+        incremental_state.save(output_filename)
+    save_cube(cube, output_filename, args.format, args.incremental)
+
+    return games_count
+
+
+def export_players_games(
+    api_helper: LichessAPIHelper,
+    usernames: list[str],
+    params: APIParams_GetGames,
+    args: argparse.Namespace,
+    output_filename: str | None,
+) -> dict[str, int | Exception]:
+    """
+    Exports games of several users concurrently over one API helper (shared connection pool
+    and rate limiter). Writes a file per user, or - if output_filename is given - one combined file.
+    Returns number of exported games (or the error) per user.
+
+    Games of a user are staged in <output>.<user>.staging.parquet and copied into the combined
+    file once all of them are downloaded, so a user failing midway leaves none of their games in it.
+    """
+    combined_sink = None
+    combined_cube = AggregateCube()
+    sink_lock = threading.Lock()
+
+    def export_user(username: str) -> int:
+        if combined_sink is None:
+            user_filename = os.path.join(args.folder, f"{username}.{args.format}")
+            return export_player_games(api_helper, username, params, args, user_filename)
+
+        staging_path = f"{output_filename}.{username}.staging.parquet"
+        games_count = 0
+        try:
+            with PipelineHelper.open_sink(
+                "parquet",
+                staging_path,
+                row_group_size=args.row_group_size,
+                compression=args.compression,
+                with_moves=args.with_moves,
+            ) as staging_sink:
+                for batch in iter_batches_pers(api_helper, username, params, args):
+                    staging_sink.write(batch)
+                    games_count += len(batch)
+                    report_progress(username, games_count, batch)
+
+            columns = output_schema(args.with_moves).names
+            with sink_lock:
+                for table in PipelineHelper.read_output("parquet", staging_path, columns):
+                    write_batch(combined_sink, combined_cube, table)
+        finally:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+        return games_count
+
+    if output_filename is None:
+        return run_exports(usernames, export_user, args.users_concurrency)
+
+    with PipelineHelper.open_sink(
+        args.format,
+        output_filename,
+        row_group_size=args.row_group_size,
+        compression=args.compression,
+        with_moves=args.with_moves,
+    ) as combined_sink:
+        results = run_exports(usernames, export_user, args.users_concurrency)
+    save_cube(combined_cube, output_filename, args.format)
+    return results
+
+
+def export_players_to_store(
+    api_helper: LichessAPIHelper,
+    usernames: list[str],
+    params: APIParams_GetGames,
+    args: argparse.Namespace,
+    store_folder: str,
+) -> dict[str, int | Exception]:
+    """
+    Exports games of several users concurrently into the canonical game store (see GameStore):
+    games already in the store - e.g. between exported users - are skipped. Returns number of
+    games new to the store (or the error) per user.
+    """
+    store_lock = threading.Lock()
+
+    def export_user(username: str) -> int:
+        user_params = APIParams_GetGames(**params)
+        last_game_time = store.last_game_time(username) if args.incremental else None
+        if last_game_time is not None:
+            # `since` is inclusive - games of that second come again and are skipped as known
+            user_params["since"] = max(user_params["since"], int(last_game_time.timestamp() * 1000))
+            print(f"[{username}] Incremental mode: downloading games since {last_game_time}")
+        if export_progress is not None:
+            export_progress.start_user(username, user_params["since"])
+
+        games_count = 0
+        tables = parallel_map(
+            lambda batch: standardize_new_games(batch, args, store),
+            iter_games_batches(api_helper, username, user_params, args),
+            args.transform_workers,
+            pipeline_metrics.stage("transform"),
+        )
+        for table in tables:
+            started, cpu_started = time.perf_counter(), time.thread_time()
+            with store_lock:
+                new_games_count = store.add(table)
+            pipeline_metrics.stage("write").record(
+                new_games_count, busy=time.perf_counter() - started, cpu=time.thread_time() - cpu_started
+            )
+            games_count += new_games_count
+            report_progress(username, games_count, table)
+        return games_count
+
+    with GameStore(store_folder) as store:
+        return run_exports(usernames, export_user, args.users_concurrency)
+
+
+def run_exports(
+    usernames: list[str], export_user: Callable[[str], int], users_concurrency: int
+) -> dict[str, int | Exception]:
+    """Runs export_user for the users, users_concurrency at a time; number of games or the error per user"""
+
+    def export_and_finish(username: str) -> int:
+        failed = True
+        try:
+            games_count = export_user(username)
+            failed = False
+            return games_count
+        finally:
+            if export_progress is not None:
+                export_progress.finish_user(username, failed)
+
+    with ThreadPoolExecutor(max_workers=users_concurrency) as executor:
+        futures = {username: executor.submit(export_and_finish, username) for username in usernames}
+
+    results = {}
+    for username, future in futures.items():
+        try:
+            results[username] = future.result()
+        except Exception as e:
+            print(f"[{username}] Error: {e}")
+            results[username] = e
+    return results
+
+
+def create_api_helper(
+    args: argparse.Namespace,
+    lichess_api_token: str | None,
+    lichess_base_url: str | None,
+    max_connections: int,
+    response_cache: ResponseCache | None,
+) -> LichessAPIHelper:
+    """API helper of the export: one connection pool and request rate limit shared by all users and time windows"""
+    return LichessAPIHelper(
+        lichess_api_token,
+        max_connections=max_connections,
+        rate_limiter=RateLimiter(args.requests_per_second),
+        retry_policy=RetryPolicy(max_retries=args.max_retries),
+        base_url=lichess_base_url,
+        response_cache=response_cache,
+        prefetch_chunks=args.queue_size,
+        download_metrics=pipeline_metrics.stage("download", unit="MiB"),
+    )
+
+
+def games_params(
+    args: argparse.Namespace, perf_types: str, start_ts: int, end_ts: int
+) -> APIParams_GetGames:
+    """Params of the games request of every exported user"""
+    return APIParams_GetGames(
+        max=args.max_games,
+        # incremental runs go oldest first: --max-games takes the oldest games not exported yet,
+        # and the next run continues right after them (newest first, the rest would be skipped)
+        sort="dateAsc" if args.incremental else None,
+        rated=True,
+        perfType=perf_types,
+        moves=args.with_moves,
+        clocks=args.with_moves,
+        opening=True,
+        since=start_ts,
+        until=end_ts,
+        lastFen=True,
+    )
+
+
+def print_run_stats(response_cache: ResponseCache | None, api_helper: LichessAPIHelper) -> None:
+    """Per-stage throughput (to see which stage is the bottleneck), requests and cache hit rate of the export"""
+    print("Pipeline stages:")
+    print(pipeline_metrics.summary())
+    print(f"HTTP: {api_helper.req_helper.stats.summary()}")
+    if response_cache:
+        print(f"Response cache: {response_cache.stats.summary()}")
+
+
+def run(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """`export` command: games of the users from Lichess API into output files, a combined output or a game store"""
+    global movetext_analyzer, export_progress
+
+    max_games = args.max_games
+    output_format = args.format
+    output_folder = args.folder
+
+    lichess_api_token, lichess_base_url = lichess_settings()
+    usernames = read_usernames(args)
+
+    try:
+        perf_types = LichessAPIHelper.validate_perf_types(args.perf_type)
+    except ValueError as e:
+        print(f"Error: {e}")
+        exit(1)
+
+    start_ts, end_ts = LichessAPIHelper.generate_timestamps_msec(
+        args.start_date, args.end_date
+    )
+
+    print(f"Exporting games of {', '.join(usernames)}")
+    print(f"Period: ({args.start_date} 00:00:00) - ({args.end_date} 23:59:59)")
+    print(f"Type(s): {args.perf_type}")
+    print("Note that download limit is 30-60 games per second, so be patient... :)")
+
+    # all users and time windows share one connection pool and one request rate limit
+    users_concurrency = min(args.users_concurrency, len(usernames))
+    max_connections = users_concurrency * (args.concurrency if args.shards > 1 else 1)
+    response_cache = None
+    if args.cache_dir:
+        response_cache = ResponseCache(
+            args.cache_dir, max_size=args.cache_max_size * 2**20, offline=args.offline
+        )
+    api_helper = create_api_helper(args, lichess_api_token, lichess_base_url, max_connections, response_cache)
+
+    # Prepare params for Lichess API call
+    params = games_params(args, perf_types, start_ts, end_ts)
+
+    # write raw data from API
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    export_progress = ExportProgress(
+        usernames,
+        start_ts,
+        end_ts,
+        pipeline_metrics,
+        api_helper.req_helper.stats,
+        response_cache,
+        max_games=max_games,
+        metrics_path=args.metrics_json,
+        interval=args.progress_interval,
+    )
+    profiler = ThreadsProfiler() if args.profile else nullcontext()
+    # the worker processes of the movetext analysis are shut down however the export ends
+    movetext_analyzer = MovetextAnalyzer(args.moves_workers, args.pgn_parser) if args.with_moves else None
+
+    try:
+        with movetext_analyzer or nullcontext(), profiler, export_progress:
+            if len(usernames) == 1 and not args.combined and not args.store:
+                username = usernames[0]
+                output_filename = f"{args.filename if args.filename else username}.{output_format}"  # by default: username.csv|parquet|dataset|duckdb
+                output_filename = os.path.join(output_folder, output_filename)
+
+                games_count = export_player_games(api_helper, username, params, args, output_filename)
+                export_progress.finish_user(username)
+                done_message = f"Done! {games_count} games have been saved to '{output_filename}' "
+                failed = []
+            else:
+                output_filename = None
+                if args.combined:
+                    output_filename = f"{args.filename if args.filename else 'games'}.{output_format}"  # by default: games.csv|parquet|dataset|duckdb
+                    output_filename = os.path.join(output_folder, output_filename)
+
+                if args.store:
+                    results = export_players_to_store(api_helper, usernames, params, args, args.store)
+                    location = f"'{args.store}' (game store, games new to it)"
+                else:
+                    results = export_players_games(api_helper, usernames, params, args, output_filename)
+                    location = f"'{output_filename}'" if output_filename else f"'{output_folder}' (file per user)"
+                failed = [username for username, result in results.items() if isinstance(result, Exception)]
+                games_count = sum(result for result in results.values() if not isinstance(result, Exception))
+                done_message = f"Done! {games_count} games of {len(results) - len(failed)} users have been saved to {location}"
+    except ResponseCacheMiss as e:
+        # the output of the user was aborted, nothing of this run is kept
+        print(f"Error: {e}")
+        exit(1)
+
+    print(done_message)
+    print_run_stats(response_cache, api_helper)
+    if args.profile:
+        print(f"Profile saved to '{args.profile}', hottest functions:")
+        print(profiler.report(args.profile))
+    if failed:
+        # outputs of failed users (their part of a combined output) are not committed, the game store keeps games added
+        not_saved = "" if args.store else ", none of their games of this run were saved"
+        print(f"Export failed for: {', '.join(failed)}{not_saved}")
+        exit(1)
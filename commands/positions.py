@@ -0,0 +1,38 @@
+import argparse
+import os
+import time
+
+import duckdb
+
+from helpers.position_index_helper import PositionIndex
+
+
+def run(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """`positions` command: builds the position index of an output and queries it"""
+    output_format = args.format or os.path.splitext(args.file)[1].lstrip(".")
+    if not os.path.exists(args.file):
+        parser.error(f"'{args.file}' doesn't exist")
+    if not args.build and not os.path.exists(PositionIndex.index_path(args.file)):
+        parser.error(f"'{args.file}' has no position index yet - use --build")
+
+    if args.build:
+        started = time.perf_counter()
+        index = PositionIndex.build(args.file, output_format, args.max_ply, args.workers)
+        print(
+            f"Indexed {index.entries_count:,} game positions of {index.games.num_rows:,} games "
+            f"in {time.perf_counter() - started:.1f}s"
+        )
+    else:
+        index = PositionIndex(args.file)
+
+    moves = args.moves.split() if args.moves else None
+    try:
+        started = time.perf_counter()
+        stats = index.query(args.fen, moves, args.player)
+        elapsed = time.perf_counter() - started
+    except ValueError as e:
+        parser.error(f"invalid position: {e}")
+    print(stats)
+    print(f"Answered in {elapsed * 1000:.2f} ms")
+    if args.games:
+        print(duckdb.arrow(index.games_at(args.fen, moves, args.player)))
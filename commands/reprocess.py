@@ -0,0 +1,43 @@
+import argparse
+import os
+import time
+
+from commands.export import save_cube
+from helpers.archive_helper import PGNArchive
+from helpers.options_helper import OUTPUT_FORMATS
+from helpers.pipeline_helper import PipelineHelper
+from helpers.stats_helper import AggregateCube
+
+
+def run(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """`reprocess` command: re-derives an output from the raw PGN archive, without downloading"""
+    archive = PGNArchive(args.archive)
+
+    if args.game_id:
+        game_text = archive.read_game(args.game_id)
+        if game_text is None:
+            parser.error(f"game {args.game_id} is not in the archive")
+        print(game_text)
+        return
+
+    if not args.output:
+        parser.error("--output is required")
+    output_format = os.path.splitext(args.output)[1].lstrip(".")
+    if output_format not in OUTPUT_FORMATS:
+        parser.error(f"unknown output format '{output_format}'")
+
+    started = time.perf_counter()
+    games_count = 0
+    cube = AggregateCube()
+    with PipelineHelper.open_sink(output_format, args.output, with_moves=archive.with_moves) as sink:
+        for table in archive.reprocess(args.workers, args.pgn_parser):
+            sink.write(table)
+            cube.add(table)
+            games_count += len(table)
+    save_cube(cube, args.output, output_format)
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Done! {games_count} games of {archive.username} have been reprocessed into '{args.output}' "
+        f"in {elapsed:.1f}s ({games_count / elapsed:,.0f} games/sec)"
+    )
@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qsl, unquote, urlparse
+
+from commands.arguments import export_parser, lichess_settings
+from commands.export import create_api_helper, export_player_games, games_params, pipeline_metrics, print_run_stats
+from helpers.lichess_api_helper import LichessAPIHelper
+from helpers.options_helper import STATS_REPORT_NAMES
+from helpers.service_helper import DatasetCache, PlayerDataset, SingleFlight
+
+# Lichess usernames: letters, digits, "_" and "-" (so a player's name is also safe as an output file name)
+USERNAME_REGEX = re.compile(r"^[A-Za-z0-9_-]{1,30}$")
+
+
+class ServiceError(Exception):
+    """Request which can't be answered, with the HTTP status of the reply"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_date(value: str) -> datetime:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    except ValueError:
+        raise ServiceError(400, f"Invalid date format: '{value}'. Use YYYY-MM-DD.")
+
+
+def parse_period(query: dict[str, str]) -> tuple[Optional[datetime], Optional[datetime]]:
+    """
+    Period of a stats request, [since, until): days=N - the last N days (UTC), today included;
+    or since/until=YYYY-MM-DD, both days included; all games if none of them is given
+    """
+    if "days" in query:
+        if not query["days"].isdigit() or int(query["days"]) < 1:
+            raise ServiceError(400, f"days must be a positive number, not '{query['days']}'")
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - timedelta(days=int(query["days"]) - 1), None
+    since = parse_date(query["since"]) if query.get("since") else None
+    until = parse_date(query["until"]) + timedelta(days=1) if query.get("until") else None
+    return since, until
+
+
+class StatsService:
+    """
+    Players' games and stats kept warm between requests: one API helper (connection pool and
+    request rate limit) for all syncs, players' datasets in memory (DatasetCache, LRU by size),
+    and stats reports memoized per dataset and period (PlayerDataset).
+
+    A sync is an incremental export of the player into <folder>/<player>.<format> (with its
+    state and aggregate cube next to it, as with export --incremental), after which the player's
+    dataset is reloaded. Concurrent syncs, loads and stats requests of the same player are
+    deduplicated (SingleFlight), and a player's output is synced and loaded by one thread at a time.
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        lichess_api_token, lichess_base_url = lichess_settings()
+        self.perf_types = LichessAPIHelper.validate_perf_types(args.perf_type)
+        self.start_ts, _ = LichessAPIHelper.generate_timestamps_msec(args.start_date, args.start_date)
+
+        # syncs are incremental exports with the export's defaults of the options serve doesn't have
+        self.sync_args = export_parser().parse_args(
+            [
+                "--start-date", args.start_date,
+                "--end-date", args.start_date,
+                "--folder", args.folder,
+                "--format", args.format,
+                "--incremental",
+                "--api-format", args.api_format,
+                "--transform", args.transform,
+                "--requests-per-second", str(args.requests_per_second),
+                "--max-retries", str(args.max_retries),
+            ]
+        )
+        self.api_helper = create_api_helper(
+            self.sync_args, lichess_api_token, lichess_base_url, args.syncs_concurrency, None
+        )
+
+        self.datasets = DatasetCache(args.max_memory * 2**20)
+        self.flights = SingleFlight()
+        self.syncs = threading.Semaphore(args.syncs_concurrency)
+        self.player_locks: dict[str, threading.Lock] = {}
+        self.player_locks_lock = threading.Lock()
+        self.started = time.perf_counter()
+
+    def output_path(self, player: str) -> str:
+        return os.path.join(self.args.folder, f"{player}.{self.args.format}")
+
+    def player_lock(self, player: str) -> threading.Lock:
+        with self.player_locks_lock:
+            return self.player_locks.setdefault(player, threading.Lock())
+
+    def load(self, player: str) -> PlayerDataset:
+        """Loads the player's dataset from the output into the cache (holding the player's lock)"""
+        dataset = PlayerDataset.load(player, self.output_path(player), self.args.format)
+        self.datasets.put(dataset)
+        return dataset
+
+    def sync_player(self, player: str) -> tuple[PlayerDataset, dict]:
+        def sync() -> tuple[PlayerDataset, dict]:
+            with self.syncs, self.player_lock(player):
+                started = time.perf_counter()
+                params = games_params(self.sync_args, self.perf_types, self.start_ts, int(time.time() * 1000))
+                new_games = export_player_games(
+                    self.api_helper, player, params, self.sync_args, self.output_path(player)
+                )
+                dataset = self.load(player)
+            return dataset, {
+                "player": player,
+                "new_games": new_games,
+                "games": dataset.games.num_rows,
+                "elapsed_seconds": round(time.perf_counter() - started, 3),
+            }
+
+        (dataset, summary), shared = self.flights.run(("sync", player), sync)
+        return dataset, {**summary, "shared": shared}
+
+    def sync(self, player: str) -> dict:
+        """Downloads the player's new games, see StatsService"""
+        _, summary = self.sync_player(player)
+        return summary
+
+    def dataset(self, player: str) -> PlayerDataset:
+        """The player's dataset: from memory, loaded from the output, or synced if the player has none"""
+        dataset = self.datasets.get(player)
+        if dataset is not None:
+            return dataset
+        if not os.path.exists(self.output_path(player)):
+            dataset, _ = self.sync_player(player)
+            return dataset
+
+        def load() -> PlayerDataset:
+            with self.player_lock(player):
+                return self.load(player)
+
+        dataset, _ = self.flights.run(("load", player), load)
+        return dataset
+
+    def stats(
+        self,
+        player: str,
+        report_names: list[str],
+        since: Optional[datetime],
+        until: Optional[datetime],
+        sync: bool = False,
+    ) -> dict:
+        """Standard stats reports of the player's games played in [since, until)"""
+        dataset = self.sync_player(player)[0] if sync else self.dataset(player)
+
+        def compute() -> dict:
+            return {
+                "player": player,
+                "since": since.isoformat() if since else None,
+                "until": until.isoformat() if until else None,
+                "games": dataset.games_count(since, until),
+                "reports": {name: dataset.report(name, since, until) for name in report_names},
+            }
+
+        result, _ = self.flights.run(("stats", id(dataset), tuple(report_names), since, until), compute)
+        return result
+
+    def status(self) -> dict:
+        return {
+            "uptime_seconds": round(time.perf_counter() - self.started, 1),
+            "players": self.datasets.to_dict(),
+            "deduplicated_requests": self.flights.shared,
+            "http": dict(vars(self.api_helper.req_helper.stats)),
+            "stages": pipeline_metrics.to_dict(),
+        }
+
+
+def handler_class(service: StatsService) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.handle_request("GET")
+
+        def do_POST(self):
+            self.handle_request("POST")
+
+        def handle_request(self, method: str) -> None:
+            started = time.perf_counter()
+            try:
+                url = urlparse(self.path)
+                path = [unquote(part) for part in url.path.strip("/").split("/")]
+                query = dict(parse_qsl(url.query))
+                # replies of deduplicated requests are shared, elapsed time is per request
+                reply = {**self.route(method, path, query), "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+                self.send_json(200, reply)
+            except ServiceError as e:
+                self.send_json(e.status, {"error": str(e)})
+            except Exception as e:
+                print(f"[{self.path}] Error: {e}")
+                self.send_json(500, {"error": str(e)})
+
+        def route(self, method: str, path: list[str], query: dict[str, str]) -> dict:
+            if method == "GET" and path == ["status"]:
+                return service.status()
+            if len(path) == 3 and path[0] == "players":
+                player = path[1]
+                if not USERNAME_REGEX.match(player):
+                    raise ServiceError(400, f"Invalid username '{player}'")
+                if method == "POST" and path[2] == "sync":
+                    return service.sync(player)
+                if method == "GET" and path[2] == "stats":
+                    report_names = query["report"].split(",") if query.get("report") else STATS_REPORT_NAMES
+                    unknown = [name for name in report_names if name not in STATS_REPORT_NAMES]
+                    if unknown:
+                        raise ServiceError(
+                            400, f"Unknown report(s) {', '.join(unknown)}, valid: {', '.join(STATS_REPORT_NAMES)}"
+                        )
+                    since, until = parse_period(query)
+                    return service.stats(player, report_names, since, until, sync=query.get("sync") in ("1", "true"))
+            raise ServiceError(404, f"No such endpoint: {method} /{'/'.join(path)}")
+
+        def send_json(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def run(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """`serve` command: syncs and stats of players over a local HTTP/JSON API, see StatsService"""
+    try:
+        service = StatsService(args)
+    except ValueError as e:
+        parser.error(str(e))
+    os.makedirs(args.folder, exist_ok=True)
+
+    httpd = ThreadingHTTPServer((args.host, args.port), handler_class(service))
+    print(f"Serving players of '{args.folder}' at http://{args.host}:{httpd.server_port}/")
+    print("  POST /players/<player>/sync                    - download the player's new games")
+    print("  GET  /players/<player>/stats?days=30&report=... - stats reports (also since/until=YYYY-MM-DD, sync=1)")
+    print("  GET  /status                                   - players in memory, requests, pipeline stages")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+    print(f"Player datasets: {service.datasets.stats.summary()}")
+    print_run_stats(None, service.api_helper)
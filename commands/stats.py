@@ -0,0 +1,30 @@
+import argparse
+import os
+import time
+
+import duckdb
+
+from helpers.stats_helper import STATS_REPORTS, AggregateCube
+
+
+def run(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """`stats` command: standard stats reports of an exported output, answered from its aggregate cube"""
+    output_format = args.format or os.path.splitext(args.file)[1].lstrip(".")
+    if not os.path.exists(args.file):
+        parser.error(f"'{args.file}' doesn't exist")
+
+    started = time.perf_counter()
+    cube = AggregateCube.load(args.file, output_format)
+    reports = [STATS_REPORTS[args.report]] if args.report else STATS_REPORTS.values()
+    for report in reports:
+        print(f"Stats by {report.name}:")
+        print(duckdb.arrow(cube.report(report)))
+    print(f"Reports answered from the cube in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    if args.check:
+        differences = cube.differences(AggregateCube.from_output(args.file, output_format))
+        if differences:
+            print(f"Cube doesn't match the exported games ({len(differences)} differences):")
+            print("\n".join(differences[:20]))
+            exit(1)
+        print("Consistency check: cube matches the exported games")
@@ -0,0 +1,50 @@
+import argparse
+import os
+import time
+
+import duckdb
+
+from commands.export import save_cube
+from helpers.options_helper import OUTPUT_FORMATS
+from helpers.pipeline_helper import PipelineHelper
+from helpers.stats_helper import AggregateCube
+from helpers.store_helper import GameStore
+
+
+def run(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    """`store` command: a player's view of the canonical game store, optionally head-to-head"""
+    if not os.path.exists(args.folder):
+        parser.error(f"'{args.folder}' doesn't exist")
+    try:
+        store = GameStore(args.folder, read_only=True)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+
+    if args.opponents:
+        print(duckdb.arrow(store.opponents(args.player)))
+        return
+
+    started = time.perf_counter()
+    games = store.personified(args.player, args.opponent)
+    elapsed = time.perf_counter() - started
+    print(
+        f"{games.num_rows} games of {args.player}"
+        f"{f' against {args.opponent}' if args.opponent else ''} out of {store.games.num_rows} stored games "
+        f"({elapsed * 1000:.1f} ms): {sum(games['ResultWin'].to_pylist())} wins, "
+        f"{sum(games['ResultDraw'].to_pylist())} draws, {sum(games['ResultLose'].to_pylist())} losses"
+    )
+    if not args.output:
+        print(duckdb.arrow(games))
+        return
+
+    output_format = os.path.splitext(args.output)[1].lstrip(".")
+    if output_format not in OUTPUT_FORMATS:
+        parser.error(f"unknown output format '{output_format}'")
+    # games exported into the store with moves keep their movetext columns
+    with_moves = games["PlyCount"].null_count < games.num_rows
+    cube = AggregateCube()
+    with PipelineHelper.open_sink(output_format, args.output, with_moves=with_moves) as sink:
+        sink.write(games)
+        cube.add(games)
+    save_cube(cube, args.output, output_format)
+    print(f"Saved to '{args.output}'")
@@ -0,0 +1,240 @@
+import gzip
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, Optional
+
+import pyarrow as pa
+
+from helpers.columnar_helper import PERSONIFIED_SCHEMA, ColumnarHelper
+from helpers.pipeline_helper import pc, pq
+from helpers.lichess_api_helper import LichessAPIHelper
+from helpers.movetext_helper import MovetextAnalyzer
+from helpers.pgn_parser_helper import PGNGameHeader, PGNHeaderParser, PGNParserMode
+
+ARCHIVE_FILE_SUFFIX = ".pgn.gz"
+INDEX_FILE_SUFFIX = ".index.parquet"
+
+# games per frame - a frame is the unit of random access and of parallel reprocessing
+FRAME_GAMES = 1000
+
+INDEX_SCHEMA = pa.schema(
+    [
+        pa.field("GameId", pa.string()),
+        pa.field("UTCDateTime", pa.timestamp("ms", tz="UTC")),
+        pa.field("FrameOffset", pa.int64()),
+        pa.field("FrameLength", pa.int64()),
+    ]
+)
+
+# frame ranges per reprocessing worker - several smaller tasks even out uneven frames
+TASKS_PER_WORKER = 4
+
+# first move of a game's movetext - archives written before the index recorded whether games
+# were downloaded with moves are recognized by it
+FIRST_MOVE_REGEX = re.compile(r"(?:^|\s)1\.\s")
+
+
+class PGNArchive:
+    """
+    Raw PGN of exported games kept next to the output (<output>.pgn.gz), so outputs can be
+    re-derived without downloading games again.
+
+    The archive is a sequence of frames - independent gzip members of FRAME_GAMES games
+    (together they are still a regular .gz file). The index (<archive>.index.parquet) maps
+    every game id and time to offset and length of its frame, which allows reading a single
+    game or processing frame ranges in parallel. Player the games were exported for and whether
+    they were downloaded with moves (export --with-moves) are kept in the index metadata.
+    """
+
+    def __init__(self, archive_path: str):
+        self.archive_path = archive_path
+        self.index = pq.read_table(self.index_path(archive_path))
+        self.username = self.index.schema.metadata[b"username"].decode("utf-8")
+        moves = self.index.schema.metadata.get(b"moves")
+        self.with_moves = moves == b"true" if moves is not None else self.first_frame_has_moves()
+
+    @classmethod
+    def archive_path_for(cls, output_path: str) -> str:
+        return f"{output_path}{ARCHIVE_FILE_SUFFIX}"
+
+    @classmethod
+    def index_path(cls, archive_path: str) -> str:
+        return f"{archive_path}{INDEX_FILE_SUFFIX}"
+
+    @classmethod
+    def read_frame(cls, archive_file, offset: int, length: int) -> str:
+        archive_file.seek(offset)
+        return gzip.decompress(archive_file.read(length)).decode("utf-8")
+
+    def first_frame_has_moves(self) -> bool:
+        frames = self.frames()
+        if not frames:
+            return False
+        with open(self.archive_path, "rb") as archive_file:
+            frame_text = self.read_frame(archive_file, *frames[0])
+        return any(
+            FIRST_MOVE_REGEX.search(PGNHeaderParser.split_movetext(game_text))
+            for game_text in PGNHeaderParser.split_games([frame_text])
+        )
+
+    def frames(self) -> list[tuple[int, int]]:
+        """(offset, length) of every frame, in archive order"""
+        frames = self.index.select(["FrameOffset", "FrameLength"]).group_by(
+            ["FrameOffset", "FrameLength"], use_threads=False
+        ).aggregate([])
+        return sorted(zip(frames["FrameOffset"].to_pylist(), frames["FrameLength"].to_pylist()))
+
+    def read_game(self, game_id: str) -> Optional[str]:
+        """PGN of a single game (None if it's not in the archive) - only its frame is decompressed"""
+        matches = self.index.filter(pc.equal(self.index["GameId"], game_id))
+        if matches.num_rows == 0:
+            return None
+
+        offset, length = matches["FrameOffset"][0].as_py(), matches["FrameLength"][0].as_py()
+        with open(self.archive_path, "rb") as archive_file:
+            frame_text = self.read_frame(archive_file, offset, length)
+        for game_text in PGNHeaderParser.split_games([frame_text]):
+            header = PGNHeaderParser.to_pgn_header(PGNHeaderParser.parse_tags(game_text))
+            if LichessAPIHelper.game_id_from_site(header.Site or "") == game_id:
+                return game_text
+        return None
+
+    def reprocess(
+        self, workers: int, parser_mode: str = PGNParserMode.FAST
+    ) -> Iterator[pa.Table]:
+        """
+        Re-runs standardization and personification of all archived games in worker processes,
+        one task per range of frames. Yields personified tables in archive order. Movetext features
+        of games downloaded with moves are derived again too, by parser_mode like during export.
+        """
+        frames = self.frames()
+        tasks_count = max(1, min(len(frames), workers * TASKS_PER_WORKER))
+        bounds = [len(frames) * i // tasks_count for i in range(tasks_count + 1)]
+        tasks = [frames[bounds[i] : bounds[i + 1]] for i in range(tasks_count)]
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(
+                reprocess_frames,
+                [self.archive_path] * len(tasks),
+                tasks,
+                [self.username] * len(tasks),
+                [parser_mode] * len(tasks),
+                [self.with_moves] * len(tasks),
+            )
+
+
+def reprocess_frames(
+    archive_path: str, frames: list[tuple[int, int]], username: str, parser_mode: str, with_moves: bool
+) -> pa.Table:
+    """Worker of PGNArchive.reprocess: games of the frames -> personified table"""
+    tables = []
+    # this is a worker process already - movetext is analyzed in it
+    analyzer = MovetextAnalyzer(1, parser_mode) if with_moves else None
+    with open(archive_path, "rb") as archive_file:
+        for offset, length in frames:
+            frame_text = PGNArchive.read_frame(archive_file, offset, length)
+            headers = list(PGNHeaderParser.parse_games_headers([frame_text], parser_mode, keep_movetext=with_moves))
+            features = MovetextAnalyzer.to_table(analyzer.analyze(headers)) if analyzer else None
+            tables.append(ColumnarHelper.transform_headers(headers, username, features))
+    return pa.concat_tables(tables) if tables else PERSONIFIED_SCHEMA.empty_table()
+
+
+class PGNArchiveWriter:
+    """
+    Writes raw PGN of downloaded games into PGNArchive, see PGNArchive for the layout.
+
+    Games may come from several threads (time window shards) and more than once (resumed
+    downloads) - they are archived once per game id, in order of arrival.
+    New archive is written under a temporary name and moved into place on successful close.
+    In append mode frames are added to the end of the existing archive (truncated back on abort).
+    """
+
+    def __init__(
+        self,
+        archive_path: str,
+        username: str,
+        append: bool = False,
+        frame_games: int = FRAME_GAMES,
+        with_moves: bool = False,
+    ):
+        self.archive_path = archive_path
+        self.username = username
+        self.with_moves = with_moves
+        self.frame_games = frame_games
+        self.append = append and os.path.exists(archive_path)
+        self.write_path = archive_path if self.append else f"{archive_path}.tmp"
+        self.lock = threading.Lock()
+
+        self.index_columns = {name: [] for name in INDEX_SCHEMA.names}
+        if self.append:
+            existing_index = pq.read_table(PGNArchive.index_path(archive_path))
+            self.with_moves = self.with_moves or PGNArchive(archive_path).with_moves
+            for name in INDEX_SCHEMA.names:
+                self.index_columns[name] = existing_index[name].to_pylist()
+        self.archived_ids = set(self.index_columns["GameId"])
+
+        self.archive_file = open(self.write_path, "ab" if self.append else "wb")
+        self.initial_size = self.archive_file.tell()
+        self.frame_texts: list[str] = []
+        self.frame_games_index: list[tuple[str, Optional[int]]] = []
+
+    def add(self, game_text: str, header: PGNGameHeader) -> None:
+        game_id = LichessAPIHelper.game_id_from_site(header.Site or "")
+        time_range = LichessAPIHelper.pgn_game_time_range((header.UTCDate, header.UTCTime))
+        with self.lock:
+            if game_id in self.archived_ids:
+                return
+            self.archived_ids.add(game_id)
+            # games are separated by an empty line, like in the API response
+            self.frame_texts.append(game_text.rstrip("\n") + "\n\n\n")
+            self.frame_games_index.append((game_id, time_range[0] if time_range else None))
+            if len(self.frame_texts) >= self.frame_games:
+                self.flush_frame()
+
+    def flush_frame(self) -> None:
+        if not self.frame_texts:
+            return
+        frame = gzip.compress("".join(self.frame_texts).encode("utf-8"))
+        offset = self.archive_file.tell()
+        self.archive_file.write(frame)
+
+        for game_id, game_ts in self.frame_games_index:
+            self.index_columns["GameId"].append(game_id)
+            self.index_columns["UTCDateTime"].append(game_ts)
+            self.index_columns["FrameOffset"].append(offset)
+            self.index_columns["FrameLength"].append(len(frame))
+        self.frame_texts, self.frame_games_index = [], []
+
+    def close(self) -> None:
+        self.flush_frame()
+        self.archive_file.flush()
+        os.fsync(self.archive_file.fileno())
+        self.archive_file.close()
+
+        index = pa.Table.from_pydict(self.index_columns, schema=INDEX_SCHEMA)
+        index = index.replace_schema_metadata(
+            {"username": self.username, "moves": "true" if self.with_moves else "false"}
+        )
+        index_path = PGNArchive.index_path(self.archive_path)
+        pq.write_table(index, f"{index_path}.tmp")
+        os.replace(self.write_path, self.archive_path)
+        os.replace(f"{index_path}.tmp", index_path)
+
+    def abort(self) -> None:
+        if self.append:
+            self.archive_file.truncate(self.initial_size)
+            self.archive_file.close()
+            return
+        self.archive_file.close()
+        os.remove(self.write_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
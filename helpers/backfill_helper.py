@@ -0,0 +1,208 @@
+import glob
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, Optional
+
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from helpers.lichess_api_helper import (
+    EXPORT_BY_IDS_MAX_IDS,
+    APIParams_ExportByIds,
+    LichessAPIHelper,
+)
+from helpers.pipeline_helper import (
+    ARROW_TO_DUCKDB_TYPES,
+    DUCKDB_GAME_ID_SQL,
+    DUCKDB_TABLE,
+    PGNGameHeaderPersonified,
+    PipelineHelper,
+    arrow_schema_for,
+)
+
+DETAILS_FILE_SUFFIX = ".details.parquet"
+DUCKDB_DETAILS_TABLE = "game_details"
+
+DETAILS_SCHEMA = pa.schema(
+    [
+        pa.field("GameId", pa.string()),
+        pa.field("Moves", pa.string()),  # SAN, space-separated
+        pa.field("PlyCount", pa.int64()),
+        pa.field("Clocks", pa.list_(pa.int32())),  # centiseconds left after every ply
+        # server analysis per ply (null lists - game was not analysed): centipawns from White's
+        # point of view, or moves to mate (negative - Black mates) where Evals is null
+        pa.field("Evals", pa.list_(pa.int32())),
+        pa.field("Mates", pa.list_(pa.int32())),
+    ]
+)
+
+DUCKDB_DETAILS_TYPES = {**ARROW_TO_DUCKDB_TYPES, pa.list_(pa.int32()): "INTEGER[]"}
+
+BACKFILL_PARAMS = APIParams_ExportByIds(moves=True, clocks=True, evals=True, opening=False)
+
+
+class GameDetails:
+    """
+    Details of exported games which the export doesn't download (moves, clocks, server analysis),
+    backfilled for selected games only with POST api/games/export/_ids.
+
+    Details are keyed by game id and kept next to the games: in <output>.details.parquet for
+    file outputs, in the game_details table of a DuckDB output. Games are rewritten and appended
+    by exports with a fixed schema, so details live in their own table and are joined by GameId
+    (see README); backfilling a game again replaces its details.
+
+    Batches stored during a backfill go to part files (<output>.details.parquet.part-NNNNNN),
+    which are merged into the details file once, by compact() - the details file isn't rewritten
+    with every batch. Part files of an interrupted backfill are read along with it.
+    """
+
+    def __init__(self, output_path: str, output_format: str):
+        self.output_path = output_path
+        self.output_format = output_format
+
+    @classmethod
+    def details_path(cls, output_path: str) -> str:
+        return f"{output_path}{DETAILS_FILE_SUFFIX}"
+
+    @classmethod
+    def part_paths(cls, output_path: str) -> list[str]:
+        """Part files of the details file, in the order they were written"""
+        return sorted(glob.glob(f"{glob.escape(cls.details_path(output_path))}.part-*[0-9]"))
+
+    @classmethod
+    def from_api_json(cls, game: dict) -> dict:
+        """Row of DETAILS_SCHEMA from a game exported as JSON with BACKFILL_PARAMS"""
+        moves = game.get("moves") or ""
+        analysis = game.get("analysis")
+        return {
+            "GameId": game["id"],
+            "Moves": moves,
+            "PlyCount": len(moves.split()),
+            "Clocks": game.get("clocks"),
+            "Evals": [ply.get("eval") for ply in analysis] if analysis is not None else None,
+            "Mates": [ply.get("mate") for ply in analysis] if analysis is not None else None,
+        }
+
+    @classmethod
+    def select_game_ids(cls, output_path: str, output_format: str, where: Optional[str] = None) -> list[str]:
+        """
+        Ids of exported games, oldest first, optionally filtered by a DuckDB SQL condition
+        over the games columns, e.g. "OpeningFamily = 'Sicilian Defense' AND ResultLose = 1"
+        """
+        condition = f"WHERE {where}" if where else ""
+        query = (
+            f"SELECT {DUCKDB_GAME_ID_SQL} AS GameId FROM {DUCKDB_TABLE} {condition} "
+            f"GROUP BY 1 ORDER BY min(UTCDateTime), 1"
+        )
+        if output_format == "duckdb":
+            with duckdb.connect(output_path, read_only=True) as connection:
+                return [row[0] for row in connection.sql(query).fetchall()]
+
+        schema = arrow_schema_for(PGNGameHeaderPersonified)
+        games = pa.concat_tables(PipelineHelper.read_output(output_format, output_path, schema.names))
+        with duckdb.connect() as connection:
+            connection.register(DUCKDB_TABLE, games)
+            return [row[0] for row in connection.sql(query).fetchall()]
+
+    def load(self) -> pa.Table:
+        """Details backfilled so far"""
+        if self.output_format == "duckdb":
+            with duckdb.connect(self.output_path, read_only=True) as connection:
+                tables = connection.sql("SELECT table_name FROM information_schema.tables").fetchall()
+                if (DUCKDB_DETAILS_TABLE,) not in tables:
+                    return DETAILS_SCHEMA.empty_table()
+                details = connection.sql(f"SELECT * FROM {DUCKDB_DETAILS_TABLE}").fetch_arrow_table()
+                return details.cast(DETAILS_SCHEMA)
+
+        details_path = self.details_path(self.output_path)
+        paths = ([details_path] if os.path.exists(details_path) else []) + self.part_paths(self.output_path)
+        tables = [pq.read_table(path) for path in paths]
+        if not tables:
+            return DETAILS_SCHEMA.empty_table()
+        if len(tables) == 1:
+            return tables[0]
+
+        # details of a game backfilled again (a later part) replace its earlier details
+        kept, later_ids = [], pa.array([], pa.string())
+        for table in reversed(tables):
+            table = table.filter(pc.invert(pc.is_in(table["GameId"], value_set=later_ids)))
+            kept.append(table)
+            later_ids = pa.concat_arrays([later_ids, table["GameId"].combine_chunks()])
+        return pa.concat_tables(reversed(kept))
+
+    def backfilled_ids(self) -> set[str]:
+        return set(self.load()["GameId"].to_pylist())
+
+    @classmethod
+    def create_table(cls, connection: duckdb.DuckDBPyConnection) -> None:
+        columns = ", ".join(f"{field.name} {DUCKDB_DETAILS_TYPES[field.type]}" for field in DETAILS_SCHEMA)
+        connection.execute(f"CREATE TABLE IF NOT EXISTS {DUCKDB_DETAILS_TABLE} ({columns}, PRIMARY KEY (GameId))")
+
+    def add(self, details: pa.Table) -> None:
+        """
+        Stores details of a batch of games (atomically - all of them or none): upserted by game id
+        into the DuckDB table, or written into a new part file (see compact)
+        """
+        details = details.cast(DETAILS_SCHEMA)
+        if self.output_format == "duckdb":
+            with duckdb.connect(self.output_path) as connection:
+                self.create_table(connection)
+                connection.begin()
+                connection.register("details", details)
+                connection.execute(f"INSERT OR REPLACE INTO {DUCKDB_DETAILS_TABLE} SELECT * FROM details")
+                connection.commit()
+            return
+
+        part_paths = self.part_paths(self.output_path)
+        index = int(part_paths[-1].rsplit("-", 1)[1]) + 1 if part_paths else 1
+        part_path = f"{self.details_path(self.output_path)}.part-{index:06d}"
+        pq.write_table(details, f"{part_path}.tmp")
+        os.replace(f"{part_path}.tmp", part_path)
+
+    def compact(self) -> None:
+        """Merges the part files into the details file, upserting by game id (a no-op for DuckDB outputs)"""
+        part_paths = self.part_paths(self.output_path)
+        if self.output_format == "duckdb" or not part_paths:
+            return
+
+        details_path = self.details_path(self.output_path)
+        pq.write_table(self.load(), f"{details_path}.tmp")
+        os.replace(f"{details_path}.tmp", details_path)
+        # details of the parts are in the details file now, so a crash here leaves only duplicates
+        for part_path in part_paths:
+            os.remove(part_path)
+
+    def merge(self, details: pa.Table) -> None:
+        """Upserts details by game id (atomically - all of them or none)"""
+        self.add(details)
+        self.compact()
+
+    @classmethod
+    def fetch(
+        cls,
+        api_helper: LichessAPIHelper,
+        game_ids: list[str],
+        concurrency: int,
+        batch_size: int = EXPORT_BY_IDS_MAX_IDS,
+    ) -> Iterator[pa.Table]:
+        """
+        Downloads details of the games in batches of batch_size ids, `concurrency` requests
+        at a time (all of them wait for the rate limiter of api_helper). Yields a table per batch
+        as batches complete.
+        """
+        batches = list(PipelineHelper.batched(game_ids, min(batch_size, EXPORT_BY_IDS_MAX_IDS)))
+
+        def fetch_batch(batch: list[str]) -> pa.Table:
+            games = api_helper.export_games_by_ids(batch, BACKFILL_PARAMS)
+            return pa.Table.from_pylist([cls.from_api_json(game) for game in games], schema=DETAILS_SCHEMA)
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="backfill") as executor:
+            futures = [executor.submit(fetch_batch, batch) for batch in batches]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
@@ -0,0 +1,179 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+from urllib.parse import urlencode
+
+from helpers.options_helper import DEFAULT_CACHE_MAX_SIZE
+
+# size of decompressed text chunks read from a cached response
+CACHE_CHUNK_SIZE = 64 * 1024
+
+# games created before `until` may still be played (or be re-rated) for a while, a window
+# is treated as immutable only when it ended this long ago (correspondence games can take longer)
+IMMUTABLE_AFTER_SECONDS = 24 * 60 * 60
+
+
+class ResponseCacheMiss(Exception):
+    """Response is not in the cache in offline mode"""
+
+    pass
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    # requests which can't be cached (window not entirely in the past)
+    bypassed: int = 0
+
+    def summary(self) -> str:
+        requests = self.hits + self.misses + self.bypassed
+        hit_rate = self.hits / requests if requests else 0.0
+        return (
+            f"{self.hits} hits, {self.misses} misses, {self.bypassed} not cacheable "
+            f"(hit rate {hit_rate:.0%})"
+        )
+
+
+class ResponseCache:
+    """
+    On-disk cache of raw API responses (gzip-compressed text), for requests for time windows
+    which are entirely in the past - games of a finished period never change.
+
+    Entries are files named by the SHA-256 of the request (api path + normalized params),
+    so the same request always maps to the same entry. A response is stored only when it
+    was received completely - for games requests, all of their games, even if the download
+    was resumed (see LichessAPIHelper.iter_games_resumable). When the total size exceeds max_size, least recently used
+    entries (by mtime, which is refreshed on every hit) are evicted.
+
+    In offline mode nothing is downloaded: requests are served from the cache or fail.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = DEFAULT_CACHE_MAX_SIZE, offline: bool = False):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.offline = offline
+        self.stats = CacheStats()
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def request_key(cls, api_path: str, params: Optional[dict], accept: Optional[str]) -> str:
+        # None values are not sent, and param order doesn't matter
+        normalized = {name: value for name, value in (params or {}).items() if value is not None}
+        request = json.dumps([api_path, normalized, accept], sort_keys=True)
+        return hashlib.sha256(request.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def is_immutable(cls, params: Optional[dict]) -> bool:
+        """Window ended long enough ago (no `until` means "up to now" - never immutable)"""
+        until = (params or {}).get("until")
+        return until is not None and until / 1000 < time.time() - IMMUTABLE_AFTER_SECONDS
+
+    def entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.gz")
+
+    def _count(self, stat: str) -> None:
+        with self.lock:
+            setattr(self.stats, stat, getattr(self.stats, stat) + 1)
+
+    def get_stream(
+        self,
+        api_path: str,
+        params: Optional[dict],
+        accept: Optional[str],
+        download: Callable[[], Iterator[str]],
+    ) -> Iterator[str]:
+        """Yields response text chunks from the cache, or from download() storing them on the way"""
+        cached_chunks = self.lookup(api_path, params, accept)
+        if cached_chunks is not None:
+            yield from cached_chunks
+            return
+
+        with self.new_entry(api_path, params, accept) as entry:
+            for chunk in download():
+                entry.write(chunk)
+                yield chunk
+
+    def lookup(self, api_path: str, params: Optional[dict], accept: Optional[str]) -> Optional[Iterator[str]]:
+        """Text chunks of the cached response, None if it's not cached (ResponseCacheMiss in offline mode)"""
+        path = self.entry_path(self.request_key(api_path, params, accept))
+        if os.path.exists(path):
+            self._count("hits")
+            os.utime(path)  # most recently used
+            return self.read_entry(path)
+
+        if self.offline:
+            query = urlencode({name: value for name, value in (params or {}).items() if value is not None})
+            raise ResponseCacheMiss(f"Offline mode: response for {api_path}?{query} is not cached")
+        return None
+
+    def new_entry(self, api_path: str, params: Optional[dict], accept: Optional[str]) -> "CacheEntryWriter":
+        """Writer of the response to a request which is not cached, a no-op if the request can't be cached"""
+        if not self.is_immutable(params):
+            self._count("bypassed")
+            return CacheEntryWriter(self, None)
+
+        self._count("misses")
+        return CacheEntryWriter(self, self.entry_path(self.request_key(api_path, params, accept)))
+
+    def read_entry(self, path: str) -> Iterator[str]:
+        with gzip.open(path, "rt", encoding="utf-8", newline="") as entry:
+            while chunk := entry.read(CACHE_CHUNK_SIZE):
+                yield chunk
+
+    def evict(self) -> None:
+        """Removes least recently used entries until the cache fits into max_size"""
+        with self.lock:
+            entries = []
+            for dir_path, _, file_names in os.walk(self.cache_dir):
+                for file_name in file_names:
+                    if file_name.endswith(".gz"):
+                        stat = os.stat(os.path.join(dir_path, file_name))
+                        entries.append((stat.st_mtime_ns, stat.st_size, os.path.join(dir_path, file_name)))
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total_size <= self.max_size:
+                    break
+                os.remove(path)
+                total_size -= size
+
+
+class CacheEntryWriter:
+    """
+    Context manager storing response text written into it as a cache entry. The entry appears
+    only if the block completes - not after a broken download or a consumer which stopped early.
+    """
+
+    def __init__(self, cache: ResponseCache, path: Optional[str]):
+        self.cache = cache
+        self.path = path
+        self.tmp_path = None
+        self.entry = None
+
+    def __enter__(self) -> "CacheEntryWriter":
+        if self.path is not None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            self.entry = gzip.open(self.tmp_path, "wt", encoding="utf-8", newline="")
+        return self
+
+    def write(self, text: str) -> None:
+        if self.entry is not None:
+            self.entry.write(text)
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self.entry is None:
+            return
+        self.entry.close()
+        if exc_type is None:
+            os.replace(self.tmp_path, self.path)
+            self.cache.evict()
+        else:
+            os.remove(self.tmp_path)
@@ -0,0 +1,220 @@
+from dataclasses import fields
+from operator import attrgetter
+from typing import Callable, Optional
+
+import pyarrow as pa
+
+from helpers.pgn_parser_helper import PGNGameHeader
+from helpers.pipeline_helper import (
+    PGNGameHeaderPersonified,
+    PGNGameHeaderStandardized,
+    arrow_schema_for,
+    pc,
+)
+
+# raw header tags used by standardization
+RAW_COLUMNS = [
+    "Event",
+    "Site",
+    "Date",
+    "Round",
+    "White",
+    "Black",
+    "Result",
+    "UTCDate",
+    "UTCTime",
+    "WhiteElo",
+    "BlackElo",
+    "WhiteRatingDiff",
+    "BlackRatingDiff",
+    "Variant",
+    "TimeControl",
+    "ECO",
+    "Opening",
+    "WhiteTitle",
+    "BlackTitle",
+    "Termination",
+]
+
+RAW_SCHEMA = pa.schema([pa.field(name, pa.string()) for name in RAW_COLUMNS])
+STANDARDIZED_SCHEMA = arrow_schema_for(PGNGameHeaderStandardized)
+PERSONIFIED_SCHEMA = arrow_schema_for(PGNGameHeaderPersonified)
+
+RESULT_VALUES = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+
+# plain numbers Arrow casts the same way as int()/float(); anything else goes through the reference parser
+INT_REGEX = r"^[+-]?[0-9]+$"
+FLOAT_REGEX = r"^[+-]?([0-9]+\.?[0-9]*|\.[0-9]+)([eE][+-]?[0-9]+)?$"
+
+UTC_DATETIME_FORMAT = "%Y.%m.%d %H:%M:%S"
+
+# Player's column <- (column if Player is White, column if Player is Black)
+PERSONIFIED_SWAPS = {
+    "Player": ("White", "Black"),
+    "Opponent": ("Black", "White"),
+    "PlayerElo": ("WhiteElo", "BlackElo"),
+    "OpponentElo": ("BlackElo", "WhiteElo"),
+    "PlayerRatingChange": ("WhiteRatingChange", "BlackRatingChange"),
+    "OpponentRatingChange": ("BlackRatingChange", "WhiteRatingChange"),
+    "PlayerTitle": ("WhiteTitle", "BlackTitle"),
+    "OpponentTitle": ("BlackTitle", "WhiteTitle"),
+    "PlayerTimeLeft": ("WhiteTimeLeft", "BlackTimeLeft"),
+    "OpponentTimeLeft": ("BlackTimeLeft", "WhiteTimeLeft"),
+    "PlayerAvgMoveTime": ("WhiteAvgMoveTime", "BlackAvgMoveTime"),
+    "OpponentAvgMoveTime": ("BlackAvgMoveTime", "WhiteAvgMoveTime"),
+    "PlayerMovesUnder10s": ("WhiteMovesUnder10s", "BlackMovesUnder10s"),
+    "OpponentMovesUnder10s": ("BlackMovesUnder10s", "WhiteMovesUnder10s"),
+}
+
+
+class ColumnarHelper:
+    """
+    Batch (column-at-a-time) version of PGNGameHeaderStandardized.from_pgn_header and
+    PGNGameHeaderPersonified.from_pgn_header_std, producing identical values as Arrow tables.
+
+    Dates, numbers, results and the White/Black swap are Arrow compute kernels. Time controls
+    and openings have few distinct values, so the per-row classmethods run once per distinct
+    value and the results are spread back over the rows.
+    """
+
+    @classmethod
+    def headers_to_table(cls, headers: list[PGNGameHeader]) -> pa.Table:
+        """Raw PGN headers -> table of string columns (RAW_COLUMNS)"""
+        if not headers:
+            return RAW_SCHEMA.empty_table()
+        rows = map(attrgetter(*RAW_COLUMNS), headers)
+        columns = [pa.array(column, pa.string()) for column in zip(*rows)]
+        return pa.Table.from_arrays(columns, schema=RAW_SCHEMA)
+
+    @classmethod
+    def map_distinct(
+        cls, column: pa.ChunkedArray, func: Callable, output_types: list[pa.DataType]
+    ) -> list[pa.Array]:
+        """
+        Applies func (returning a tuple of len(output_types) values) to every distinct value
+        of the column, and returns the outputs as columns aligned with the input rows.
+        """
+        # nulls are encoded as a regular value, so func decides what they become
+        encoded = pc.dictionary_encode(column, null_encoding="encode").combine_chunks()
+        outputs = [func(value) for value in encoded.dictionary.to_pylist()]
+        return [
+            pa.array([output[i] for output in outputs], output_type).take(encoded.indices)
+            for i, output_type in enumerate(output_types)
+        ]
+
+    @classmethod
+    def cast_numbers(
+        cls,
+        column: pa.ChunkedArray,
+        number_regex: str,
+        output_type: pa.DataType,
+        parse: Callable[[Optional[str]], Optional[float]],
+    ) -> pa.ChunkedArray:
+        """Casts strings to numbers, unparseable/blank values become null (like str_to_int/str_to_float)"""
+        trimmed = pc.utf8_trim_whitespace(column)
+        is_plain = pc.fill_null(pc.match_substring_regex(trimmed, number_regex), False)
+        # Arrow's integer parser doesn't accept explicit "+" sign
+        numbers = pc.cast(pc.if_else(is_plain, pc.utf8_ltrim(trimmed, "+"), None), output_type)
+
+        is_other = pc.and_(pc.invert(is_plain), pc.invert(pc.equal(trimmed, "")))
+        if not pc.any(is_other).as_py():
+            return numbers
+        # rare non-plain values (e.g. "1_500", unicode digits) - parsed by the reference
+        (others,) = cls.map_distinct(column, lambda value: (parse(value),), [output_type])
+        return pc.if_else(is_other, others, numbers)
+
+    @classmethod
+    def parse_utc_datetimes(cls, utcdate: pa.ChunkedArray, utctime: pa.ChunkedArray) -> pa.ChunkedArray:
+        # null UTCDate or UTCTime gives null datetime
+        joined = pc.binary_join_element_wise(utcdate, utctime, " ")
+        try:
+            naive = pc.strptime(joined, format=UTC_DATETIME_FORMAT, unit="us")
+        except pa.ArrowInvalid as e:
+            raise ValueError(f"Invalid UTCDate or UTCTime format: {e}")
+        return pc.cast(naive, pa.timestamp("us", tz="UTC"))
+
+    @classmethod
+    def standardize_batch(cls, raw: pa.Table, features: Optional[pa.Table] = None) -> pa.Table:
+        """
+        Table of raw headers (see headers_to_table) -> table of PGNGameHeaderStandardized columns.
+        Movetext features of the games (see MovetextAnalyzer.to_table), if given, fill in their columns.
+        """
+        std = PGNGameHeaderStandardized
+        columns = {
+            name: raw[name]
+            for name in ("Event", "Site", "Date", "Round", "White", "Black", "Variant", "ECO")
+        }
+        columns.update(
+            WhiteTitle=raw["WhiteTitle"],
+            BlackTitle=raw["BlackTitle"],
+            Termination=raw["Termination"],
+            TimeControlSec=raw["TimeControl"],
+        )
+
+        result_index = pc.index_in(raw["Result"], value_set=pa.array(list(RESULT_VALUES)))
+        columns["Result"] = pa.array(list(RESULT_VALUES.values()), pa.float64()).take(result_index)
+        columns["UTCDateTime"] = cls.parse_utc_datetimes(raw["UTCDate"], raw["UTCTime"])
+
+        for color in ("White", "Black"):
+            columns[f"{color}Elo"] = cls.cast_numbers(
+                raw[f"{color}Elo"], INT_REGEX, pa.int64(), std.str_to_int
+            )
+            columns[f"{color}RatingChange"] = cls.cast_numbers(
+                raw[f"{color}RatingDiff"], FLOAT_REGEX, pa.float64(), std.str_to_float
+            )
+
+        def time_control(tc: str) -> tuple[str, str]:
+            mins_initial, secs_increment = std.parse_timecontrol(tc)
+            return (
+                std.format_timecontrol(mins_initial, secs_increment),
+                std.get_timecontrol_type(mins_initial, secs_increment),
+            )
+
+        columns["TimeControl"], columns["TimeControlType"] = cls.map_distinct(
+            raw["TimeControl"], time_control, [pa.string(), pa.string()]
+        )
+        (
+            columns["OpeningFamily"],
+            columns["OpeningVariation"],
+            columns["OpeningSubVariation"],
+        ) = cls.map_distinct(raw["Opening"], std.split_opening, [pa.string()] * 3)
+
+        for field in STANDARDIZED_SCHEMA:
+            if field.name not in columns:
+                columns[field.name] = (
+                    features[field.name] if features is not None else pa.nulls(raw.num_rows, field.type)
+                )
+
+        return pa.Table.from_pydict(columns, schema=STANDARDIZED_SCHEMA)
+
+    @classmethod
+    def personify_batch(cls, std: pa.Table, player_name: str) -> pa.Table:
+        """Table of PGNGameHeaderStandardized columns -> table of PGNGameHeaderPersonified columns"""
+        is_white = pc.fill_null(pc.equal(std["White"], player_name), False)
+        is_black = pc.fill_null(pc.equal(std["Black"], player_name), False)
+        if pc.any(pc.invert(pc.or_(is_white, is_black))).as_py():
+            raise ValueError(f"Player {player_name} is not in the game")
+
+        columns = {
+            name: pc.if_else(is_white, std[white_column], std[black_column])
+            for name, (white_column, black_column) in PERSONIFIED_SWAPS.items()
+        }
+        columns["Color"] = pc.if_else(is_white, "White", "Black")
+
+        result = pc.if_else(is_white, std["Result"], pc.subtract(1.0, std["Result"]))
+        columns["Result"] = result
+        for name, value in (("ResultWin", 1.0), ("ResultDraw", 0.5), ("ResultLose", 0.0)):
+            columns[name] = pc.cast(pc.fill_null(pc.equal(result, value), False), pa.int64())
+
+        for field in fields(PGNGameHeaderPersonified):
+            if field.name not in columns:
+                columns[field.name] = std[field.name]
+
+        return pa.Table.from_pydict(columns, schema=PERSONIFIED_SCHEMA)
+
+    @classmethod
+    def transform_headers(
+        cls, headers: list[PGNGameHeader], player_name: str, features: Optional[pa.Table] = None
+    ) -> pa.Table:
+        """Raw PGN headers -> personified table, the batch equivalent of from_pgn_header + from_pgn_header_std"""
+        return cls.personify_batch(cls.standardize_batch(cls.headers_to_table(headers), features), player_name)
@@ -0,0 +1,206 @@
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+import pyarrow as pa
+
+from helpers.columnar_helper import PERSONIFIED_SCHEMA, ColumnarHelper
+from helpers.lichess_api_helper import ChessPerfType
+from helpers.pgn_parser_helper import PGNGameHeader, PGNHeaderParser
+from helpers.pipeline_helper import VARIANT_NAMES, PGNGameHeaderStandardized, TimeControlType
+
+try:
+    import zstandard  # optional, needed for .pgn.zst database dumps only
+except ImportError:
+    zstandard = None
+
+# decompressed bytes per parsing task - large enough to amortize inter-process transfer
+DUMP_CHUNK_SIZE = 16 * 2**20
+
+# chunks handed to workers (or waiting for the consumer) per worker - bounds memory
+CHUNKS_IN_FLIGHT_PER_WORKER = 2
+
+# games of a dump are separated by an empty line followed by the first tag of the next game
+GAME_BOUNDARY = b"\n\n["
+
+# White and Black are adjacent in every dump game, matched in raw bytes before any other parsing
+# (not anchored to line starts - a pattern starting with a literal is searched several times faster)
+PLAYERS_REGEX = re.compile(rb'\[White "([^"\n]*)"\]\n\[Black "([^"\n]*)"\]')
+
+# dumps of standard games have no Variant tag
+DEFAULT_VARIANT = VARIANT_NAMES["standard"]
+
+# PGN Variant tag -> lichess perf type, for variants which are perf types on their own
+VARIANT_PERF_TYPES = {
+    name: perf_type
+    for perf_type, name in VARIANT_NAMES.items()
+    if perf_type not in ("standard", "fromPosition")
+}
+
+# TimeControlType (see PGNGameHeaderStandardized.get_timecontrol_type) -> lichess speed
+SPEED_PERF_TYPES = {
+    TimeControlType.ULTRA_BULLET.value: ChessPerfType.ULTRA_BULLET.value,
+    TimeControlType.HYPER_BULLET.value: ChessPerfType.BULLET.value,
+    TimeControlType.BULLET.value: ChessPerfType.BULLET.value,
+    TimeControlType.BLITZ.value: ChessPerfType.BLITZ.value,
+    TimeControlType.RAPID.value: ChessPerfType.RAPID.value,
+    TimeControlType.CLASSIC.value: ChessPerfType.CLASSICAL.value,
+}
+
+CORRESPONDENCE_PERF_TYPE = ChessPerfType.CORRESPONDENCE.value
+
+
+class LichessDump:
+    """
+    Reader of Lichess monthly database dumps (https://database.lichess.org/, lichess_db_*.pgn.zst)
+    or any other local PGN file with a game per header block - plain or zstd-compressed.
+
+    The file is stream-decompressed in the main process and cut into game-aligned chunks of
+    DUMP_CHUNK_SIZE bytes, which worker processes parse, filter and transform into personified
+    tables. Most games of a dump are not played by the requested users, so workers first match
+    the White/Black tags of raw game text against the username set and fully parse only
+    the games which pass.
+
+    Correspondence games (TimeControl "-") are skipped: there is no clock to standardize.
+    """
+
+    def __init__(self, path: str, usernames: Iterable[str], perf_types: Optional[Iterable[str]] = None):
+        self.path = path
+        # Lichess usernames are case-insensitive, dumps have them as displayed
+        self.usernames = frozenset(username.lower() for username in usernames)
+        self.perf_types = frozenset(perf_types) if perf_types else None
+        self.games_scanned = 0
+        self.bytes_read = 0
+
+    @classmethod
+    def open_binary(cls, path: str) -> BinaryIO:
+        """Decompressed byte stream of the dump"""
+        if not path.endswith(".zst"):
+            return open(path, "rb")
+        if zstandard is None:
+            raise RuntimeError("zstandard package is required to read .zst dumps: pip install zstandard")
+        # dumps are compressed with long distance matching - a larger window than the default limit
+        decompressor = zstandard.ZstdDecompressor(max_window_size=2**31)
+        return decompressor.stream_reader(open(path, "rb"), closefd=True)
+
+    def iter_chunks(self, chunk_size: int = DUMP_CHUNK_SIZE) -> Iterator[bytes]:
+        """Game-aligned chunks of decompressed PGN: every chunk ends right before a game starts"""
+        tail = b""
+        with self.open_binary(self.path) as dump_file:
+            while block := dump_file.read(chunk_size):
+                self.bytes_read += len(block)
+                block = tail + block
+                cut = block.rfind(GAME_BOUNDARY)
+                if cut == -1:  # a single game larger than the chunk
+                    tail = block
+                    continue
+                yield block[: cut + 1]
+                tail = block[cut + 2 :]
+        if tail.strip():
+            yield tail
+
+    @classmethod
+    def perf_type(cls, header: PGNGameHeader) -> str:
+        """Lichess perf type of a game (perfType API filter value): variant, or speed of standard games"""
+        if header.Variant in VARIANT_PERF_TYPES:
+            return VARIANT_PERF_TYPES[header.Variant]
+        if header.TimeControl == "-":
+            return CORRESPONDENCE_PERF_TYPE
+        std = PGNGameHeaderStandardized
+        return SPEED_PERF_TYPES[std.get_timecontrol_type(*std.parse_timecontrol(header.TimeControl))]
+
+    def read(self, workers: int, chunk_size: int = DUMP_CHUNK_SIZE) -> Iterator[pa.Table]:
+        """
+        Yields personified tables of the users' games, chunk by chunk in dump order
+        (a game of two requested users gives a row for each of them).
+        """
+        chunks = self.iter_chunks(chunk_size)
+        if workers <= 1:
+            for chunk in chunks:
+                table, games_count = parse_dump_chunk(chunk, self.usernames, self.perf_types)
+                self.games_scanned += games_count
+                yield table
+            return
+
+        # the username set goes to every worker once, chunks are the only per-task payload
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=init_dump_worker,
+            initargs=(self.usernames, self.perf_types),
+        ) as executor:
+            in_flight = deque()
+            try:
+                for chunk in chunks:
+                    in_flight.append(executor.submit(parse_dump_worker_chunk, chunk))
+                    if len(in_flight) >= CHUNKS_IN_FLIGHT_PER_WORKER * workers:
+                        yield self._result(in_flight.popleft())
+                while in_flight:
+                    yield self._result(in_flight.popleft())
+            finally:
+                for future in in_flight:
+                    future.cancel()
+
+    def _result(self, future) -> pa.Table:
+        table, games_count = future.result()
+        self.games_scanned += games_count
+        return table
+
+
+_worker_filter: tuple[frozenset[str], Optional[frozenset[str]]] = (frozenset(), None)
+
+
+def init_dump_worker(usernames: frozenset[str], perf_types: Optional[frozenset[str]]) -> None:
+    global _worker_filter
+    _worker_filter = (usernames, perf_types)
+
+
+def parse_dump_worker_chunk(chunk: bytes) -> tuple[pa.Table, int]:
+    return parse_dump_chunk(chunk, *_worker_filter)
+
+
+def parse_dump_chunk(
+    chunk: bytes, usernames: frozenset[str], perf_types: Optional[frozenset[str]]
+) -> tuple[pa.Table, int]:
+    """Worker of LichessDump.read: chunk of a dump -> (personified table of the users' games, games in the chunk)"""
+    # usernames are ASCII, so lowercase bytes of names in the dump can be compared to them directly
+    usernames_bytes = frozenset(username.encode("utf-8") for username in usernames)
+    games_count = 0
+    headers: list[PGNGameHeader] = []
+    players: list[list[str]] = []
+
+    # the chunk is scanned for player tags as a whole, only games of the users are cut out and decoded
+    for match in PLAYERS_REGEX.finditer(chunk):
+        games_count += 1
+        game_players = [name for name in match.groups() if name.lower() in usernames_bytes]
+        if not game_players:
+            continue
+
+        # the game spans from the previous boundary (or chunk start) to the next one (or chunk end)
+        game_start = chunk.rfind(GAME_BOUNDARY, 0, match.start()) + 1
+        game_end = chunk.find(GAME_BOUNDARY, match.end())
+        game_text = chunk[game_start : game_end if game_end != -1 else len(chunk)].decode("utf-8")
+        header = PGNHeaderParser.to_pgn_header(PGNHeaderParser.parse_tags(game_text))
+        if header.Variant is None:
+            header.Variant = DEFAULT_VARIANT
+        perf_type = LichessDump.perf_type(header)
+        if perf_type == CORRESPONDENCE_PERF_TYPE or (perf_types and perf_type not in perf_types):
+            continue
+        headers.append(header)
+        players.append([name.decode("utf-8") for name in game_players])
+
+    if not headers:
+        return PERSONIFIED_SCHEMA.empty_table(), games_count
+
+    # standardized once per chunk, personified once per player found in it
+    std = ColumnarHelper.standardize_batch(ColumnarHelper.headers_to_table(headers))
+    rows_by_player: dict[str, list[int]] = {}
+    for row, game_players in enumerate(players):
+        for player in game_players:
+            rows_by_player.setdefault(player, []).append(row)
+
+    tables = [
+        ColumnarHelper.personify_batch(std.take(rows), player)
+        for player, rows in rows_by_player.items()
+    ]
+    return pa.concat_tables(tables), games_count
@@ -0,0 +1,34 @@
+import importlib
+import threading
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """
+    Module imported on the first access to its attributes: heavy dependencies (duckdb,
+    pyarrow.dataset, python-chess, urllib3) bound at the top of a helper module as
+    `duckdb = lazy_import("duckdb")` are loaded only by the commands and code paths which use
+    them - e.g. not for --help or a CSV export. After loading, attribute accesses are forwarded
+    to the module without locking. Its attributes are not copied into the proxy: objects of
+    extension modules (duckdb's) referenced from a second module's namespace can outlive the
+    extension at interpreter exit and crash it.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_lock"] = threading.Lock()
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self) -> ModuleType:
+        with self._lazy_lock:
+            if self._lazy_module is None:
+                self.__dict__["_lazy_module"] = importlib.import_module(self.__name__)
+        return self._lazy_module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._lazy_module or self._load(), attribute)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """`import name`, deferred until the module is used (see LazyModule)"""
+    return LazyModule(name)
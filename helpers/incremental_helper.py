@@ -0,0 +1,161 @@
+import csv
+import json
+import os
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from helpers.lichess_api_helper import GameT, LichessAPIHelper
+from helpers.pipeline_helper import DUCKDB_TABLE, DatasetSink, ds, duckdb, pq
+
+STATE_FILE_SUFFIX = ".state.json"
+
+
+@dataclass
+class IncrementalState:
+    """
+    Per-output record of what has already been exported, stored next to the output file.
+
+    The output file is the source of truth: the state remembers size/mtime of the output
+    it describes, and is rebuilt from the output when they don't match (e.g. after a crash
+    between writing rows and saving the state).
+    """
+
+    username: str
+    # UTC timestamp (msec, second precision like UTCDateTime) of the newest exported game
+    last_game_ts: Optional[int] = None
+    # ids of exported games played at last_game_ts - `since` is inclusive, so they come again
+    last_game_ids: list[str] = field(default_factory=list)
+    games_count: int = 0
+    # fingerprint of the output file this state was saved for
+    output_size: Optional[int] = None
+    output_mtime_ns: Optional[int] = None
+
+    @classmethod
+    def state_path(cls, output_path: str) -> str:
+        return f"{output_path}{STATE_FILE_SUFFIX}"
+
+    @classmethod
+    def load(cls, output_path: str, username: str, output_format: str) -> "IncrementalState":
+        """Loads state of the output, making sure it matches output file contents"""
+        state_path = cls.state_path(output_path)
+
+        if not os.path.exists(output_path):
+            return IncrementalState(username)
+        if output_format == "dataset":
+            # files of an append interrupted by a crash are committed or dropped before reading
+            DatasetSink.recover(output_path)
+
+        state = None
+        if os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as state_file:
+                state = IncrementalState(**json.load(state_file))
+            if state.username != username:
+                raise ValueError(
+                    f"Output '{output_path}' holds games of {state.username}, not {username}"
+                )
+
+        if state is not None and output_format == "csv":
+            output_size = os.path.getsize(output_path)
+            if output_size > state.output_size:
+                # rows appended by a run which crashed before saving the state - drop them,
+                # they will be downloaded again
+                with open(output_path, "r+b") as output_file:
+                    output_file.truncate(state.output_size)
+                state.save(output_path)
+
+        if state is None or not state.matches(output_path):
+            print(f"Rebuilding incremental state from '{output_path}'...")
+            state = cls.from_output(output_path, username, output_format)
+            state.save(output_path)
+
+        return state
+
+    @classmethod
+    def from_output(cls, output_path: str, username: str, output_format: str) -> "IncrementalState":
+        state = IncrementalState(username)
+        for site, utc_datetime in cls.read_games_keys(output_path, output_format):
+            state.add_game(site, utc_datetime)
+        return state
+
+    @classmethod
+    def read_games_keys(
+        cls, output_path: str, output_format: str
+    ) -> Iterator[tuple[str, Optional[datetime]]]:
+        """Yields (Site, UTCDateTime) of every game in the output file"""
+        if output_format == "dataset":
+            dataset = ds.dataset(output_path, format="parquet", partitioning="hive")
+            for batch in dataset.to_batches(columns=["Site", "UTCDateTime"]):
+                yield from zip(*batch.to_pydict().values())
+        elif output_format == "duckdb":
+            with duckdb.connect(output_path, read_only=True) as connection:
+                table = connection.sql(f"SELECT Site, UTCDateTime FROM {DUCKDB_TABLE}").fetch_arrow_table()
+            yield from zip(table["Site"].to_pylist(), table["UTCDateTime"].to_pylist())
+        elif output_format == "parquet":
+            parquet_file = pq.ParquetFile(output_path)
+            for batch in parquet_file.iter_batches(columns=["Site", "UTCDateTime"]):
+                yield from zip(*batch.to_pydict().values())
+        else:
+            with open(output_path, newline="", encoding="utf-8") as csvfile:
+                for row in csv.DictReader(csvfile):
+                    utc_datetime = row["UTCDateTime"]
+                    yield row["Site"], datetime.fromisoformat(utc_datetime) if utc_datetime else None
+
+    @classmethod
+    def output_fingerprint(cls, output_path: str) -> tuple[int, int]:
+        """(size, mtime) of the output file, for a dataset directory - total size and the latest mtime of its files"""
+        if not os.path.isdir(output_path):
+            stat = os.stat(output_path)
+            return stat.st_size, stat.st_mtime_ns
+
+        size, mtime_ns = 0, 0
+        for dir_path, _, file_names in os.walk(output_path):
+            for file_name in file_names:
+                stat = os.stat(os.path.join(dir_path, file_name))
+                size += stat.st_size
+                mtime_ns = max(mtime_ns, stat.st_mtime_ns)
+        return size, mtime_ns
+
+    def matches(self, output_path: str) -> bool:
+        return (self.output_size, self.output_mtime_ns) == self.output_fingerprint(output_path)
+
+    def add_game(self, site: str, utc_datetime: Optional[datetime]) -> None:
+        self.games_count += 1
+        if utc_datetime is None:
+            return
+
+        game_ts = int(utc_datetime.timestamp()) * 1000
+        game_id = LichessAPIHelper.game_id_from_site(site)
+        if self.last_game_ts is None or game_ts > self.last_game_ts:
+            self.last_game_ts = game_ts
+            self.last_game_ids = [game_id]
+        elif game_ts == self.last_game_ts:
+            self.last_game_ids.append(game_id)
+
+    def since(self, start_ts: int) -> int:
+        """Timestamp to download games from: right where the previous export stopped"""
+        if self.last_game_ts is None:
+            return start_ts
+        return max(start_ts, self.last_game_ts)
+
+    def filter_new_games(self, games: Iterable[GameT]) -> Iterator[GameT]:
+        """
+        Skips games which are already exported (played at the last exported second).
+        Games are any records with Site - raw PGN headers or personified ones.
+        """
+        exported_ids = set(self.last_game_ids)
+        for game in games:
+            if LichessAPIHelper.game_id_from_site(game.Site) not in exported_ids:
+                yield game
+
+    def save(self, output_path: str) -> None:
+        """Atomically saves state along with fingerprint of the (already committed) output file"""
+        self.output_size, self.output_mtime_ns = self.output_fingerprint(output_path)
+
+        state_path = self.state_path(output_path)
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as state_file:
+            json.dump(asdict(self), state_file, indent=2)
+            state_file.flush()
+            os.fsync(state_file.fileno())
+        os.replace(tmp_path, state_path)
@@ -1,54 +1,40 @@
-import io
-from datetime import datetime
-import enum
-
-
-from typing import Optional, TypedDict
-from dataclasses import dataclass
-
-from chess.pgn import read_game
-
-from helpers.urllib3_helper import Urllib3Helper
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timezone
+import json
+import queue
+import threading
+import time
+
+
+from typing import Callable, Hashable, Iterable, Iterator, Optional, TypedDict, TypeVar
+
+from helpers.cache_helper import ResponseCache
+from helpers.options_helper import EXPORT_BY_IDS_MAX_IDS, APIFormat, ChessPerfType
+from helpers.pgn_parser_helper import PGNGameHeader, PGNHeaderParser, PGNParserMode
+from helpers.stages_helper import StageMetrics, prefetch
+from helpers.urllib3_helper import (
+    RateLimiter,
+    RetryPolicy,
+    Urllib3Helper,
+    Urllib3StreamError,
+)
+
+try:
+    import orjson  # optional, several times faster than json for NDJSON ingestion
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
 
 BASE_URL = "https://lichess.org/"
 
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
 
-@dataclass
-class PGNGameHeader:
-    Event: Optional[str] = None
-    Site: Optional[str] = None
-    Date: Optional[str] = None
-    Round: Optional[str] = None
-
-    White: Optional[str] = None
-    Black: Optional[str] = None
-    Result: Optional[str] = None
-
-    UTCDate: Optional[str] = None
-    UTCTime: Optional[str] = None
-
-    Score: Optional[str] = None
-    WhiteElo: Optional[str] = None
-    BlackElo: Optional[str] = None
-    WhiteRatingDiff: Optional[str] = None
-    BlackRatingDiff: Optional[str] = None
-
-    Variant: Optional[str] = None
-    TimeControl: Optional[str] = None
-
-    ECO: Optional[str] = None
-    Opening: Optional[str] = None
+# games downloaded ahead by a time-window shard while earlier shards are still being consumed
+SHARD_BUFFER_SIZE = 10_000
 
-    WhiteTitle: Optional[str] = None
-    BlackTitle: Optional[str] = None
-    WhiteFideId: Optional[str] = None
-    BlackFideId: Optional[str] = None
-    Termination: Optional[str] = None
-
-    GameId: Optional[str] = None
-
-    FEN: Optional[str] = None
-    SetUp: Optional[str] = None
+GameT = TypeVar("GameT")
 
 
 class APIParams_GetGames(TypedDict):
@@ -73,6 +59,10 @@ class APIParams_GetGames(TypedDict):
     # Include the PGN moves.
     moves: Optional[bool]
 
+    # Default: false
+    # Include clock status when available. Example: [%clk 0:01:40]
+    clocks: Optional[bool]
+
     # Default: false
     # Include the full PGN within the JSON response, in a pgn field. The response type must be set to application/x-ndjson by the request Accept header.
     pgnInJson: Optional[bool]
@@ -81,33 +71,90 @@ class APIParams_GetGames(TypedDict):
     # Include the opening name. Example: [Opening "King's Gambit Accepted, King's Knight Gambit"]
     opening: Optional[bool]
 
+    # Default: "dateDesc"
+    # Enum: "dateAsc" "dateDesc"
+    # Sort order of the games.
+    sort: Optional[str]
+
+
+class APIParams_ExportByIds(TypedDict):
+    # Default: true
+    # Include the PGN moves.
+    moves: Optional[bool]
+
+    # Default: true
+    # Include clock status when available. Example: [%clk 0:01:40]
+    clocks: Optional[bool]
 
-class ChessPerfType(enum.Enum):
-    ULTRA_BULLET = "ultraBullet"
-    BULLET = "bullet"
-    BLITZ = "blitz"
-    RAPID = "rapid"
-    CLASSICAL = "classical"
-    CORRESPONDENCE = "correspondence"
-    CHESS960 = "chess960"
-    CRAZYHOUSE = "crazyhouse"
-    ANTICHESS = "antichess"
-    ATOMIC = "atomic"
-    HORDE = "horde"
-    KING_OF_THE_HILL = "kingOfTheHill"
-    RACING_KINGS = "racingKings"
-    THREE_CHECK = "threeCheck"
+    # Default: true
+    # Include analysis evaluations and comments, when available.
+    evals: Optional[bool]
+
+    # Default: false
+    # Include the opening name.
+    opening: Optional[bool]
 
 
 class LichessAPIHelper(Exception):
     pass
 
 
+class _ShardDone:
+    """End-of-stream marker put into shard queue (carries worker error, if any)"""
+
+    def __init__(self, error: Optional[Exception] = None):
+        self.error = error
+
+
 class LichessAPIHelper:
-    def __init__(self, lichess_api_token: str):
+    def __init__(
+        self,
+        lichess_api_token: str,
+        max_connections: int = 1,
+        rate_limiter: RateLimiter | None = None,
+        retry_policy: RetryPolicy | None = None,
+        base_url: str | None = None,
+        response_cache: ResponseCache | None = None,
+        prefetch_chunks: int = 0,
+        download_metrics: StageMetrics | None = None,
+    ):
         self.lichess_api_token = lichess_api_token
-        self.base_url = BASE_URL
-        self.req_helper = Urllib3Helper(BASE_URL)
+        self.base_url = base_url or BASE_URL
+        # one pool shared by all threads using this helper: connections (and TLS sessions) are reused
+        self.req_helper = Urllib3Helper(
+            self.base_url, max_connections, rate_limiter, retry_policy
+        )
+        self.response_cache = response_cache
+        # response chunks read ahead from the network in a background thread (0 - no read-ahead),
+        # so downloading goes on while the received games are being parsed
+        self.prefetch_chunks = prefetch_chunks
+        self.download_metrics = download_metrics
+
+    def download(
+        self, api_path: str, params: APIParams_GetGames, accept: str | None = None
+    ) -> Iterator[str]:
+        """Streams response text chunks from the network"""
+        chunks = self.req_helper.get_stream(
+            api_path=api_path, params=params, token=self.lichess_api_token, accept=accept
+        )
+        if not self.prefetch_chunks:
+            return chunks
+        return prefetch(
+            chunks,
+            self.prefetch_chunks,
+            self.download_metrics,
+            item_size=lambda chunk: len(chunk) / 2**20,
+        )
+
+    def get_stream(
+        self, api_path: str, params: APIParams_GetGames, accept: str | None = None
+    ) -> Iterator[str]:
+        """Streams response text chunks, through the response cache if there is one"""
+        if self.response_cache is None:
+            return self.download(api_path, params, accept)
+        return self.response_cache.get_stream(
+            api_path, params, accept, lambda: self.download(api_path, params, accept)
+        )
 
     @classmethod
     def generate_timestamps_msec(cls, start_date: str, end_date: str):
@@ -130,6 +177,18 @@ class LichessAPIHelper:
 
         return start_timestamp, end_timestamp
 
+    @classmethod
+    def split_time_range(cls, since: int, until: int, windows: int) -> list[tuple[int, int]]:
+        """Splits [since, until] (msec, inclusive) into non-overlapping consecutive windows"""
+        windows = max(1, min(windows, until - since + 1))
+        bounds = [since + (until - since + 1) * i // windows for i in range(windows + 1)]
+        return [(bounds[i], bounds[i + 1] - 1) for i in range(windows)]
+
+    @classmethod
+    def game_id_from_site(cls, site: str) -> str:
+        """Site tag holds game URL, e.g. https://lichess.org/AbCd1234"""
+        return site.rstrip("/").rsplit("/", 1)[-1]
+
     @classmethod
     def validate_perf_types(cls, perf_types_str: str | None) -> str:
         """
@@ -155,27 +214,289 @@ class LichessAPIHelper:
         return ",".join(in_perf_types)
 
     def get_games_headers(
-        self, username: str, params: APIParams_GetGames
+        self,
+        username: str,
+        params: APIParams_GetGames,
+        parser_mode: str = PGNParserMode.FAST,
     ) -> list[PGNGameHeader]:
         api_path = f"api/games/user/{username}"
-        pgn_response = self.req_helper.get(
-            api_path=api_path, params=params, token=self.lichess_api_token
-        )
+        pgn_response = "".join(self.get_stream(api_path, params))
 
-        # convert pgn_response to a stream readable by read_game
-        pgn_stream = io.StringIO(pgn_response)
+        return list(PGNHeaderParser.parse_games_headers([pgn_response], parser_mode))
 
-        output = []
+    def iter_games_headers(
+        self,
+        username: str,
+        params: APIParams_GetGames,
+        parser_mode: str = PGNParserMode.FAST,
+        on_game: Optional[Callable[[str, PGNGameHeader], None]] = None,
+    ) -> Iterator[PGNGameHeader]:
+        """
+        Streaming version of get_games_headers: games are yielded as soon as they are
+        received, so memory usage does not depend on the number of exported games.
+        on_game(game_text, header) gets raw PGN of every received game (see PGNHeaderParser).
+        When moves are requested, headers carry the movetext of their games (header.Movetext).
+        """
+        api_path = f"api/games/user/{username}"
+        keep_movetext = bool(params.get("moves"))
+
+        def parse(pgn_chunks: Iterable[str]) -> Iterator[tuple[str, PGNGameHeader]]:
+            game_texts = []
+            for header in PGNHeaderParser.parse_games_headers(
+                pgn_chunks, parser_mode, lambda game_text, _: game_texts.append(game_text), keep_movetext
+            ):
+                # games are separated by an empty line, like in the API response
+                yield game_texts.pop().rstrip("\n") + "\n\n\n", header
+
+        for game_text, header in self.iter_games_resumable(
+            api_path, None, parse, self.pgn_game_key, self.pgn_game_time_range, params
+        ):
+            if on_game is not None:
+                on_game(game_text, header)
+            yield header
+
+    @classmethod
+    def pgn_game_key(cls, header: PGNGameHeader) -> tuple[tuple, str]:
+        """(time of the game as in PGN, game id) - compared as strings, parsed only for resume"""
+        game_id = header.GameId or cls.game_id_from_site(header.Site or "")
+        return (header.UTCDate, header.UTCTime), game_id
+
+    @classmethod
+    def pgn_game_time_range(cls, game_time: tuple) -> Optional[tuple[int, int]]:
+        utc_date, utc_time = game_time
+        try:
+            game_dt = datetime.strptime(f"{utc_date} {utc_time}", "%Y.%m.%d %H:%M:%S")
+        except (TypeError, ValueError):
+            return None
+        # PGN time has second precision - game was created within that second
+        game_ts = int(game_dt.replace(tzinfo=timezone.utc).timestamp()) * 1000
+        return game_ts, game_ts + 999
+
+    def iter_games_resumable(
+        self,
+        api_path: str,
+        accept: str | None,
+        parse: Callable[[Iterable[str]], Iterator[tuple[str, GameT]]],
+        game_key: Callable[[GameT], tuple[Hashable, str]],
+        game_time_range: Callable[[Hashable], Optional[tuple[int, int]]],
+        params: APIParams_GetGames,
+    ) -> Iterator[tuple[str, GameT]]:
+        """
+        Yields (game text, game) of the games of a streamed GET request; parse(chunks) gives them
+        from the response text. If the stream breaks midway, the download is resumed (with backoff,
+        up to retry_policy.max_retries times in a row without progress) from the time of the last
+        fully received game instead of from the very beginning.
+
+        game_key(game) gives (game time, game id); game_time_range(game time) gives msec range
+        the game time stands for. Games at the resume time are sent again and skipped by id.
+
+        The response cache keeps the request as a whole: texts of the yielded games - of all the
+        resumed requests, without the repeated ones - are stored under the original params.
+        """
+        cached_chunks = None
+        if self.response_cache is not None:
+            cached_chunks = self.response_cache.lookup(api_path, params, accept)
+        if cached_chunks is not None:
+            yield from parse(cached_chunks)
+            return
+
+        cache_entry = None
+        if self.response_cache is not None:
+            cache_entry = self.response_cache.new_entry(api_path, params, accept)
+        with cache_entry or nullcontext():
+            for game_text, game in self.iter_games_downloads(
+                api_path, accept, parse, game_key, game_time_range, params
+            ):
+                if cache_entry is not None:
+                    cache_entry.write(game_text)
+                yield game_text, game
+
+    def iter_games_downloads(
+        self,
+        api_path: str,
+        accept: str | None,
+        parse: Callable[[Iterable[str]], Iterator[tuple[str, GameT]]],
+        game_key: Callable[[GameT], tuple[Hashable, str]],
+        game_time_range: Callable[[Hashable], Optional[tuple[int, int]]],
+        params: APIParams_GetGames,
+    ) -> Iterator[tuple[str, GameT]]:
+        """Downloads of iter_games_resumable: the request, and the resumed ones if it breaks"""
+        params = APIParams_GetGames(**params)
+        descending = params.get("sort") != "dateAsc"
+        max_games = params.get("max")
+        retry_policy = self.req_helper.retry_policy
+
+        games_count = 0
+        last_time, last_ids = None, set()
+        attempt = 0
         while True:
-            game = read_game(pgn_stream)
-            if game is None:
-                break
+            try:
+                for game_text, game in parse(self.download(api_path, params, accept)):
+                    game_time, game_id = game_key(game)
+                    if game_time == last_time:
+                        if game_id in last_ids:
+                            continue  # already received before the stream broke
+                        last_ids.add(game_id)
+                    else:
+                        last_time, last_ids = game_time, {game_id}
+
+                    attempt = 0
+                    games_count += 1
+                    yield game_text, game
+                return
+            except Urllib3StreamError as e:
+                if attempt >= retry_policy.max_retries:
+                    raise
+                delay = retry_policy.backoff(attempt)
+                attempt += 1
+                print(f"Download interrupted ({e}), resuming in {delay:.1f}s...")
+                time.sleep(delay)
+
+            time_range = game_time_range(last_time) if last_time is not None else None
+            if time_range is not None:
+                if descending:
+                    params["until"] = time_range[1]
+                else:
+                    params["since"] = time_range[0]
+                if max_games is not None:
+                    # games at the resume time count again - they come once more
+                    params["max"] = max_games - games_count + len(last_ids)
 
+    @classmethod
+    def split_json_lines(cls, chunks: Iterable[str]) -> Iterator[str]:
+        """Re-slices NDJSON text arriving in arbitrary chunks into lines of JSON objects"""
+        tail = ""
+        for chunk in chunks:
+            *lines, tail = (tail + chunk).split("\n")
+            for line in lines:
+                if line and not line.isspace():
+                    yield line
+
+        if tail and not tail.isspace():
+            yield tail
+
+    @classmethod
+    def parse_games_json(cls, chunks: Iterable[str]) -> Iterator[dict]:
+        """Yields decoded games from NDJSON text arriving in arbitrary chunks (one JSON object per line)"""
+        return map(json_loads, cls.split_json_lines(chunks))
+
+    def iter_games_json(
+        self, username: str, params: APIParams_GetGames
+    ) -> Iterator[dict]:
+        """
+        Streams games as JSON objects (Lichess NDJSON format) - no PGN parsing involved,
+        ratings, rating diffs and timestamps already come as numbers.
+        """
+        api_path = f"api/games/user/{username}"
+
+        def parse(ndjson_chunks: Iterable[str]) -> Iterator[tuple[str, dict]]:
+            return ((f"{line}\n", json_loads(line)) for line in self.split_json_lines(ndjson_chunks))
+
+        for _, game in self.iter_games_resumable(
+            api_path,
+            NDJSON_CONTENT_TYPE,
+            parse,
+            lambda game: (game["createdAt"], game["id"]),
+            lambda created_at: (created_at, created_at),
+            params,
+        ):
+            yield game
+
+    def export_games_by_ids(self, game_ids: list[str], params: APIParams_ExportByIds) -> list[dict]:
+        """
+        Games with the given ids (up to EXPORT_BY_IDS_MAX_IDS) as JSON objects, in one POST request.
+        Ids of games which don't exist are skipped by the API.
+        """
+        if len(game_ids) > EXPORT_BY_IDS_MAX_IDS:
+            raise ValueError(f"At most {EXPORT_BY_IDS_MAX_IDS} games can be exported by ids at once")
+
+        ndjson_text = self.req_helper.post(
+            api_path="api/games/export/_ids",
+            body=",".join(game_ids),
+            params=params,
+            token=self.lichess_api_token,
+            accept=NDJSON_CONTENT_TYPE,
+        )
+        return list(self.parse_games_json([ndjson_text]))
+
+    def iter_games_sharded(
+        self,
+        fetch: Callable[[APIParams_GetGames], Iterator[GameT]],
+        game_key: Callable[[GameT], tuple[Hashable, str]],
+        params: APIParams_GetGames,
+        shards: int,
+        concurrency: int,
+        buffer_size: int = SHARD_BUFFER_SIZE,
+    ) -> Iterator[GameT]:
+        """
+        Splits since/until range of params into time windows which are downloaded concurrently
+        (at most `concurrency` requests at a time) with fetch(window_params).
+
+        Games are yielded in the same order a single request would return them (params["sort"],
+        newest first by default). game_key(game) gives (game time, game id): a window resumed
+        within its boundary second gets games of the neighbour window again, which are skipped
+        by id - only ids of the last game time of the previous window are kept for that.
+        params["max"] is a global cap: once reached, all shards stop downloading.
+        """
+        windows = self.split_time_range(params["since"], params["until"], shards)
+        if params.get("sort") != "dateAsc":
+            windows.reverse()
+
+        max_games = params.get("max")
+        stop = threading.Event()
+        shard_queues = [queue.Queue(maxsize=buffer_size) for _ in windows]
+
+        def put(shard_queue: queue.Queue, item) -> bool:
+            while not stop.is_set():
+                try:
+                    shard_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def download_shard(window: tuple[int, int], shard_queue: queue.Queue) -> None:
+            if stop.is_set():
+                return
+            shard_params = APIParams_GetGames(**{**params, "since": window[0], "until": window[1]})
             try:
-                output.append(PGNGameHeader(**dict(game.headers)))
+                games = fetch(shard_params)
+                try:
+                    for game in games:
+                        if not put(shard_queue, game):
+                            break
+                finally:
+                    games.close()
             except Exception as e:
-                print(f"Error parsing game headers: {e}")
-                print(dict(game.headers))
-                raise e
-
-        return output
+                put(shard_queue, _ShardDone(e))
+                return
+            put(shard_queue, _ShardDone())
+
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="shard")
+        try:
+            for window, shard_queue in zip(windows, shard_queues):
+                executor.submit(download_shard, window, shard_queue)
+
+            games_count = 0
+            # ids of the games at the last game time of the previous window
+            previous_ids = set()
+            for shard_queue in shard_queues:
+                last_time, last_ids = None, set()
+                while not isinstance(item := shard_queue.get(), _ShardDone):
+                    item_time, item_id = game_key(item)
+                    if item_id in previous_ids:
+                        continue
+                    if item_time != last_time:
+                        last_time, last_ids = item_time, set()
+                    last_ids.add(item_id)
+
+                    yield item
+                    games_count += 1
+                    if max_games is not None and games_count >= max_games:
+                        return
+                if item.error is not None:
+                    raise item.error
+                previous_ids = last_ids
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,210 @@
+import io
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import pyarrow as pa
+
+from helpers.imports_helper import lazy_import
+from helpers.pgn_parser_helper import (
+    COMMENT_REGEX,
+    PGNGameHeader,
+    PGNParserMismatch,
+    PGNParserMode,
+)
+from helpers.pipeline_helper import PGNGameHeaderStandardized, arrow_batch_for, arrow_schema_for
+
+chess_pgn = lazy_import("chess.pgn")
+
+# [%clk h:mm:ss] comment, left on the clock of the player who has just moved
+CLOCK_REGEX = re.compile(r"\[%clk\s+(\d+):(\d+):(\d+(?:\.\d*)?)\]")
+
+# move numbers ("12." / "12..."), the rest of the movetext tokens are moves, NAGs ($1) and the result
+MOVE_NUMBER_REGEX = re.compile(r"\d+\.+")
+RESULT_TOKENS = frozenset(("1-0", "0-1", "1/2-1/2", "*"))
+VARIATION_REGEX = re.compile(r"\([^()]*\)")
+
+# a move made with less than this on the clock counts as a move in time trouble
+TIME_TROUBLE_SECONDS = 10
+
+# games per task sent to a worker process - large enough to amortize inter-process transfer
+ANALYSIS_MIN_CHUNK_GAMES = 100
+
+COLORS = ("White", "Black")
+
+
+@dataclass(slots=True)
+class MovetextFeatures:
+    """Per-game features derived from movetext; field names are the same as in PGNGameHeaderStandardized"""
+
+    PlyCount: Optional[int] = None
+    # clock features are None for games without [%clk] comments (e.g. unlimited or correspondence games)
+    WhiteTimeLeft: Optional[float] = None  # seconds left after the last move
+    BlackTimeLeft: Optional[float] = None
+    WhiteAvgMoveTime: Optional[float] = None  # seconds per move, increments included
+    BlackAvgMoveTime: Optional[float] = None
+    WhiteMovesUnder10s: Optional[int] = None  # moves made with less than TIME_TROUBLE_SECONDS on the clock
+    BlackMovesUnder10s: Optional[int] = None
+
+    def apply(self, game_std: PGNGameHeaderStandardized) -> PGNGameHeaderStandardized:
+        for name in MOVETEXT_FEATURE_COLUMNS:
+            setattr(game_std, name, getattr(self, name))
+        return game_std
+
+
+MOVETEXT_FEATURES_SCHEMA = arrow_schema_for(MovetextFeatures)
+MOVETEXT_FEATURE_COLUMNS = MOVETEXT_FEATURES_SCHEMA.names
+
+
+class MovetextParser:
+    """
+    Derives MovetextFeatures from the movetext of a game.
+
+    The default tokenizer counts move tokens and reads [%clk] comments with regular expressions,
+    without replaying the moves; python-chess move replay (PGNParserMode.CHESS) is the reference
+    implementation, and PGNParserMode.VERIFY runs both and fails on any difference.
+    """
+
+    @classmethod
+    def san_moves(cls, movetext: str) -> list[str]:
+        """SAN of the mainline moves as written (check and annotation marks included)"""
+        without_comments = COMMENT_REGEX.sub(" ", movetext)
+        while "(" in without_comments:  # variations, innermost first
+            without_comments, replaced = VARIATION_REGEX.subn(" ", without_comments)
+            if not replaced:
+                break
+        tokens = MOVE_NUMBER_REGEX.sub(" ", without_comments).split()
+        return [token for token in tokens if token not in RESULT_TOKENS and token[0] != "$"]
+
+    @classmethod
+    def clocks_fast(cls, movetext: str) -> tuple[int, list[float]]:
+        """(ply count, clock after every ply, or [] if some plies have none)"""
+        plies_count = len(cls.san_moves(movetext))
+
+        clocks = [
+            int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+            for hours, minutes, seconds in CLOCK_REGEX.findall(movetext)
+        ]
+        return plies_count, clocks if len(clocks) == plies_count else []
+
+    @classmethod
+    def clocks_chess(cls, movetext: str, variant: Optional[str], fen: Optional[str]) -> tuple[int, list[float]]:
+        """Reference implementation of clocks_fast: the moves are replayed by python-chess"""
+        tags = "".join(
+            f'[{name} "{value}"]\n'
+            for name, value in (("Variant", variant), ("FEN", fen), ("SetUp", "1" if fen else None))
+            if value is not None
+        )
+        game = chess_pgn.read_game(io.StringIO(f"{tags}\n{movetext}\n"))
+        clocks = [node.clock() for node in game.mainline()] if game is not None else []
+        plies_count = len(clocks)
+        return plies_count, clocks if None not in clocks else []
+
+    @classmethod
+    def features(
+        cls, plies_count: int, clocks: list[float], time_control: Optional[str]
+    ) -> MovetextFeatures:
+        output = MovetextFeatures(PlyCount=plies_count)
+        if not clocks:
+            return output
+
+        try:
+            initial, increment = map(int, time_control.split("+"))
+        except (AttributeError, ValueError):  # no time control - clocks alone
+            initial, increment = clocks[0], 0
+
+        for color_index, color in enumerate(COLORS):
+            own_clocks = clocks[color_index::2]
+            moves_count = len(own_clocks)
+            if not moves_count:
+                setattr(output, f"{color}MovesUnder10s", 0)
+                continue
+            time_left = own_clocks[-1]
+            # time spent on all moves: the initial time and all increments minus what's left
+            time_spent = max(0.0, initial + moves_count * increment - time_left)
+            clocks_before_moves = [initial, *own_clocks[:-1]]
+
+            setattr(output, f"{color}TimeLeft", float(time_left))
+            setattr(output, f"{color}AvgMoveTime", time_spent / moves_count)
+            setattr(
+                output,
+                f"{color}MovesUnder10s",
+                sum(1 for clock in clocks_before_moves if clock < TIME_TROUBLE_SECONDS),
+            )
+        return output
+
+    @classmethod
+    def parse(
+        cls,
+        movetext: Optional[str],
+        time_control: Optional[str],
+        variant: Optional[str] = None,
+        fen: Optional[str] = None,
+        mode: str = PGNParserMode.FAST,
+    ) -> MovetextFeatures:
+        if movetext is None:  # moves weren't downloaded
+            return MovetextFeatures()
+
+        if mode == PGNParserMode.CHESS:
+            return cls.features(*cls.clocks_chess(movetext, variant, fen), time_control)
+
+        features = cls.features(*cls.clocks_fast(movetext), time_control)
+        if mode == PGNParserMode.VERIFY:
+            expected = cls.features(*cls.clocks_chess(movetext, variant, fen), time_control)
+            if features != expected:
+                raise PGNParserMismatch(
+                    f"Fast movetext parser result {features} differs from python-chess result {expected}"
+                )
+        return features
+
+
+def analyze_games(
+    games: list[tuple[Optional[str], Optional[str], Optional[str], Optional[str]]], mode: str
+) -> list[MovetextFeatures]:
+    """Worker of MovetextAnalyzer: (movetext, time control, variant, FEN) of games -> their features"""
+    return [MovetextParser.parse(*game, mode=mode) for game in games]
+
+
+class MovetextAnalyzer:
+    """
+    Computes MovetextFeatures of batches of games in worker processes - replaying moves is CPU-bound,
+    so it scales with cores instead of being limited by the GIL of the transform threads.
+
+    Every batch is split between the workers and analyzed while the caller waits, so only batches
+    already in the pipeline are held in memory. Headers need movetext (see PGNHeaderParser keep_movetext).
+    """
+
+    def __init__(self, workers: int, mode: str = PGNParserMode.FAST):
+        self.workers = workers
+        self.mode = mode
+        self.executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def analyze(self, headers: list[PGNGameHeader]) -> list[MovetextFeatures]:
+        games = [(header.Movetext, header.TimeControl, header.Variant, header.FEN) for header in headers]
+        if self.executor is None or len(games) < 2 * ANALYSIS_MIN_CHUNK_GAMES:
+            return analyze_games(games, self.mode)
+
+        chunk_size = max(ANALYSIS_MIN_CHUNK_GAMES, -(-len(games) // self.workers))
+        futures = [
+            self.executor.submit(analyze_games, games[start : start + chunk_size], self.mode)
+            for start in range(0, len(games), chunk_size)
+        ]
+        return [features for future in futures for features in future.result()]
+
+    @classmethod
+    def to_table(cls, features: list[MovetextFeatures]) -> pa.Table:
+        """Features of a batch as a table of MOVETEXT_FEATURES_SCHEMA columns (see ColumnarHelper.standardize_batch)"""
+        if not features:
+            return MOVETEXT_FEATURES_SCHEMA.empty_table()
+        return pa.Table.from_batches([arrow_batch_for(features, MOVETEXT_FEATURES_SCHEMA)])
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,65 @@
+# Defaults and choices of command-line options which are shared with the helpers implementing them.
+# Kept apart from those helpers (pyarrow, numpy, urllib3, ...), so the command line parses arguments
+# and prints --help without importing the heavy dependencies - see commands/arguments.py.
+
+import enum
+
+OUTPUT_FORMATS = ["csv", "parquet", "dataset", "duckdb"]
+
+# parquet output: rows per row group and column compression (any codec supported by pyarrow)
+PARQUET_ROW_GROUP_SIZE = 100_000
+PARQUET_COMPRESSION = "snappy"
+PARQUET_COMPRESSIONS = ["snappy", "zstd", "gzip", "brotli", "lz4", "none"]
+
+# seconds between progress lines (and metrics file updates) of an export
+PROGRESS_INTERVAL = 5.0
+
+# positions index: plies of every game indexed by default
+DEFAULT_MAX_PLY = 20
+
+# standard stats reports, see STATS_REPORTS
+STATS_REPORT_NAMES = ["time-control", "color", "opening-family", "opening", "opponent-title"]
+
+# serve command: default port and memory for player datasets (see DatasetCache)
+SERVE_PORT = 8766
+SERVE_MAX_MEMORY = 512 * 1024 * 1024
+
+
+class APIFormat(enum.Enum):
+    PGN = "pgn"
+    NDJSON = "ndjson"
+
+
+class ChessPerfType(enum.Enum):
+    ULTRA_BULLET = "ultraBullet"
+    BULLET = "bullet"
+    BLITZ = "blitz"
+    RAPID = "rapid"
+    CLASSICAL = "classical"
+    CORRESPONDENCE = "correspondence"
+    CHESS960 = "chess960"
+    CRAZYHOUSE = "crazyhouse"
+    ANTICHESS = "antichess"
+    ATOMIC = "atomic"
+    HORDE = "horde"
+    KING_OF_THE_HILL = "kingOfTheHill"
+    RACING_KINGS = "racingKings"
+    THREE_CHECK = "threeCheck"
+
+
+# ids per request accepted by POST api/games/export/_ids
+EXPORT_BY_IDS_MAX_IDS = 300
+
+# response cache, see ResponseCache
+DEFAULT_CACHE_MAX_SIZE = 1024 * 1024 * 1024  # 1 GiB of compressed responses
+
+# items (chunks or batches) buffered between two stages - bounds memory when a downstream stage is slower
+DEFAULT_QUEUE_SIZE = 4
+
+
+class PGNParserMode:
+    FAST = "fast"  # header-only tokenizer, default
+    CHESS = "chess"  # python-chess read_game (reference implementation)
+    VERIFY = "verify"  # run both on the same input, fail on any difference
+
+    ALL = [FAST, CHESS, VERIFY]
@@ -0,0 +1,208 @@
+import io
+import re
+from dataclasses import dataclass, fields
+from itertools import repeat
+from typing import Callable, Iterable, Iterator, Optional
+
+from helpers.imports_helper import lazy_import
+from helpers.options_helper import PGNParserMode
+
+# python-chess takes a while to import, the default fast parser doesn't need it
+chess_pgn = lazy_import("chess.pgn")
+
+
+@dataclass(slots=True)
+class PGNGameHeader:
+    Event: Optional[str] = None
+    Site: Optional[str] = None
+    Date: Optional[str] = None
+    Round: Optional[str] = None
+
+    White: Optional[str] = None
+    Black: Optional[str] = None
+    Result: Optional[str] = None
+
+    UTCDate: Optional[str] = None
+    UTCTime: Optional[str] = None
+
+    Score: Optional[str] = None
+    WhiteElo: Optional[str] = None
+    BlackElo: Optional[str] = None
+    WhiteRatingDiff: Optional[str] = None
+    BlackRatingDiff: Optional[str] = None
+
+    Variant: Optional[str] = None
+    TimeControl: Optional[str] = None
+
+    ECO: Optional[str] = None
+    Opening: Optional[str] = None
+
+    WhiteTitle: Optional[str] = None
+    BlackTitle: Optional[str] = None
+    WhiteFideId: Optional[str] = None
+    BlackFideId: Optional[str] = None
+    Termination: Optional[str] = None
+
+    GameId: Optional[str] = None
+
+    FEN: Optional[str] = None
+    SetUp: Optional[str] = None
+
+    # not a tag: movetext of the game, kept only when requested (see parse_games_headers)
+    Movetext: Optional[str] = None
+
+
+# python-chess tag syntax (applied to a whole header block), so both parsers agree on malformed lines
+TAG_REGEX = re.compile(
+    r"^\[([A-Za-z0-9][A-Za-z0-9_+#=:-]*)[^\S\n]+\"([^\r\n]*)\"\][^\S\n]*$", re.MULTILINE
+)
+
+TAG_NAME_REGEX = re.compile(r"[A-Za-z0-9][A-Za-z0-9_+#=:-]*")
+
+RESULT_TOKEN_REGEX = re.compile(r"(?<!\S)(1-0|0-1|1/2-1/2|\*)(?!\S)")
+COMMENT_REGEX = re.compile(r"\{[^}]*\}")
+
+# games are separated by an empty line followed by the first tag of the next game
+GAME_BOUNDARY_REGEX = re.compile(r"\n[^\S\n]*\n(?=\[)")
+
+# python-chess always reports the Seven Tag Roster, filling missing tags with these values
+SEVEN_TAG_ROSTER_DEFAULTS = {
+    "Event": "?",
+    "Site": "?",
+    "Date": "????.??.??",
+    "Round": "?",
+    "White": "?",
+    "Black": "?",
+    "Result": "*",
+}
+
+PGN_HEADER_FIELDS = frozenset(field.name for field in fields(PGNGameHeader)) - {"Movetext"}
+
+
+class PGNParserMismatch(Exception):
+    pass
+
+
+class PGNHeaderParser:
+    """
+    Header-only PGN tokenizer.
+
+    Reads [Tag "Value"] blocks straight into PGNGameHeader and skips movetext without
+    building a game tree, which makes it 5.1-5.9x faster (games/sec) than read_game on
+    a synthetic 100k games file (see benchmarks/bench_pgn_parser.py). Values are not
+    interned here (see intern_optional of the pipeline), the hot loop only slices text.
+
+    Tag values are kept as written (escaped quotes included), exactly like python-chess does.
+    Tags which are not fields of PGNGameHeader are ignored.
+    """
+
+    @classmethod
+    def split_games(cls, chunks: Iterable[str]) -> Iterator[str]:
+        """Re-slices arbitrary text chunks (e.g. network reads) into texts of complete games"""
+        tail = ""
+        for chunk in chunks:
+            *games, tail = GAME_BOUNDARY_REGEX.split(tail + chunk)
+            yield from games
+
+        if tail and not tail.isspace():
+            yield tail
+
+    @classmethod
+    def parse_tags(cls, game_text: str) -> dict[str, str]:
+        if "\r" in game_text:
+            game_text = game_text.replace("\r\n", "\n")
+        if not game_text.startswith("["):
+            game_text = game_text.lstrip("\ufeff \t\n")
+        header_text, _, movetext = game_text.partition("\n\n")
+
+        # Fast path for canonical Lichess layout: exactly one [Name "Value"] per line
+        parts = header_text[1:-2].split('"]\n[')
+        try:
+            if not header_text.endswith('"]') or len(parts) != header_text.count("\n") + 1:
+                raise ValueError("Non-canonical PGN header")
+            tags = {
+                **SEVEN_TAG_ROSTER_DEFAULTS,
+                **dict(map(str.split, parts, repeat(' "'), repeat(1))),
+            }
+            if not tags.keys() <= PGN_HEADER_FIELDS and not all(
+                map(TAG_NAME_REGEX.fullmatch, tags)
+            ):
+                raise ValueError("Invalid PGN tag name")
+        except ValueError:
+            # malformed lines, comments, odd spacing - use the full tag syntax
+            tags = {**SEVEN_TAG_ROSTER_DEFAULTS, **dict(TAG_REGEX.findall(header_text))}
+
+        # same as python-chess: result token of the movetext fills in unknown Result tag
+        if tags["Result"] == "*":
+            result_match = RESULT_TOKEN_REGEX.search(COMMENT_REGEX.sub(" ", movetext))
+            if result_match:
+                tags["Result"] = result_match.group(1)
+
+        return tags
+
+    @classmethod
+    def split_movetext(cls, game_text: str) -> str:
+        """Movetext of a single game text (everything after the header block)"""
+        if "\r" in game_text:
+            game_text = game_text.replace("\r\n", "\n")
+        return game_text.lstrip("\ufeff \t\n").partition("\n\n")[2].strip()
+
+    @classmethod
+    def to_pgn_header(cls, tags: dict[str, str]) -> PGNGameHeader:
+        try:
+            return PGNGameHeader(**tags)
+        except TypeError:  # unknown tag(s)
+            pass
+        known_tags = {name: value for name, value in tags.items() if name in PGN_HEADER_FIELDS}
+        return PGNGameHeader(**known_tags)
+
+    @classmethod
+    def parse_games_headers(
+        cls,
+        chunks: Iterable[str],
+        mode: str = PGNParserMode.FAST,
+        on_game: Optional[Callable[[str, PGNGameHeader], None]] = None,
+        keep_movetext: bool = False,
+    ) -> Iterator[PGNGameHeader]:
+        """
+        Yields game headers one by one from PGN text arriving in arbitrary chunks.
+        on_game(game_text, header) is called for every game before it's yielded (e.g. to archive raw PGN).
+        With keep_movetext, movetext of every game is kept in header.Movetext (e.g. for MovetextAnalyzer).
+        """
+        for game_text in cls.split_games(chunks):
+            if mode == PGNParserMode.CHESS:
+                headers = cls.read_games_headers(io.StringIO(game_text))
+            else:
+                headers = [cls.to_pgn_header(cls.parse_tags(game_text))]
+                if mode == PGNParserMode.VERIFY:
+                    cls.verify_header(headers[0], game_text)
+
+            for header in headers:
+                if keep_movetext:
+                    header.Movetext = cls.split_movetext(game_text)
+                if on_game is not None:
+                    on_game(game_text, header)
+                yield header
+
+    @classmethod
+    def read_games_headers(cls, pgn_stream) -> Iterator[PGNGameHeader]:
+        """Reference implementation: full python-chess parsing of a readable PGN stream"""
+        while True:
+            game = chess_pgn.read_game(pgn_stream)
+            if game is None:
+                break
+
+            try:
+                yield cls.to_pgn_header(dict(game.headers))
+            except Exception as e:
+                print(f"Error parsing game headers: {e}")
+                print(dict(game.headers))
+                raise e
+
+    @classmethod
+    def verify_header(cls, header: PGNGameHeader, game_text: str) -> None:
+        expected = list(cls.read_games_headers(io.StringIO(game_text)))
+        if expected != [header]:
+            raise PGNParserMismatch(
+                f"Fast PGN parser result {header} differs from read_game result {expected}"
+            )
@@ -1,15 +1,33 @@
+import glob
+import json
+import os
+import shutil
+import sys
+import uuid
 from datetime import datetime, timezone
-from dataclasses import fields, dataclass, asdict
+from dataclasses import fields, dataclass
 from enum import Enum
-from typing import Optional
+from functools import lru_cache
+from itertools import islice
+from operator import attrgetter
+from typing import Iterable, Iterator, Optional, Union, get_args, get_origin, get_type_hints
 
-import pandas as pd
-import pyarrow.parquet as pq
+import pyarrow.csv as pv
 import pyarrow as pa
 
 import csv
 
+from helpers.imports_helper import lazy_import
 from helpers.lichess_api_helper import PGNGameHeader
+from helpers.options_helper import PARQUET_COMPRESSION, PARQUET_ROW_GROUP_SIZE
+
+# needed by dataset / duckdb outputs only (pyarrow.dataset imports pandas)
+duckdb = lazy_import("duckdb")
+ds = lazy_import("pyarrow.dataset")
+# needed by parquet / dataset outputs and parquet side files only (pyarrow.parquet imports pyarrow.fs and ssl)
+pq = lazy_import("pyarrow.parquet")
+# loaded by the first batch computed on (its kernels' registration is a large part of pyarrow's import time)
+pc = lazy_import("pyarrow.compute")
 
 
 @dataclass
@@ -38,7 +56,102 @@ TIME_CONTROL_THRESHOLDS = [
 ]
 
 
-@dataclass
+# bounds of memo caches of the parsers below - Lichess has a few hundred distinct
+# time controls and a few thousand opening names
+TIME_CONTROL_CACHE_SIZE = 1024
+OPENING_CACHE_SIZE = 4096
+
+# columns with few distinct values - dictionary-encoded in parquet, the rest (game ids,
+# player names, timestamps, ratings) are stored plain
+PARQUET_DICTIONARY_COLUMNS = [
+    "Event",
+    "Date",
+    "Round",
+    "Color",
+    "Variant",
+    "TimeControl",
+    "TimeControlSec",
+    "TimeControlType",
+    "ECO",
+    "OpeningFamily",
+    "OpeningVariation",
+    "OpeningSubVariation",
+    "PlayerTitle",
+    "OpponentTitle",
+    "Termination",
+]
+
+# dataset output: hive partitions (directories like Player=x/Year=2025/Month=2/TimeControlType=Blitz)
+DATASET_PARTITIONING = pa.schema(
+    [
+        pa.field("Player", pa.string()),
+        pa.field("Year", pa.int64()),
+        pa.field("Month", pa.int64()),
+        pa.field("TimeControlType", pa.string()),
+    ]
+)
+
+# duckdb output: table of games, its key and indexed columns
+DUCKDB_TABLE = "games"
+DUCKDB_KEY_COLUMNS = ["GameId", "Player"]  # a game is stored once per player exported
+DUCKDB_INDEXED_COLUMNS = ["Player", "UTCDateTime", "OpeningFamily"]
+# game id is the last part of Site url, same as LichessAPIHelper.game_id_from_site
+DUCKDB_GAME_ID_SQL = "regexp_extract(rtrim(Site, '/'), '[^/]*$')"
+
+# Lichess JSON API keys -> names used by Lichess in PGN export
+VARIANT_NAMES = {
+    "standard": "Standard",
+    "chess960": "Chess960",
+    "crazyhouse": "Crazyhouse",
+    "antichess": "Antichess",
+    "atomic": "Atomic",
+    "horde": "Horde",
+    "kingOfTheHill": "King of the Hill",
+    "racingKings": "Racing Kings",
+    "threeCheck": "Three-check",
+    "fromPosition": "From Position",
+}
+
+PERF_NAMES = {
+    "ultraBullet": "UltraBullet",
+    "bullet": "Bullet",
+    "blitz": "Blitz",
+    "rapid": "Rapid",
+    "classical": "Classical",
+    "correspondence": "Correspondence",
+    **VARIANT_NAMES,
+}
+
+# game status -> PGN Termination tag
+STATUS_TERMINATIONS = {
+    "created": "Unterminated",
+    "started": "Unterminated",
+    "aborted": "Abandoned",
+    "noStart": "Abandoned",
+    "mate": "Normal",
+    "resign": "Normal",
+    "stalemate": "Normal",
+    "draw": "Normal",
+    "variantEnd": "Normal",
+    "timeout": "Time forfeit",
+    "outoftime": "Time forfeit",
+    "cheat": "Rules infraction",
+    "unknownFinish": "Unterminated",
+}
+
+# statuses of games which are not finished - PGN Result "*"
+UNFINISHED_STATUSES = {"created", "started", "aborted"}
+
+
+def intern_optional(value: Optional[str]) -> Optional[str]:
+    """
+    Interned value of a tag with few distinct values, so records held in memory share one string
+    per value (done on standardization rather than by the PGN parser, which stays allocation-light)
+    """
+    return sys.intern(value) if value is not None else None
+
+
+@dataclass(slots=True)
 class PGNGameHeaderStandardized:
     Event: Optional[str] = None
     Site: Optional[str] = None
@@ -73,6 +186,15 @@ class PGNGameHeaderStandardized:
     BlackTitle: Optional[str] = None
     Termination: Optional[str] = None
 
+    # derived from movetext (see MovetextAnalyzer), only for games exported with moves
+    PlyCount: Optional[int] = None
+    WhiteTimeLeft: Optional[float] = None  # seconds on the clock after the last move
+    BlackTimeLeft: Optional[float] = None
+    WhiteAvgMoveTime: Optional[float] = None  # seconds
+    BlackAvgMoveTime: Optional[float] = None
+    WhiteMovesUnder10s: Optional[int] = None  # moves made with less than 10 seconds on the clock
+    BlackMovesUnder10s: Optional[int] = None
+
     @classmethod
     def join_utc_date_and_time(cls, utcdate: str, utctime: str) -> datetime:
         if utcdate is None or utctime is None:
@@ -104,6 +226,7 @@ class PGNGameHeaderStandardized:
             return None
 
     @classmethod
+    @lru_cache(maxsize=OPENING_CACHE_SIZE)
     def split_opening(
         cls, opening: str
     ) -> tuple[
@@ -131,12 +254,14 @@ class PGNGameHeaderStandardized:
         return family, variation, subvariation
 
     @classmethod
+    @lru_cache(maxsize=TIME_CONTROL_CACHE_SIZE)
     def parse_timecontrol(cls, tc: str) -> tuple[float, int]:
         """Parses a chess time control string (e.g., '180+2') into (minutes, increment)."""
         initial, increment = map(int, tc.split("+"))
         return initial / 60, increment
 
     @classmethod
+    @lru_cache(maxsize=TIME_CONTROL_CACHE_SIZE)
     def format_timecontrol(cls, minutes: float, increment: int) -> str:
         """Formats the parsed time control values into a readable format."""
         fraction_map = {0.5: "½", 0.25: "¼"}
@@ -155,6 +280,7 @@ class PGNGameHeaderStandardized:
         return int(minutes * 60) + 40 * increment
 
     @classmethod
+    @lru_cache(maxsize=TIME_CONTROL_CACHE_SIZE)
     def get_timecontrol_type(cls, minutes: float, increment: int) -> str:
         """Determines the time control type based on estimated game time."""
         estimated_time = cls.calculate_estimated_time(minutes, increment)
@@ -165,13 +291,26 @@ class PGNGameHeaderStandardized:
 
         return TimeControlType.CLASSIC.value
 
+    @classmethod
+    def cache_info(cls) -> dict:
+        """Hit/miss stats of the memoized parsers"""
+        return {
+            name: getattr(cls, name).cache_info()
+            for name in (
+                "parse_timecontrol",
+                "format_timecontrol",
+                "get_timecontrol_type",
+                "split_opening",
+            )
+        }
+
     @classmethod
     def from_pgn_header(cls, pgn_header: PGNGameHeader):
         outp = PGNGameHeaderStandardized()
-        outp.Event = pgn_header.Event
+        outp.Event = intern_optional(pgn_header.Event)
         outp.Site = pgn_header.Site
-        outp.Date = pgn_header.Date
-        outp.Round = pgn_header.Round
+        outp.Date = intern_optional(pgn_header.Date)
+        outp.Round = intern_optional(pgn_header.Round)
         outp.White = pgn_header.White
         outp.Black = pgn_header.Black
 
@@ -187,26 +326,93 @@ class PGNGameHeaderStandardized:
         outp.WhiteRatingChange = cls.str_to_float(pgn_header.WhiteRatingDiff)
         outp.BlackRatingChange = cls.str_to_float(pgn_header.BlackRatingDiff)
 
-        outp.Variant = pgn_header.Variant
-        outp.TimeControlSec = pgn_header.TimeControl
+        outp.Variant = intern_optional(pgn_header.Variant)
+        outp.TimeControlSec = intern_optional(pgn_header.TimeControl)
         mins_initial, secs_increment = cls.parse_timecontrol(pgn_header.TimeControl)
         outp.TimeControl = cls.format_timecontrol(mins_initial, secs_increment)
         outp.TimeControlType = cls.get_timecontrol_type(mins_initial, secs_increment)
 
-        outp.ECO = pgn_header.ECO
+        outp.ECO = intern_optional(pgn_header.ECO)
 
         outp.OpeningFamily, outp.OpeningVariation, outp.OpeningSubVariation = (
             cls.split_opening(pgn_header.Opening)
         )
 
-        outp.WhiteTitle = pgn_header.WhiteTitle
-        outp.BlackTitle = pgn_header.BlackTitle
-        outp.Termination = pgn_header.Termination
+        outp.WhiteTitle = intern_optional(pgn_header.WhiteTitle)
+        outp.BlackTitle = intern_optional(pgn_header.BlackTitle)
+        outp.Termination = intern_optional(pgn_header.Termination)
 
         return outp
 
+    @classmethod
+    def player_name(cls, player: dict) -> str:
+        if "user" in player:
+            return player["user"]["name"]
+        if "aiLevel" in player:
+            return f"lichess AI level {player['aiLevel']}"
+        return "Anonymous"
 
-@dataclass
+    @classmethod
+    def from_api_json(cls, game: dict):
+        """
+        Same as from_pgn_header, but for a game in Lichess JSON format (NDJSON export).
+        Ratings, rating diffs and timestamps are numbers already, so no string parsing is needed.
+
+        Note: PGN Event of arena/swiss games is the tournament name, which is not part of the JSON -
+        such games get generic event name (e.g. "Rated Blitz game").
+        """
+        outp = PGNGameHeaderStandardized()
+        white = game["players"]["white"]
+        black = game["players"]["black"]
+        created_at = datetime.fromtimestamp(game["createdAt"] // 1000, tz=timezone.utc)
+
+        perf_name = PERF_NAMES.get(game.get("perf"), game.get("perf"))
+        outp.Event = sys.intern(f"{'Rated' if game.get('rated') else 'Casual'} {perf_name} game")
+        outp.Site = f"https://lichess.org/{game['id']}"
+        outp.Date = sys.intern(created_at.strftime("%Y.%m.%d"))
+        outp.Round = "-"
+        outp.White = cls.player_name(white)
+        outp.Black = cls.player_name(black)
+
+        status = game.get("status")
+        winner = game.get("winner")
+        if status in UNFINISHED_STATUSES:
+            outp.Result = None
+        elif winner:
+            outp.Result = 1.0 if winner == "white" else 0.0
+        else:
+            outp.Result = 0.5
+        outp.UTCDateTime = created_at
+
+        outp.WhiteElo = white.get("rating")
+        outp.BlackElo = black.get("rating")
+
+        white_diff, black_diff = white.get("ratingDiff"), black.get("ratingDiff")
+        outp.WhiteRatingChange = float(white_diff) if white_diff is not None else None
+        outp.BlackRatingChange = float(black_diff) if black_diff is not None else None
+
+        outp.Variant = VARIANT_NAMES.get(game.get("variant"), game.get("variant"))
+        clock = game.get("clock")
+        outp.TimeControlSec = sys.intern(f"{clock['initial']}+{clock['increment']}" if clock else "-")
+        mins_initial, secs_increment = cls.parse_timecontrol(outp.TimeControlSec)
+        outp.TimeControl = cls.format_timecontrol(mins_initial, secs_increment)
+        outp.TimeControlType = cls.get_timecontrol_type(mins_initial, secs_increment)
+
+        # Lichess PGN has ECO and Opening "?" for games without known opening
+        opening = game.get("opening") or {}
+        outp.ECO = sys.intern(opening.get("eco", "?"))
+        outp.OpeningFamily, outp.OpeningVariation, outp.OpeningSubVariation = (
+            cls.split_opening(opening.get("name", "?"))
+        )
+
+        outp.WhiteTitle = white.get("user", {}).get("title")
+        outp.BlackTitle = black.get("user", {}).get("title")
+        outp.Termination = STATUS_TERMINATIONS.get(status)
+
+        return outp
+
+
+@dataclass(slots=True)
 class PGNGameHeaderPersonified:
     # PGN Game Data from a perspective of a specific game participant
     Event: Optional[str] = None
@@ -242,6 +448,15 @@ class PGNGameHeaderPersonified:
     OpponentTitle: Optional[str] = None
     Termination: Optional[str] = None
 
+    # only for games exported with moves (--with-moves), null otherwise
+    PlyCount: Optional[int] = None
+    PlayerTimeLeft: Optional[float] = None
+    OpponentTimeLeft: Optional[float] = None
+    PlayerAvgMoveTime: Optional[float] = None
+    OpponentAvgMoveTime: Optional[float] = None
+    PlayerMovesUnder10s: Optional[int] = None
+    OpponentMovesUnder10s: Optional[int] = None
+
     @classmethod
     def from_pgn_header_std(
         cls, pgn_header_std: PGNGameHeaderStandardized, player_name: str
@@ -261,6 +476,12 @@ class PGNGameHeaderPersonified:
             outp.OpponentRatingChange = pgn_header_std.BlackRatingChange
             outp.PlayerTitle = pgn_header_std.WhiteTitle
             outp.OpponentTitle = pgn_header_std.BlackTitle
+            outp.PlayerTimeLeft = pgn_header_std.WhiteTimeLeft
+            outp.OpponentTimeLeft = pgn_header_std.BlackTimeLeft
+            outp.PlayerAvgMoveTime = pgn_header_std.WhiteAvgMoveTime
+            outp.OpponentAvgMoveTime = pgn_header_std.BlackAvgMoveTime
+            outp.PlayerMovesUnder10s = pgn_header_std.WhiteMovesUnder10s
+            outp.OpponentMovesUnder10s = pgn_header_std.BlackMovesUnder10s
         else:
             outp.Result = 1 - pgn_header_std.Result
             outp.Player = pgn_header_std.Black
@@ -272,6 +493,12 @@ class PGNGameHeaderPersonified:
             outp.OpponentRatingChange = pgn_header_std.WhiteRatingChange
             outp.PlayerTitle = pgn_header_std.BlackTitle
             outp.OpponentTitle = pgn_header_std.WhiteTitle
+            outp.PlayerTimeLeft = pgn_header_std.BlackTimeLeft
+            outp.OpponentTimeLeft = pgn_header_std.WhiteTimeLeft
+            outp.PlayerAvgMoveTime = pgn_header_std.BlackAvgMoveTime
+            outp.OpponentAvgMoveTime = pgn_header_std.WhiteAvgMoveTime
+            outp.PlayerMovesUnder10s = pgn_header_std.BlackMovesUnder10s
+            outp.OpponentMovesUnder10s = pgn_header_std.WhiteMovesUnder10s
 
         outp.ResultWin = 1 if outp.Result == 1 else 0
         outp.ResultDraw = 1 if outp.Result == 0.5 else 0
@@ -291,37 +518,561 @@ class PGNGameHeaderPersonified:
         outp.OpeningVariation = pgn_header_std.OpeningVariation
         outp.OpeningSubVariation = pgn_header_std.OpeningSubVariation
         outp.Termination = pgn_header_std.Termination
+        outp.PlyCount = pgn_header_std.PlyCount
 
         return outp
 
 
+PYTHON_TO_ARROW_TYPES = {
+    str: pa.string(),
+    int: pa.int64(),
+    float: pa.float64(),
+    datetime: pa.timestamp("us", tz="UTC"),
+}
+
+
+def arrow_schema_for(record_type: type) -> pa.Schema:
+    """Builds Arrow schema from dataclass field annotations (Optional[X] -> nullable X)"""
+    type_hints = get_type_hints(record_type)
+    schema_fields = []
+    for field in fields(record_type):
+        field_type = type_hints[field.name]
+        if get_origin(field_type) is Union:  # Optional[X] == Union[X, None]
+            field_type = next(arg for arg in get_args(field_type) if arg is not type(None))
+        schema_fields.append(pa.field(field.name, PYTHON_TO_ARROW_TYPES[field_type]))
+    return pa.schema(schema_fields)
+
+
+# PGNGameHeaderPersonified columns derived from movetext (see MovetextAnalyzer) - written only
+# into outputs of exports with moves, so outputs of other exports don't carry always-empty columns
+MOVETEXT_COLUMNS = [
+    "PlyCount",
+    "PlayerTimeLeft",
+    "OpponentTimeLeft",
+    "PlayerAvgMoveTime",
+    "OpponentAvgMoveTime",
+    "PlayerMovesUnder10s",
+    "OpponentMovesUnder10s",
+]
+
+
+def output_schema(with_moves: bool = False) -> pa.Schema:
+    """Columns of an output: PGNGameHeaderPersonified fields, MOVETEXT_COLUMNS only with_moves"""
+    schema = arrow_schema_for(PGNGameHeaderPersonified)
+    if with_moves:
+        return schema
+    return pa.schema([field for field in schema if field.name not in MOVETEXT_COLUMNS])
+
+
+def has_movetext_columns(column_names: Iterable[str]) -> bool:
+    return not set(MOVETEXT_COLUMNS).isdisjoint(column_names)
+
+
+ARROW_TO_DUCKDB_TYPES = {
+    pa.string(): "VARCHAR",
+    pa.int64(): "BIGINT",
+    pa.float64(): "DOUBLE",
+    pa.timestamp("us", tz="UTC"): "TIMESTAMPTZ",
+}
+
+
+def arrow_batch_for(records: list, schema: pa.Schema) -> pa.RecordBatch:
+    """Dataclass records -> Arrow record batch of the given schema (column per field)"""
+    rows = map(attrgetter(*schema.names), records)
+    columns = [pa.array(column, field.type) for column, field in zip(zip(*rows), schema)]
+    return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def conform_table(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """
+    Table with exactly the columns of schema: columns missing in the table (e.g. read from an output
+    written before the columns were added) are filled with nulls, the rest are cast to the schema types
+    """
+    columns = [
+        table[field.name] if field.name in table.column_names else pa.nulls(table.num_rows, field.type)
+        for field in schema
+    ]
+    return pa.Table.from_arrays(columns, names=schema.names).cast(schema)
+
+
+class CSVSink:
+    """
+    Writes game headers to CSV file batch by batch, so the whole export never sits in memory.
+
+    New file is written under a temporary name and moved into place on successful close,
+    with the columns of output_schema(with_moves).
+    In append mode rows are added to the end of the existing file, with the columns of its header
+    (columns added since the file was created are left out).
+    """
+
+    def __init__(self, file_path: str, append: bool = False, with_moves: bool = False):
+        self.file_path = file_path
+        self.header_fields = output_schema(with_moves).names
+        self.append = append and os.path.exists(file_path)
+        self.write_path = file_path if self.append else f"{file_path}.tmp"
+        if self.append:
+            with open(file_path, newline="", encoding="utf-8") as existing_file:
+                self.header_fields = next(csv.reader(existing_file), self.header_fields)
+
+        self.csvfile = open(
+            self.write_path, mode="a" if self.append else "w", newline="", encoding="utf-8"
+        )
+        self.writer = csv.DictWriter(self.csvfile, fieldnames=self.header_fields, extrasaction="ignore")
+
+        if not self.append:
+            # Write the headers to the first row
+            self.writer.writeheader()
+
+    def write(self, game_headers: Union[list[PGNGameHeaderPersonified], pa.Table]) -> None:
+        if isinstance(game_headers, pa.Table):
+            # batch from the columnar transform, values are the same python objects as in dataclasses
+            self.writer.writerows(game_headers.select(self.header_fields).to_pylist())
+            return
+
+        # Write each game header as a row in the CSV
+        for game_header in game_headers:
+            self.writer.writerow(
+                {field: getattr(game_header, field) for field in self.header_fields}
+            )
+
+    def close(self) -> None:
+        self.csvfile.flush()
+        os.fsync(self.csvfile.fileno())
+        self.csvfile.close()
+        if not self.append:
+            os.replace(self.write_path, self.file_path)
+
+    def abort(self) -> None:
+        self.csvfile.close()
+        if not self.append:
+            os.remove(self.write_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class ParquetSink:
+    """
+    Writes game headers to parquet file through Arrow record batches (no pandas),
+    with the schema fixed by output_schema(with_moves).
+
+    Written batches are buffered into row groups of row_group_size rows.
+    Low-cardinality columns (PARQUET_DICTIONARY_COLUMNS) are dictionary-encoded.
+
+    File is written under a temporary name and moved into place on successful close.
+    In append mode rows of the existing file are copied first (columns it doesn't have yet become null),
+    movetext columns of the existing file are kept.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        append: bool = False,
+        row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+        compression: str = PARQUET_COMPRESSION,
+        with_moves: bool = False,
+    ):
+        self.file_path = file_path
+        self.write_path = f"{file_path}.tmp"
+        self.row_group_size = row_group_size
+        append = append and os.path.exists(file_path)
+        if append:
+            with_moves = with_moves or has_movetext_columns(pq.read_schema(file_path).names)
+        # schema is fixed upfront: inferring it per batch gives different types
+        # for the same column (e.g. all-null OpponentTitle in one batch, strings in the next)
+        self.schema = output_schema(with_moves)
+        self.writer = pq.ParquetWriter(
+            self.write_path,
+            self.schema,
+            compression=compression,
+            use_dictionary=PARQUET_DICTIONARY_COLUMNS,
+        )
+        self.pending: list[pa.RecordBatch] = []
+        self.pending_rows = 0
+
+        if append:
+            # parquet files can't be appended in place - stream existing rows into the new file
+            for existing_batch in pq.ParquetFile(file_path).iter_batches():
+                self.write(conform_table(pa.Table.from_batches([existing_batch]), self.schema))
+
+    def write(self, game_headers: Union[list[PGNGameHeaderPersonified], pa.Table]) -> None:
+        if isinstance(game_headers, pa.Table):
+            batches = game_headers.select(self.schema.names).cast(self.schema).to_batches()
+        elif game_headers:
+            batches = [arrow_batch_for(game_headers, self.schema)]
+        else:
+            return
+
+        for batch in batches:
+            self.pending.append(batch)
+            self.pending_rows += batch.num_rows
+        if self.pending_rows >= self.row_group_size:
+            self.flush(full_row_groups_only=True)
+
+    def flush(self, full_row_groups_only: bool = False) -> None:
+        """Writes buffered rows as row groups; the incomplete last group is kept if full_row_groups_only"""
+        table = pa.Table.from_batches(self.pending, schema=self.schema)
+        rows_to_write = table.num_rows
+        if full_row_groups_only:
+            rows_to_write -= rows_to_write % self.row_group_size
+
+        if rows_to_write:
+            self.writer.write_table(table.slice(0, rows_to_write), row_group_size=self.row_group_size)
+        self.pending = table.slice(rows_to_write).to_batches()
+        self.pending_rows = table.num_rows - rows_to_write
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+        os.replace(self.write_path, self.file_path)
+
+    def abort(self) -> None:
+        self.writer.close()
+        os.remove(self.write_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class DatasetSink:
+    """
+    Writes game headers to a hive-partitioned parquet dataset (DATASET_PARTITIONING),
+    so queries filtered on player, date or time control type read only matching files.
+    Parquet files keep min/max statistics of every column.
+
+    Rows are buffered and flushed every row_group_size rows, each flush adds a file to every
+    partition it has rows for. Partition columns are stored in directory names only. Files have
+    the columns of output_schema(with_moves) - files of the same dataset may differ in movetext
+    columns, they are read with the full schema (see PipelineHelper.read_output).
+
+    New dataset is written into a temporary directory which replaces the old one on successful close.
+    In append mode files are added next to the existing ones (which are never rewritten): they
+    are written into a staging directory next to the dataset (<dataset>.<run>.staging) and moved
+    into the dataset on close, after their list is saved into the commit journal (<dataset>.commit.json).
+    A run which crashes before that leaves its files in staging only - the dataset is intact and
+    they are removed by the next run; a crash while moving the files is rolled forward by
+    the next run from the journal (see recover).
+    """
+
+    def __init__(
+        self,
+        dir_path: str,
+        append: bool = False,
+        row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+        compression: str = PARQUET_COMPRESSION,
+        with_moves: bool = False,
+    ):
+        self.dir_path = dir_path
+        self.append = append and os.path.exists(dir_path)
+        # file names are unique per run, so appended files never overwrite existing ones
+        self.run_id = uuid.uuid4().hex
+        if self.append:
+            self.recover(dir_path)
+        self.write_path = f"{dir_path}.{self.run_id}.staging" if self.append else f"{dir_path}.tmp"
+        self.row_group_size = row_group_size
+        self.schema = output_schema(with_moves)
+        self.partitioning = ds.partitioning(DATASET_PARTITIONING, flavor="hive")
+        self.file_options = ds.ParquetFileFormat().make_write_options(
+            compression=compression,
+            use_dictionary=PARQUET_DICTIONARY_COLUMNS,
+            write_statistics=True,
+        )
+        self.flushes_count = 0
+        self.written_paths: list[str] = []
+        self.pending: list[pa.RecordBatch] = []
+        self.pending_rows = 0
+
+        if not self.append and os.path.exists(self.write_path):
+            shutil.rmtree(self.write_path)  # leftover of a crashed run
+        os.makedirs(self.write_path, exist_ok=True)
+
+    def write(self, game_headers: Union[list[PGNGameHeaderPersonified], pa.Table]) -> None:
+        if isinstance(game_headers, pa.Table):
+            batches = game_headers.select(self.schema.names).cast(self.schema).to_batches()
+        elif game_headers:
+            batches = [arrow_batch_for(game_headers, self.schema)]
+        else:
+            return
+
+        for batch in batches:
+            self.pending.append(batch)
+            self.pending_rows += batch.num_rows
+        if self.pending_rows >= self.row_group_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pending_rows:
+            return
+        table = pa.Table.from_batches(self.pending, schema=self.schema)
+        table = table.append_column("Year", pc.year(table["UTCDateTime"]))
+        table = table.append_column("Month", pc.month(table["UTCDateTime"]))
+
+        ds.write_dataset(
+            table,
+            self.write_path,
+            format="parquet",
+            partitioning=self.partitioning,
+            basename_template=f"part-{self.run_id}-{self.flushes_count}-{{i}}.parquet",
+            file_options=self.file_options,
+            max_rows_per_group=self.row_group_size,
+            existing_data_behavior="overwrite_or_ignore",
+            file_visitor=lambda written_file: self.written_paths.append(written_file.path),
+        )
+        self.flushes_count += 1
+        self.pending = []
+        self.pending_rows = 0
+
+    @classmethod
+    def journal_path(cls, dir_path: str) -> str:
+        return f"{dir_path}.commit.json"
+
+    @classmethod
+    def commit_staged(cls, dir_path: str, staging_path: str, files: list[str]) -> None:
+        """Moves staged files (paths relative to staging_path) into the dataset, then forgets the journal"""
+        for file in files:
+            staged_path = os.path.join(staging_path, file)
+            if os.path.exists(staged_path):  # not moved yet by the interrupted commit
+                os.makedirs(os.path.dirname(os.path.join(dir_path, file)), exist_ok=True)
+                os.replace(staged_path, os.path.join(dir_path, file))
+        os.remove(cls.journal_path(dir_path))
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+    @classmethod
+    def recover(cls, dir_path: str) -> None:
+        """
+        Finishes the append of a run which crashed while moving its files into the dataset
+        and removes staging directories of runs which crashed before committing
+        """
+        journal_path = cls.journal_path(dir_path)
+        if os.path.exists(journal_path):
+            with open(journal_path, encoding="utf-8") as journal_file:
+                journal = json.load(journal_file)
+            print(f"Completing interrupted append to '{dir_path}'...")
+            staging_path = os.path.join(os.path.dirname(dir_path), journal["staging"])
+            cls.commit_staged(dir_path, staging_path, journal["files"])
+        for staging_path in glob.glob(f"{glob.escape(dir_path)}.*.staging"):
+            shutil.rmtree(staging_path)
+
+    def close(self) -> None:
+        self.flush()
+        if not self.append:
+            if os.path.exists(self.dir_path):
+                shutil.rmtree(self.dir_path)
+            os.replace(self.write_path, self.dir_path)
+            return
+
+        # the journal makes the append all-or-nothing: once it's saved, the files are committed
+        files = [os.path.relpath(path, self.write_path) for path in self.written_paths]
+        journal_path = self.journal_path(self.dir_path)
+        with open(f"{journal_path}.tmp", "w", encoding="utf-8") as journal_file:
+            json.dump({"staging": os.path.basename(self.write_path), "files": files}, journal_file)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(f"{journal_path}.tmp", journal_path)
+        self.commit_staged(self.dir_path, self.write_path, files)
+
+    def abort(self) -> None:
+        shutil.rmtree(self.write_path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class DuckDBSink:
+    """
+    Upserts game headers into the games table (DUCKDB_TABLE) of a DuckDB database file.
+
+    Rows are keyed by game id and player, so exporting overlapping periods again updates
+    existing rows instead of adding duplicates - the database is one continuously updated store
+    (the table is never recreated, append mode makes no difference; columns of output_schema(with_moves)
+    added since the table was created are added to it as nullable columns, movetext columns of
+    an existing table are kept).
+    Batches are inserted as Arrow tables, all rows of an export are committed in one transaction.
+    """
+
+    def __init__(self, file_path: str, append: bool = False, with_moves: bool = False):
+        self.file_path = file_path
+        self.connection = duckdb.connect(file_path)
+        existing_columns = self.table_columns(self.connection)
+        self.schema = output_schema(with_moves or has_movetext_columns(existing_columns))
+
+        columns = ", ".join(
+            f"{field.name} {ARROW_TO_DUCKDB_TYPES[field.type]}" for field in self.schema
+        )
+        self.connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {DUCKDB_TABLE} "
+            f"(GameId VARCHAR, {columns}, PRIMARY KEY ({', '.join(DUCKDB_KEY_COLUMNS)}))"
+        )
+        for field in self.schema:
+            self.connection.execute(
+                f"ALTER TABLE {DUCKDB_TABLE} ADD COLUMN IF NOT EXISTS "
+                f"{field.name} {ARROW_TO_DUCKDB_TYPES[field.type]}"
+            )
+        for column in DUCKDB_INDEXED_COLUMNS:
+            self.connection.execute(
+                f"CREATE INDEX IF NOT EXISTS {DUCKDB_TABLE}_{column} ON {DUCKDB_TABLE} ({column})"
+            )
+
+        self.insert_sql = (
+            f"INSERT OR REPLACE INTO {DUCKDB_TABLE} (GameId, {', '.join(self.schema.names)}) "
+            f"SELECT {DUCKDB_GAME_ID_SQL}, {', '.join(self.schema.names)} "
+            f"FROM batch"
+        )
+        self.connection.begin()
+
+    @classmethod
+    def table_columns(cls, connection) -> list[str]:
+        """Columns of the games table (none if it doesn't exist yet)"""
+        rows = connection.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name = ?", [DUCKDB_TABLE]
+        ).fetchall()
+        return [name for (name,) in rows]
+
+    def write(self, game_headers: Union[list[PGNGameHeaderPersonified], pa.Table]) -> None:
+        if isinstance(game_headers, pa.Table):
+            batch = game_headers.select(self.schema.names).cast(self.schema)
+        elif game_headers:
+            batch = pa.Table.from_batches([arrow_batch_for(game_headers, self.schema)])
+        else:
+            return
+
+        # registered Arrow table is scanned by DuckDB in place, without row-by-row conversion
+        self.connection.register("batch", batch)
+        try:
+            self.connection.execute(self.insert_sql)
+        finally:
+            self.connection.unregister("batch")
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+    def abort(self) -> None:
+        self.connection.rollback()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
 # useful methods for data processing pipeline
 # download games from API -> transform -> save to csv
 class PipelineHelper:
     @staticmethod
-    def write_to_csv(
-        game_headers: list[PGNGameHeaderPersonified], file_path: str
-    ) -> None:
-        # Extract headers from PGNGameHeader fields
-        header_fields = [field.name for field in fields(PGNGameHeaderPersonified)]
+    def batched(items: Iterable, batch_size: int) -> Iterator[list]:
+        """Splits iterable into lists of batch_size items (the last one may be shorter)"""
+        iterator = iter(items)
+        while batch := list(islice(iterator, batch_size)):
+            yield batch
 
-        with open(file_path, mode="w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=header_fields)
+    @staticmethod
+    def games_keys(
+        game_headers: Union[list[PGNGameHeaderPersonified], pa.Table]
+    ) -> Iterator[tuple[str, Optional[datetime]]]:
+        """(Site, UTCDateTime) of every game in a batch of dataclasses or a columnar batch"""
+        if isinstance(game_headers, pa.Table):
+            return zip(game_headers["Site"].to_pylist(), game_headers["UTCDateTime"].to_pylist())
+        return ((game.Site, game.UTCDateTime) for game in game_headers)
 
-            # Write the headers to the first row
-            writer.writeheader()
+    @staticmethod
+    def read_output(
+        output_format: str, file_path: str, columns: list[str]
+    ) -> Iterator[pa.Table]:
+        """
+        Reads columns of exported games back from an output of any format, batch by batch.
+        Columns missing in outputs written before they were added are read as nulls.
+        """
+        schema = arrow_schema_for(PGNGameHeaderPersonified)
+        columns_schema = pa.schema([schema.field(name) for name in columns])
+        if output_format == "csv":
+            convert_options = pv.ConvertOptions(
+                include_columns=columns,
+                include_missing_columns=True,
+                column_types={name: schema.field(name).type for name in columns},
+                strings_can_be_null=True,  # None values are written as empty strings
+            )
+            with pv.open_csv(file_path, convert_options=convert_options) as reader:
+                for batch in reader:
+                    yield conform_table(pa.Table.from_batches([batch]), columns_schema)
+        elif output_format == "parquet":
+            parquet_file = pq.ParquetFile(file_path)
+            present = [name for name in columns if name in parquet_file.schema_arrow.names]
+            for batch in parquet_file.iter_batches(columns=present):
+                yield conform_table(pa.Table.from_batches([batch]), columns_schema)
+        elif output_format == "dataset":
+            # explicit schema - files written before columns were added are read with nulls in them
+            dataset_schema = pa.unify_schemas(
+                [schema, pa.schema([field for field in DATASET_PARTITIONING if field.name not in schema.names])]
+            )
+            dataset = ds.dataset(
+                file_path,
+                schema=dataset_schema,
+                format="parquet",
+                partitioning=ds.partitioning(DATASET_PARTITIONING, flavor="hive"),
+            )
+            for batch in dataset.to_batches(columns=columns):
+                yield pa.Table.from_batches([batch]).cast(columns_schema)
+        elif output_format == "duckdb":
+            with duckdb.connect(file_path, read_only=True) as connection:
+                table_columns = DuckDBSink.table_columns(connection)
+                present = [name for name in columns if name in table_columns]
+                table = connection.sql(f"SELECT {', '.join(present)} FROM {DUCKDB_TABLE}").fetch_arrow_table()
+                yield conform_table(table, columns_schema)
+        else:
+            raise ValueError(f"Unknown output format {output_format}")
+
+    @staticmethod
+    def open_sink(
+        output_format: str,
+        file_path: str,
+        append: bool = False,
+        row_group_size: int = PARQUET_ROW_GROUP_SIZE,
+        compression: str = PARQUET_COMPRESSION,
+        with_moves: bool = False,
+    ) -> Union[CSVSink, ParquetSink, DatasetSink, DuckDBSink]:
+        """Sink of an output; movetext columns (MOVETEXT_COLUMNS) are written with_moves only"""
+        if output_format == "parquet":
+            return ParquetSink(file_path, append, row_group_size, compression, with_moves)
+        if output_format == "dataset":
+            return DatasetSink(file_path, append, row_group_size, compression, with_moves)
+        if output_format == "duckdb":
+            return DuckDBSink(file_path, append, with_moves)
+        return CSVSink(file_path, append, with_moves)
 
-            # Write each game header as a row in the CSV
-            for game_header in game_headers:
-                writer.writerow(
-                    {field: getattr(game_header, field) for field in header_fields}
-                )
+    @staticmethod
+    def write_to_csv(
+        game_headers: list[PGNGameHeaderPersonified], file_path: str
+    ) -> None:
+        with CSVSink(file_path) as sink:
+            sink.write(game_headers)
 
     @staticmethod
     def write_to_parquet(
         game_headers: list[PGNGameHeaderPersonified], file_path: str
     ) -> None:
-        data = [asdict(game) for game in game_headers]
-        df = pd.DataFrame(data)
-        table = pa.Table.from_pandas(df)
-        pq.write_table(table, file_path)
+        with ParquetSink(file_path) as sink:
+            sink.write(game_headers)
@@ -0,0 +1,350 @@
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import chess
+import chess.polyglot
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from helpers.archive_helper import PGNArchive
+from helpers.backfill_helper import GameDetails
+from helpers.lichess_api_helper import LichessAPIHelper
+from helpers.movetext_helper import MovetextParser
+from helpers.options_helper import DEFAULT_MAX_PLY
+from helpers.pgn_parser_helper import PGNHeaderParser
+from helpers.pipeline_helper import VARIANT_NAMES, PipelineHelper
+
+POSITIONS_FILE_SUFFIX = ".positions.idx"
+POSITIONS_GAMES_SUFFIX = ".positions.games.parquet"
+
+# index file: header (magic, entries count, positions count, max ply), then the entries and
+# the positions column by column (ENTRY_COLUMNS, POSITION_COLUMNS order), every column starting
+# at a multiple of COLUMN_ALIGNMENT bytes
+POSITIONS_MAGIC = b"LPSPOS02"
+HEADER_FORMAT = "<8sQQI"
+HEADER_SIZE = 64
+COLUMN_ALIGNMENT = 64
+
+# an entry per distinct position of a game, grouped by position and player (then in row order)
+ENTRY_COLUMNS = {
+    "Row": np.uint32,  # row of the game in <output>.positions.games.parquet
+    "Ply": np.uint16,  # plies played before the position was first reached (0 - initial position)
+    "Score": np.uint8,  # player's result: 2 - win, 1 - draw, 0 - loss, UNKNOWN_SCORE - unfinished
+    "RatingChange": np.float32,  # player's rating change, NaN if unknown
+    "Player": np.uint16,  # player of the game row, index in the sorted list of the index's players
+}
+# a row per distinct (position, player), sorted by hash and player, with the totals of its entries
+# precomputed, so a query doesn't depend on the number of games of the position
+POSITION_COLUMNS = {
+    "Hash": np.uint64,  # Polyglot Zobrist hash of the position
+    "PositionPlayer": np.uint16,  # same codes as the entries' Player
+    "Start": np.uint32,  # first entry of the group, its entries end where the next group's start
+    "Wins": np.uint32,
+    "Draws": np.uint32,
+    "Losses": np.uint32,
+    "RatingChangeSum": np.float64,
+    "RatingChangeCount": np.uint32,  # entries with a known rating change
+}
+UNKNOWN_SCORE = 255
+
+# output columns kept for indexed games (the games table of the index)
+GAMES_COLUMNS = ["Site", "Player", "Color", "UTCDateTime", "Result", "PlayerRatingChange", "Variant"]
+
+# games with moves replayed from the standard initial position
+STANDARD_VARIANTS = {VARIANT_NAMES["standard"], None}
+
+# games per hashing task sent to a worker process
+HASH_TASK_GAMES = 2000
+
+# move sequences (prefixes of games) whose position hashes are remembered by a worker -
+# games of a player mostly start with the same openings, so their positions are hashed once
+PREFIX_CACHE_SIZE = 200_000
+
+
+@dataclass(slots=True)
+class PositionStats:
+    Games: int = 0
+    Wins: int = 0
+    Draws: int = 0
+    Losses: int = 0
+    Score: Optional[float] = None  # player's share of points in finished games
+    AvgRatingChange: Optional[float] = None
+    TotalRatingChange: float = 0.0
+
+
+class PositionIndex:
+    """
+    Opening-explorer index of the games of an output: every distinct position reached in the first
+    max_ply plies of a game -> (game row, ply, player's result and rating change), so the player's
+    score after an exact position can be looked up regardless of the move order leading to it.
+
+    Moves are taken from backfilled game details (see GameDetails) and from the PGN archive of games
+    exported with --with-moves --archive. Entries and per (position, player) totals are stored column
+    by column in a flat file (<output>.positions.idx) which is memory-mapped for queries - a query is
+    a binary search over position hashes and a sum over the position's players, and the games of
+    a position are a contiguous slice of entries. Indexed games are in <output>.positions.games.parquet;
+    the index is a snapshot, rebuilt after exports.
+    """
+
+    def __init__(self, output_path: str):
+        self.output_path = output_path
+        index_path = self.index_path(output_path)
+        with open(index_path, "rb") as index_file:
+            magic, self.entries_count, self.positions_count, self.max_ply = struct.unpack_from(
+                HEADER_FORMAT, index_file.read(HEADER_SIZE)
+            )
+        if magic != POSITIONS_MAGIC:
+            raise ValueError(f"'{index_path}' is not a positions index (or was built by an older version)")
+
+        self.columns = {}
+        for name, dtype, offset, count in self.column_offsets(self.entries_count, self.positions_count):
+            self.columns[name] = (
+                np.memmap(index_path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+                if count
+                else np.empty(0, dtype)
+            )
+
+        self.games = pq.read_table(self.games_path(output_path))
+        self.players = {
+            player: code for code, player in enumerate(self.sorted_players(self.games["Player"]))
+        }
+
+    @classmethod
+    def index_path(cls, output_path: str) -> str:
+        return f"{output_path}{POSITIONS_FILE_SUFFIX}"
+
+    @classmethod
+    def games_path(cls, output_path: str) -> str:
+        return f"{output_path}{POSITIONS_GAMES_SUFFIX}"
+
+    @classmethod
+    def column_offsets(cls, entries_count: int, positions_count: int) -> list[tuple[str, type, int, int]]:
+        """(name, dtype, file offset, length) of every column of the index file"""
+        offsets, offset = [], HEADER_SIZE
+        for columns, count in ((ENTRY_COLUMNS, entries_count), (POSITION_COLUMNS, positions_count)):
+            for name, dtype in columns.items():
+                offsets.append((name, dtype, offset, count))
+                offset += -(-count * np.dtype(dtype).itemsize // COLUMN_ALIGNMENT) * COLUMN_ALIGNMENT
+        return offsets
+
+    @classmethod
+    def sorted_players(cls, players: pa.ChunkedArray) -> list[str]:
+        return sorted(pc.unique(players).to_pylist())
+
+    @classmethod
+    def load_moves(cls, output_path: str, output_format: str, max_ply: int) -> dict[str, list[str]]:
+        """Game id -> SAN of its first max_ply moves, from backfilled details and the PGN archive"""
+        moves = {}
+        details = GameDetails(output_path, output_format).load()
+        for game_id, game_moves in zip(details["GameId"].to_pylist(), details["Moves"].to_pylist()):
+            if game_moves:
+                moves[game_id] = game_moves.split()[:max_ply]
+
+        archive_path = PGNArchive.archive_path_for(output_path)
+        if not os.path.exists(PGNArchive.index_path(archive_path)):
+            return moves
+        archive = PGNArchive(archive_path)
+        with open(archive_path, "rb") as archive_file:
+            for offset, length in archive.frames():
+                for game_text in PGNHeaderParser.split_games([archive.read_frame(archive_file, offset, length)]):
+                    site = PGNHeaderParser.parse_tags(game_text).get("Site", "")
+                    game_id = LichessAPIHelper.game_id_from_site(site)
+                    if game_id not in moves:
+                        game_moves = MovetextParser.san_moves(PGNHeaderParser.split_movetext(game_text))
+                        if game_moves:  # games exported without moves have none
+                            moves[game_id] = game_moves[:max_ply]
+        return moves
+
+    @classmethod
+    def build(
+        cls, output_path: str, output_format: str, max_ply: int = DEFAULT_MAX_PLY, workers: int = 1
+    ) -> "PositionIndex":
+        """Indexes positions of the output's games with known moves (see load_moves) and opens the index"""
+        games = pa.concat_tables(PipelineHelper.read_output(output_format, output_path, GAMES_COLUMNS))
+        game_ids = [LichessAPIHelper.game_id_from_site(site or "") for site in games["Site"].to_pylist()]
+        moves = cls.load_moves(output_path, output_format, max_ply)
+
+        indexed_rows = [
+            row
+            for row, (game_id, variant) in enumerate(zip(game_ids, games["Variant"].to_pylist()))
+            if game_id in moves and variant in STANDARD_VARIANTS
+        ]
+        indexed_ids = [game_ids[row] for row in indexed_rows]
+        games = games.take(indexed_rows).drop_columns(["Site", "Variant"])
+        games = games.add_column(0, "GameId", pa.array(indexed_ids, pa.string()))
+        games_moves = [(row, moves[game_id]) for row, game_id in enumerate(indexed_ids)]
+        tasks = list(PipelineHelper.batched(games_moves, HASH_TASK_GAMES))
+
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(hash_games_positions, tasks, [max_ply] * len(tasks)))
+        else:
+            results = [hash_games_positions(task, max_ply) for task in tasks]
+        hashes = np.concatenate([result[0] for result in results] or [np.empty(0, np.uint64)])
+        rows = np.concatenate([result[1] for result in results] or [np.empty(0, np.uint32)])
+        plies = np.concatenate([result[2] for result in results] or [np.empty(0, np.uint16)])
+
+        # per game row values, spread over the entries
+        results_by_row = games["Result"].to_numpy(zero_copy_only=False)
+        scores_by_row = np.full(games.num_rows, UNKNOWN_SCORE, np.uint8)
+        finished = ~np.isnan(results_by_row)
+        scores_by_row[finished] = (results_by_row[finished] * 2).astype(np.uint8)
+        rating_changes_by_row = games["PlayerRatingChange"].to_numpy(zero_copy_only=False).astype(np.float32)
+        player_codes = {player: code for code, player in enumerate(cls.sorted_players(games["Player"]))}
+        players_by_row = np.array([player_codes[player] for player in games["Player"].to_pylist()], np.uint16)
+
+        # stable sort keeps the games of a position and player in row order
+        order = np.lexsort((players_by_row[rows], hashes))
+        hashes, rows = hashes[order], rows[order]
+        columns = {
+            "Row": rows,
+            "Ply": plies[order],
+            "Score": scores_by_row[rows],
+            "RatingChange": rating_changes_by_row[rows],
+            "Player": players_by_row[rows],
+        }
+        columns.update(cls.position_totals(hashes, columns))
+        cls.write(output_path, columns, max_ply, games)
+        return cls(output_path)
+
+    @classmethod
+    def position_totals(cls, hashes: np.ndarray, entries: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+        """POSITION_COLUMNS of the ENTRY_COLUMNS (sorted by hash and player) and their hashes"""
+        if not len(hashes):
+            return {name: np.empty(0, dtype) for name, dtype in POSITION_COLUMNS.items()}
+        players, scores, rating_changes = entries["Player"], entries["Score"], entries["RatingChange"]
+        group_starts = np.concatenate(([True], (hashes[1:] != hashes[:-1]) | (players[1:] != players[:-1])))
+        starts = np.flatnonzero(group_starts)
+        known_changes = ~np.isnan(rating_changes)
+        totals = {"Hash": hashes[starts], "PositionPlayer": players[starts], "Start": starts}
+        for name, score in (("Wins", 2), ("Draws", 1), ("Losses", 0)):
+            totals[name] = np.add.reduceat((scores == score).astype(np.uint32), starts)
+        known_rating_changes = np.where(known_changes, rating_changes, 0).astype(np.float64)
+        totals["RatingChangeSum"] = np.add.reduceat(known_rating_changes, starts)
+        totals["RatingChangeCount"] = np.add.reduceat(known_changes.astype(np.uint32), starts)
+        return totals
+
+    @classmethod
+    def write(cls, output_path: str, columns: dict[str, np.ndarray], max_ply: int, games: pa.Table) -> None:
+        entries_count, positions_count = len(columns["Row"]), len(columns["Hash"])
+        index_path, games_path = cls.index_path(output_path), cls.games_path(output_path)
+        with open(f"{index_path}.tmp", "wb") as index_file:
+            header = struct.pack(HEADER_FORMAT, POSITIONS_MAGIC, entries_count, positions_count, max_ply)
+            index_file.write(header.ljust(HEADER_SIZE, b"\0"))
+            for name, dtype, offset, _ in cls.column_offsets(entries_count, positions_count):
+                index_file.seek(offset)
+                index_file.write(columns[name].astype(dtype, copy=False).tobytes())
+        pq.write_table(games, f"{games_path}.tmp")
+        os.replace(f"{games_path}.tmp", games_path)
+        os.replace(f"{index_path}.tmp", index_path)
+
+    @classmethod
+    def position_hash(cls, fen: Optional[str] = None, moves: Optional[list[str]] = None) -> int:
+        """Zobrist hash of the position given by FEN and/or moves (SAN or UCI) from it"""
+        board = chess.Board(fen) if fen else chess.Board()
+        for move in moves or []:
+            try:
+                board.push_san(move)
+            except ValueError:
+                try:
+                    board.push_uci(move)
+                except ValueError:
+                    raise ValueError(f"illegal move {move} in {board.fen()}") from None
+        return chess.polyglot.zobrist_hash(board)
+
+    def groups(self, position_hash: int, player: Optional[str] = None) -> slice:
+        """Rows of the POSITION_COLUMNS of the position (of the player's games only if player is given)"""
+        hashes = self.columns["Hash"]
+        key = np.uint64(position_hash)
+        start, end = int(np.searchsorted(hashes, key, "left")), int(np.searchsorted(hashes, key, "right"))
+        if player is None:
+            return slice(start, end)
+        code = self.players.get(player)
+        if code is None:
+            return slice(0, 0)
+        offset = int(np.searchsorted(self.columns["PositionPlayer"][start:end], code))
+        if start + offset < end and self.columns["PositionPlayer"][start + offset] == code:
+            return slice(start + offset, start + offset + 1)
+        return slice(0, 0)
+
+    def entries(self, groups: slice) -> slice:
+        """Slice of the entries of consecutive POSITION_COLUMNS rows"""
+        if groups.start == groups.stop:
+            return slice(0, 0)
+        starts = self.columns["Start"]
+        end = int(starts[groups.stop]) if groups.stop < self.positions_count else self.entries_count
+        return slice(int(starts[groups.start]), end)
+
+    def query(
+        self, fen: Optional[str] = None, moves: Optional[list[str]] = None, player: Optional[str] = None
+    ) -> PositionStats:
+        """Player's results in games which reached the position (all players of the index by default)"""
+        return self.stats(self.position_hash(fen, moves), player)
+
+    def stats(self, position_hash: int, player: Optional[str] = None) -> PositionStats:
+        groups = self.groups(position_hash, player)
+        entries = self.entries(groups)
+        wins, draws, losses, known_changes_count = (
+            int(self.columns[name][groups].sum()) for name in ("Wins", "Draws", "Losses", "RatingChangeCount")
+        )
+        total_rating_change = float(self.columns["RatingChangeSum"][groups].sum())
+        finished = wins + draws + losses
+        return PositionStats(
+            Games=entries.stop - entries.start,
+            Wins=wins,
+            Draws=draws,
+            Losses=losses,
+            Score=(wins + draws / 2) / finished if finished else None,
+            AvgRatingChange=total_rating_change / known_changes_count if known_changes_count else None,
+            TotalRatingChange=total_rating_change,
+        )
+
+    def games_at(
+        self, fen: Optional[str] = None, moves: Optional[list[str]] = None, player: Optional[str] = None
+    ) -> pa.Table:
+        """Indexed games which reached the position, with the ply it was reached at"""
+        entries = self.entries(self.groups(self.position_hash(fen, moves), player))
+        rows, plies = self.columns["Row"][entries], self.columns["Ply"][entries]
+        return self.games.take(pa.array(rows, pa.uint32())).append_column("Ply", pa.array(plies, pa.uint16()))
+
+
+def hash_games_positions(
+    games: list[tuple[int, list[str]]], max_ply: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Worker of PositionIndex.build: (row, SAN moves) of games -> hashes, rows and plies of their
+    distinct positions. A game with an illegal move is indexed up to that move.
+    """
+    hashes, rows, plies = [], [], []
+    prefix_hashes: dict[str, int] = {}  # moves from the initial position -> hash, see PREFIX_CACHE_SIZE
+    for row, moves in games:
+        board = chess.Board()
+        seen = set()
+        prefix = ""
+        for ply in range(min(len(moves), max_ply) + 1):
+            if ply:
+                prefix = f"{prefix} {moves[ply - 1]}"
+            position_hash = prefix_hashes.get(prefix)
+            if position_hash is None:
+                try:
+                    # the board catches up with the moves of the cached prefix only when needed
+                    for move in moves[len(board.move_stack) : ply]:
+                        board.push_san(move.rstrip("!?"))
+                except ValueError:
+                    break
+                position_hash = chess.polyglot.zobrist_hash(board)
+                if len(prefix_hashes) >= PREFIX_CACHE_SIZE:
+                    prefix_hashes.clear()
+                prefix_hashes[prefix] = position_hash
+
+            if position_hash not in seen:
+                seen.add(position_hash)
+                hashes.append(position_hash)
+                rows.append(row)
+                plies.append(ply)
+    return np.array(hashes, np.uint64), np.array(rows, np.uint32), np.array(plies, np.uint16)
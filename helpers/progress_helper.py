@@ -0,0 +1,235 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, TextIO
+
+from helpers.cache_helper import ResponseCache
+from helpers.options_helper import PROGRESS_INTERVAL
+from helpers.stages_helper import PipelineMetrics
+from helpers.urllib3_helper import RequestStats
+
+
+class UserProgress:
+    """Progress of one user's export: games are downloaded newest first, from `until` back to `since`"""
+
+    __slots__ = ("since", "until", "games", "oldest_ts", "done", "failed")
+
+    def __init__(self, since: int, until: int):
+        self.since = since
+        self.until = until
+        self.games = 0
+        self.oldest_ts: Optional[int] = None
+        self.done = False
+        self.failed = False
+
+    def fraction(self, max_games: Optional[int]) -> float:
+        """Part of the export done: the part of the period covered so far, or of --max-games, if reached sooner"""
+        if self.done:
+            return 1.0
+        covered = 0.0
+        if self.oldest_ts is not None and self.until > self.since:
+            covered = (self.until - self.oldest_ts) / (self.until - self.since)
+        if max_games:
+            covered = max(covered, self.games / max_games)
+        return min(1.0, max(0.0, covered))
+
+
+class ExportProgress:
+    """
+    Live progress of an export: games exported, games/sec and ETA, printed every `interval`
+    seconds by a background thread (on a terminal - one line, rewritten in place). The ETA
+    is derived from the part of the since/until period covered by the games received so far
+    (the API sends the newest games first), so it's approximate with --shards, where windows
+    are downloaded in parallel.
+
+    With metrics_path, the progress, per-stage counters (PipelineMetrics), HTTP counters
+    (RequestStats) and cache hit rates are also written as JSON into that file - with every
+    progress line and at the end, with the final status - replaced atomically, so monitoring
+    can scrape it any time.
+    """
+
+    def __init__(
+        self,
+        usernames: list[str],
+        since: int,
+        until: int,
+        pipeline_metrics: PipelineMetrics,
+        request_stats: RequestStats,
+        response_cache: Optional[ResponseCache] = None,
+        max_games: Optional[int] = None,
+        metrics_path: Optional[str] = None,
+        interval: float = PROGRESS_INTERVAL,
+        stream: TextIO = sys.stdout,
+    ):
+        self.users = {username: UserProgress(since, until) for username in usernames}
+        self.pipeline_metrics = pipeline_metrics
+        self.request_stats = request_stats
+        self.response_cache = response_cache
+        self.max_games = max_games
+        self.metrics_path = metrics_path
+        self.interval = interval
+        self.stream = stream
+        self.in_place = stream.isatty()
+
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.status = "running"
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start_user(self, username: str, since: int) -> None:
+        """The user's export starts at `since` (later than the period start for incremental exports)"""
+        with self.lock:
+            self.users[username].since = since
+
+    def update(self, username: str, games_count: int, games_times: list[Optional[datetime]]) -> None:
+        """games_count games of the user exported so far, the last batch played at games_times"""
+        known_times = [game_time for game_time in games_times if game_time is not None]
+        with self.lock:
+            user = self.users[username]
+            user.games = games_count
+            if known_times:
+                oldest = min(known_times)
+                if oldest.tzinfo is None:
+                    oldest = oldest.replace(tzinfo=timezone.utc)
+                oldest_ts = int(oldest.timestamp() * 1000)
+                user.oldest_ts = oldest_ts if user.oldest_ts is None else min(user.oldest_ts, oldest_ts)
+
+    def finish_user(self, username: str, failed: bool = False) -> None:
+        with self.lock:
+            self.users[username].done = True
+            self.users[username].failed = failed
+
+    def snapshot(self) -> dict:
+        """Progress and metrics of the export, as written into the metrics file"""
+        elapsed = time.perf_counter() - self.started
+        with self.lock:
+            games = sum(user.games for user in self.users.values())
+            fraction = sum(user.fraction(self.max_games) for user in self.users.values()) / len(self.users)
+            users = {
+                username: {
+                    "games": user.games,
+                    "progress": round(user.fraction(self.max_games), 4),
+                    "done": user.done,
+                    "failed": user.failed,
+                }
+                for username, user in self.users.items()
+            }
+            status = self.status
+        eta = elapsed * (1 - fraction) / fraction if 0 < fraction < 1 else (0.0 if fraction >= 1 else None)
+
+        snapshot = {
+            "status": status,
+            "started_at": datetime.fromtimestamp(self.started_at, tz=timezone.utc).isoformat(),
+            "elapsed_seconds": round(elapsed, 3),
+            "games": games,
+            "games_per_second": round(games / elapsed, 1) if elapsed else 0.0,
+            "progress": round(fraction, 4),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "users": users,
+            "stages": self.pipeline_metrics.to_dict(),
+            "http": dict(vars(self.request_stats)),
+        }
+        if self.response_cache:
+            snapshot["response_cache"] = dict(vars(self.response_cache.stats))
+        return snapshot
+
+    def line(self, snapshot: dict) -> str:
+        eta = snapshot["eta_seconds"]
+        eta_text = time.strftime("%H:%M:%S", time.gmtime(eta)) if eta is not None else "?"
+        return (
+            f"{snapshot['games']:,} games, {snapshot['games_per_second']:,.0f} games/sec, "
+            f"{snapshot['progress']:.0%} of the period, ETA {eta_text}, "
+            f"{snapshot['http']['bytes_received'] / 2**20:,.1f} MiB received"
+        )
+
+    def report(self) -> None:
+        """Prints the progress line and updates the metrics file"""
+        snapshot = self.snapshot()
+        if self.in_place:
+            self.stream.write(f"\r\033[K{self.line(snapshot)}")
+        else:
+            self.stream.write(f"{self.line(snapshot)}\n")
+        self.stream.flush()
+        if self.metrics_path:
+            self.write_metrics(snapshot)
+
+    def write_metrics(self, snapshot: dict) -> None:
+        with open(f"{self.metrics_path}.tmp", "w") as file:
+            json.dump(snapshot, file, indent=2)
+        os.replace(f"{self.metrics_path}.tmp", self.metrics_path)
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, daemon=True, name="progress")
+        self.thread.start()
+
+    def stop(self, status: str) -> None:
+        """Stops the progress thread, reports the final progress with the status (finished, failed)"""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        with self.lock:
+            # an export of several users fails when any of them failed
+            self.status = "failed" if any(user.failed for user in self.users.values()) else status
+        self.report()
+        if self.in_place:
+            self.stream.write("\n")
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        failed = exc_type is not None and not (exc_type is SystemExit and exc_value.code in (0, None))
+        self.stop("failed" if failed else "finished")
+
+
+class ThreadsProfiler:
+    """
+    cProfile of the calling thread and of every thread started while the profiler is on -
+    pipeline stages run in their own threads, which cProfile alone doesn't see. Profiles of
+    all threads are merged into one report. Processes (e.g. the movetext workers) are not profiled.
+    """
+
+    def __init__(self):
+        self.profiles: list[cProfile.Profile] = []
+        self.lock = threading.Lock()
+
+    def profile_thread(self, frame, event, arg) -> None:
+        """threading.setprofile hook: runs once in every new thread, replaced by the thread's profiler"""
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def __enter__(self):
+        threading.setprofile(self.profile_thread)
+        self.profile_thread(None, "call", None)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        threading.setprofile(None)
+        self.profiles[0].disable()
+
+    def report(self, path: str, top: int = 25) -> str:
+        """Saves merged statistics into path (see python -m pstats), returns the hottest functions"""
+        with self.lock:
+            profiles = list(self.profiles)
+        output = io.StringIO()
+        stats = pstats.Stats(profiles[0], stream=output)
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        stats.sort_stats("tottime").print_stats(top)
+        return output.getvalue()
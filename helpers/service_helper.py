@@ -0,0 +1,220 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Hashable, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from helpers.options_helper import SERVE_MAX_MEMORY
+from helpers.pipeline_helper import PGNGameHeaderPersonified, PipelineHelper, arrow_schema_for
+from helpers.stats_helper import CUBE_MEASURES, GAME_COLUMNS, STATS_REPORTS, AggregateCube
+
+# columns of a player's games kept in memory: what the stats are aggregated over, and the time of the game
+DATASET_COLUMNS = GAME_COLUMNS + ["UTCDateTime"]
+
+# periods (since/until pairs) of a player dataset whose cubes and reports are memoized
+PERIOD_MEMO_SIZE = 32
+
+
+class SingleFlight:
+    """
+    Deduplication of concurrent calls: while a call for a key is running, other calls for the
+    same key wait for it and get its result (or its exception) instead of running it again -
+    e.g. a dashboard asking for a player's stats from several widgets at once syncs the player once.
+    """
+
+    def __init__(self):
+        self.calls: dict[Hashable, Future] = {}
+        self.lock = threading.Lock()
+        self.shared = 0
+
+    def run(self, key: Hashable, func: Callable[[], object]) -> tuple[object, bool]:
+        """Result of func (run or joined), and whether it was shared with a call already running"""
+        with self.lock:
+            future = self.calls.get(key)
+            owner = future is None
+            if owner:
+                future = self.calls[key] = Future()
+            else:
+                self.shared += 1
+
+        if not owner:
+            return future.result(), True
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self.lock:
+                del self.calls[key]
+        return future.result(), False
+
+
+class LRUMemo:
+    """
+    Memoized values (e.g. of a dataset's periods), at most max_size of them: the least recently
+    used ones are dropped. Keeps the approximate memory of every value, for DatasetCache.
+    Not thread-safe, calls are guarded by the owner's lock.
+    """
+
+    def __init__(self, max_size: int = PERIOD_MEMO_SIZE):
+        self.max_size = max_size
+        self.values: OrderedDict[Hashable, tuple[object, int]] = OrderedDict()
+        self.nbytes = 0
+
+    def get(self, key: Hashable) -> Optional[object]:
+        item = self.values.get(key)
+        if item is None:
+            return None
+        self.values.move_to_end(key)
+        return item[0]
+
+    def put(self, key: Hashable, value: object, nbytes: int) -> None:
+        if key in self.values:
+            self.nbytes -= self.values.pop(key)[1]
+        self.values[key] = (value, nbytes)
+        self.nbytes += nbytes
+        while len(self.values) > self.max_size:
+            self.nbytes -= self.values.popitem(last=False)[1][1]
+
+
+class PlayerDataset:
+    """
+    Games of one player loaded from the player's output (DATASET_COLUMNS only) with the aggregate
+    cube of all of them. Stats over a period are aggregated from the games in it; cubes of the
+    periods asked for and the reports rolled up from them are memoized (the recently used ones,
+    see LRUMemo) - the dataset is replaced (not updated) after a sync, so they never get stale.
+    """
+
+    __slots__ = ("player", "games", "cube", "loaded_at", "period_cubes", "reports", "lock")
+
+    def __init__(self, player: str, games: pa.Table, cube: AggregateCube):
+        self.player = player
+        self.games = games
+        self.cube = cube
+        self.loaded_at = time.time()
+        self.period_cubes = LRUMemo()
+        self.reports = LRUMemo()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def load(cls, player: str, output_path: str, output_format: str) -> "PlayerDataset":
+        schema = arrow_schema_for(PGNGameHeaderPersonified)
+        games = pa.Table.from_batches([], schema=pa.schema([schema.field(name) for name in DATASET_COLUMNS]))
+        batches = list(PipelineHelper.read_output(output_format, output_path, DATASET_COLUMNS))
+        if batches:
+            games = pa.concat_tables(batches).combine_chunks()
+        return cls(player, games, AggregateCube.load(output_path, output_format))
+
+    @property
+    def nbytes(self) -> int:
+        with self.lock:
+            memos_nbytes = self.period_cubes.nbytes + self.reports.nbytes
+        return self.games.nbytes + self.cube.table.nbytes + memos_nbytes
+
+    def period_cube(self, since: Optional[datetime], until: Optional[datetime]) -> AggregateCube:
+        """Cube of the games played in [since, until) - of all games if neither is given"""
+        if since is None and until is None:
+            return self.cube
+        key = (since, until)
+        with self.lock:
+            cube = self.period_cubes.get(key)
+        if cube is None:
+            games = self.games
+            utc_type = games.schema.field("UTCDateTime").type
+            if since is not None:
+                games = games.filter(pc.greater_equal(games["UTCDateTime"], pa.scalar(since, utc_type)))
+            if until is not None:
+                games = games.filter(pc.less(games["UTCDateTime"], pa.scalar(until, utc_type)))
+            cube = AggregateCube(AggregateCube.aggregate(games, CUBE_MEASURES))
+            with self.lock:
+                self.period_cubes.put(key, cube, cube.table.nbytes)
+        return cube
+
+    def report(self, name: str, since: Optional[datetime], until: Optional[datetime]) -> list[dict]:
+        """Rows of the standard stats report (see STATS_REPORTS) over the games played in [since, until)"""
+        key = (name, since, until)
+        with self.lock:
+            rows = self.reports.get(key)
+        if rows is None:
+            report = self.period_cube(since, until).report(STATS_REPORTS[name])
+            rows = report.to_pylist()
+            with self.lock:
+                self.reports.put(key, rows, report.nbytes)
+        return rows
+
+    def games_count(self, since: Optional[datetime], until: Optional[datetime]) -> int:
+        return pc.sum(self.period_cube(since, until).table["GamesCount"]).as_py() or 0
+
+
+@dataclass
+class DatasetCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0.0
+        return f"{self.hits} hits, {self.misses} misses, {self.evictions} evictions (hit rate {hit_rate:.0%})"
+
+
+class DatasetCache:
+    """
+    Player datasets kept in memory, at most max_bytes of them: when a new one doesn't fit,
+    least recently used datasets are evicted (and loaded again from their outputs when asked
+    for). The dataset just added stays even if it alone is larger than max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = SERVE_MAX_MEMORY):
+        self.max_bytes = max_bytes
+        self.datasets: OrderedDict[str, PlayerDataset] = OrderedDict()
+        self.stats = DatasetCacheStats()
+        self.lock = threading.Lock()
+
+    def get(self, player: str) -> Optional[PlayerDataset]:
+        with self.lock:
+            dataset = self.datasets.get(player)
+            if dataset is None:
+                self.stats.misses += 1
+                return None
+            self.stats.hits += 1
+            self.datasets.move_to_end(player)
+            return dataset
+
+    def put(self, dataset: PlayerDataset) -> None:
+        with self.lock:
+            self.datasets[dataset.player] = dataset
+            self.datasets.move_to_end(dataset.player)
+            while len(self.datasets) > 1 and self.nbytes > self.max_bytes:
+                self.datasets.popitem(last=False)
+                self.stats.evictions += 1
+
+    def discard(self, player: str) -> None:
+        with self.lock:
+            self.datasets.pop(player, None)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(dataset.nbytes for dataset in self.datasets.values())
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "datasets": [
+                    {
+                        "player": dataset.player,
+                        "games": dataset.games.num_rows,
+                        "bytes": dataset.nbytes,
+                        "loaded_at": datetime.fromtimestamp(dataset.loaded_at, tz=timezone.utc).isoformat(),
+                    }
+                    for dataset in reversed(self.datasets.values())
+                ],
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                **vars(self.stats),
+            }
@@ -0,0 +1,209 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, Optional, TypeVar
+
+from helpers.options_helper import DEFAULT_QUEUE_SIZE
+
+InT = TypeVar("InT")
+OutT = TypeVar("OutT")
+
+
+class StageMetrics:
+    """
+    Counters of a pipeline stage, shared by all threads running it.
+
+    busy - time spent producing items (network reads, parsing, writing), including waiting
+    for the previous stage; cpu - CPU time of the threads while busy (much lower than busy -
+    the stage mostly waits, for the network or the previous stage); blocked - time spent waiting
+    for the next stage to take items from the full queue. The bottleneck is the first stage
+    which is never blocked: stages before it are blocked, stages after it wait for its output.
+    """
+
+    def __init__(self, name: str, unit: str = "games"):
+        self.name = name
+        self.unit = unit
+        self.items = 0.0
+        self.busy = 0.0
+        self.cpu = 0.0
+        self.blocked = 0.0
+        self.queue_depth_total = 0
+        self.queue_depth_max = 0
+        self.queue_samples = 0
+        self.lock = threading.Lock()
+
+    def record(
+        self,
+        items: float,
+        busy: float,
+        blocked: float = 0.0,
+        queue_depth: Optional[int] = None,
+        cpu: float = 0.0,
+    ) -> None:
+        with self.lock:
+            self.items += items
+            self.busy += busy
+            self.cpu += cpu
+            self.blocked += blocked
+            if queue_depth is not None:
+                self.queue_depth_total += queue_depth
+                self.queue_depth_max = max(self.queue_depth_max, queue_depth)
+                self.queue_samples += 1
+
+    def summary(self) -> str:
+        rate = self.items / self.busy if self.busy else 0.0
+        line = (
+            f"{self.name:>10}: {self.items:,.0f} {self.unit}, busy {self.busy:.1f}s "
+            f"({rate:,.0f} {self.unit}/sec, cpu {self.cpu:.1f}s), blocked by next stage {self.blocked:.1f}s"
+        )
+        if self.queue_samples:
+            line += (
+                f", queue depth avg {self.queue_depth_total / self.queue_samples:.1f} "
+                f"max {self.queue_depth_max}"
+            )
+        return line
+
+
+class PipelineMetrics:
+    """Metrics of all stages of a run, in order of creation"""
+
+    def __init__(self):
+        self.stages: dict[str, StageMetrics] = {}
+        self.lock = threading.Lock()
+
+    def stage(self, name: str, unit: str = "games") -> StageMetrics:
+        with self.lock:
+            if name not in self.stages:
+                self.stages[name] = StageMetrics(name, unit)
+            return self.stages[name]
+
+    def summary(self) -> str:
+        return "\n".join(stage.summary() for stage in self.stages.values())
+
+    def to_dict(self) -> dict:
+        """Counters of every stage, for machine-readable reports (see ExportProgress)"""
+        output = {}
+        for name, stage in list(self.stages.items()):
+            with stage.lock:
+                output[name] = {
+                    "unit": stage.unit,
+                    "items": stage.items,
+                    "busy_seconds": round(stage.busy, 3),
+                    "cpu_seconds": round(stage.cpu, 3),
+                    "blocked_seconds": round(stage.blocked, 3),
+                    "queue_depth_avg": (
+                        round(stage.queue_depth_total / stage.queue_samples, 2) if stage.queue_samples else None
+                    ),
+                    "queue_depth_max": stage.queue_depth_max,
+                }
+        return output
+
+
+class _StageDone:
+    """End-of-stream marker put into stage queue (carries producer error, if any)"""
+
+    def __init__(self, error: Optional[Exception] = None):
+        self.error = error
+
+
+def prefetch(
+    items: Iterable[OutT],
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    metrics: Optional[StageMetrics] = None,
+    item_size: Callable[[OutT], float] = len,
+) -> Iterator[OutT]:
+    """
+    Runs iteration over items in a background thread, up to queue_size items ahead of the consumer
+    (the producer blocks on the full queue - backpressure). Producer errors are re-raised
+    in the consumer; when the consumer stops early, the producer is stopped and closed.
+    """
+    stage_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        iterator = iter(items)
+        try:
+            while True:
+                started, cpu_started = time.perf_counter(), time.thread_time()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                produced, cpu = time.perf_counter(), time.thread_time() - cpu_started
+                if not put(item):
+                    return
+                if metrics is not None:
+                    metrics.record(
+                        item_size(item),
+                        busy=produced - started,
+                        blocked=time.perf_counter() - produced,
+                        queue_depth=stage_queue.qsize(),
+                        cpu=cpu,
+                    )
+        except Exception as e:
+            put(_StageDone(e))
+            return
+        finally:
+            if hasattr(iterator, "close"):
+                iterator.close()
+        put(_StageDone())
+
+    producer = threading.Thread(target=produce, daemon=True, name=f"stage-{metrics.name if metrics else 'prefetch'}")
+    producer.start()
+    try:
+        while not isinstance(item := stage_queue.get(), _StageDone):
+            yield item
+        if item.error is not None:
+            raise item.error
+    finally:
+        stop.set()
+
+
+def parallel_map(
+    func: Callable[[InT], OutT],
+    items: Iterable[InT],
+    workers: int,
+    metrics: Optional[StageMetrics] = None,
+    item_size: Callable[[OutT], float] = len,
+) -> Iterator[OutT]:
+    """
+    Applies func to items in `workers` threads, yielding results in the input order.
+    At most 2 * workers items are in flight, so a slow consumer holds the input back.
+    """
+
+    def measured(item: InT) -> OutT:
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        output = func(item)
+        if metrics is not None:
+            metrics.record(
+                item_size(output), busy=time.perf_counter() - started, cpu=time.thread_time() - cpu_started
+            )
+        return output
+
+    if workers <= 1:
+        yield from map(measured, items)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transform") as executor:
+        in_flight = deque()
+        try:
+            for item in items:
+                in_flight.append(executor.submit(measured, item))
+                if len(in_flight) >= 2 * workers:
+                    yield in_flight.popleft().result()
+            while in_flight:
+                yield in_flight.popleft().result()
+        finally:
+            for future in in_flight:
+                future.cancel()
@@ -0,0 +1,213 @@
+import os
+from dataclasses import dataclass
+from typing import Iterable, Optional, Union
+
+import pyarrow as pa
+
+from helpers.incremental_helper import IncrementalState
+from helpers.pipeline_helper import (
+    PGNGameHeaderPersonified,
+    PipelineHelper,
+    arrow_batch_for,
+    arrow_schema_for,
+    pc,
+    pq,
+)
+
+CUBE_FILE_SUFFIX = ".cube.parquet"
+
+# finest grain of the cube - every report is a roll-up of these columns
+CUBE_DIMENSIONS = [
+    "Player",
+    "Variant",
+    "TimeControl",
+    "Color",
+    "OpeningFamily",
+    "OpeningVariation",
+    "OpeningSubVariation",
+    "OpponentTitle",
+]
+
+# cube column <- (game column, aggregation over games)
+CUBE_MEASURES = {
+    "RatingChange": ("PlayerRatingChange", "sum"),
+    "GamesCount": ("Site", "count_all"),
+    "Wins": ("ResultWin", "sum"),
+    "Draws": ("ResultDraw", "sum"),
+    "Loses": ("ResultLose", "sum"),
+}
+
+CUBE_SCHEMA = pa.schema(
+    [pa.field(name, pa.string()) for name in CUBE_DIMENSIONS]
+    + [
+        pa.field("RatingChange", pa.float64()),
+        pa.field("GamesCount", pa.int64()),
+        pa.field("Wins", pa.int64()),
+        pa.field("Draws", pa.int64()),
+        pa.field("Loses", pa.int64()),
+    ]
+)
+
+GAME_COLUMNS = CUBE_DIMENSIONS + [column for column, _ in CUBE_MEASURES.values()]
+
+# tolerance of RatingChange sums in consistency check (they are summed in different order)
+RATING_CHANGE_TOLERANCE = 1e-6
+
+
+@dataclass
+class StatsReport:
+    name: str
+    dimensions: list[str]
+    # skip games where any of the dimensions is null (e.g. games against untitled players)
+    skip_nulls: bool = False
+
+
+# the standard stats queries of csv_analysis.ipynb / duckdb_analysis.ipynb, in STATS_REPORT_NAMES order
+STATS_REPORTS = {
+    report.name: report
+    for report in [
+        StatsReport("time-control", ["Player", "Variant", "TimeControl"]),
+        StatsReport("color", ["Player", "Color", "TimeControl"]),
+        StatsReport("opening-family", ["Player", "Color", "OpeningFamily"]),
+        StatsReport(
+            "opening",
+            ["Player", "Color", "OpeningFamily", "OpeningVariation", "OpeningSubVariation"],
+        ),
+        StatsReport("opponent-title", ["Player", "OpponentTitle"], skip_nulls=True),
+    ]
+}
+
+
+class AggregateCube:
+    """
+    Materialized aggregates (rating change, games, wins/draws/loses) of exported games
+    over CUBE_DIMENSIONS, stored next to the output as <output>.cube.parquet.
+
+    The cube is updated batch by batch during export, so stats reports are roll-ups of
+    a small table instead of a scan over all games. Like IncrementalState, the cube remembers
+    the fingerprint of the output it describes and is rebuilt from the output when they don't match.
+    """
+
+    def __init__(self, table: Optional[pa.Table] = None):
+        # not CUBE_SCHEMA.empty_table(), which imports pandas (a while, before the export can start)
+        self.table = table if table is not None else pa.Table.from_batches([], schema=CUBE_SCHEMA)
+
+    @classmethod
+    def cube_path(cls, output_path: str) -> str:
+        return f"{output_path}{CUBE_FILE_SUFFIX}"
+
+    @classmethod
+    def aggregate(cls, table: pa.Table, aggregations: dict[str, tuple[str, str]]) -> pa.Table:
+        """Groups table by CUBE_DIMENSIONS, aggregations: output column <- (input column, function)"""
+        grouped = table.group_by(CUBE_DIMENSIONS, use_threads=False).aggregate(
+            [([] if func == "count_all" else [column], func) for column, func in aggregations.values()]
+        )
+        # aggregate output columns are named like "ResultWin_sum"
+        return pa.Table.from_arrays(
+            [grouped[name] for name in CUBE_DIMENSIONS]
+            + [
+                grouped["count_all" if func == "count_all" else f"{column}_{func}"]
+                for column, func in aggregations.values()
+            ],
+            schema=CUBE_SCHEMA,
+        )
+
+    def add(self, game_headers: Union[list[PGNGameHeaderPersonified], pa.Table]) -> None:
+        """Adds a batch of exported games to the cube"""
+        if isinstance(game_headers, pa.Table):
+            games = game_headers.select(GAME_COLUMNS)
+        elif game_headers:
+            schema = arrow_schema_for(PGNGameHeaderPersonified)
+            games = pa.Table.from_batches([arrow_batch_for(game_headers, schema)]).select(GAME_COLUMNS)
+        else:
+            return
+
+        merged = pa.concat_tables([self.table, self.aggregate(games, CUBE_MEASURES)])
+        self.table = self.aggregate(merged, {name: (name, "sum") for name in CUBE_MEASURES})
+
+    @classmethod
+    def from_games(cls, batches: Iterable[pa.Table]) -> "AggregateCube":
+        cube = AggregateCube()
+        for batch in batches:
+            cube.add(batch)
+        return cube
+
+    @classmethod
+    def from_output(cls, output_path: str, output_format: str) -> "AggregateCube":
+        """Recomputes the cube from all games of the output"""
+        return cls.from_games(PipelineHelper.read_output(output_format, output_path, GAME_COLUMNS))
+
+    @classmethod
+    def load(cls, output_path: str, output_format: str) -> "AggregateCube":
+        """Loads cube of the output, rebuilding it if it's missing or outdated"""
+        cube_path = cls.cube_path(output_path)
+        if not os.path.exists(output_path):
+            return AggregateCube()
+
+        if os.path.exists(cube_path):
+            table = pq.read_table(cube_path)
+            fingerprint = IncrementalState.output_fingerprint(output_path)
+            if table.schema.metadata == cls.fingerprint_metadata(fingerprint):
+                return AggregateCube(table.replace_schema_metadata(None))
+
+        print(f"Rebuilding aggregate cube from '{output_path}'...")
+        cube = cls.from_output(output_path, output_format)
+        cube.save(output_path)
+        return cube
+
+    @classmethod
+    def fingerprint_metadata(cls, fingerprint: tuple[int, int]) -> dict[bytes, bytes]:
+        size, mtime_ns = fingerprint
+        return {b"output_size": str(size).encode(), b"output_mtime_ns": str(mtime_ns).encode()}
+
+    def save(self, output_path: str) -> None:
+        """Atomically saves the cube along with fingerprint of the (already committed) output"""
+        fingerprint = IncrementalState.output_fingerprint(output_path)
+        cube_path = self.cube_path(output_path)
+        tmp_path = f"{cube_path}.tmp"
+        pq.write_table(
+            self.table.replace_schema_metadata(self.fingerprint_metadata(fingerprint)), tmp_path
+        )
+        os.replace(tmp_path, cube_path)
+
+    def report(self, report: StatsReport) -> pa.Table:
+        """Rolls the cube up to the dimensions of the report, sorted by them"""
+        table = self.table
+        if report.skip_nulls:
+            for dimension in report.dimensions:
+                table = table.filter(pc.is_valid(table[dimension]))
+
+        grouped = table.group_by(report.dimensions, use_threads=False).aggregate(
+            [(name, "sum") for name in CUBE_MEASURES]
+        )
+        columns = [grouped[name] for name in report.dimensions] + [
+            grouped[f"{name}_sum"] for name in CUBE_MEASURES
+        ]
+        rolled_up = pa.Table.from_arrays(columns, names=report.dimensions + list(CUBE_MEASURES))
+        return rolled_up.sort_by([(name, "ascending") for name in report.dimensions])
+
+    def differences(self, other: "AggregateCube") -> list[str]:
+        """Cells of the two cubes which don't match (empty list - cubes are equal)"""
+
+        def cells(cube: AggregateCube) -> dict[tuple, dict]:
+            return {
+                tuple(row[name] for name in CUBE_DIMENSIONS): row
+                for row in cube.table.to_pylist()
+            }
+
+        own_cells, other_cells = cells(self), cells(other)
+        differences = []
+        for key in own_cells.keys() | other_cells.keys():
+            own, another = own_cells.get(key), other_cells.get(key)
+            if own is None or another is None:
+                differences.append(f"{key}: {own} != {another}")
+                continue
+            for name in CUBE_MEASURES:
+                own_value, other_value = own[name], another[name]
+                if name == "RatingChange" and own_value is not None and other_value is not None:
+                    equal = abs(own_value - other_value) <= RATING_CHANGE_TOLERANCE
+                else:
+                    equal = own_value == other_value
+                if not equal:
+                    differences.append(f"{key} {name}: {own_value} != {other_value}")
+        return differences
@@ -0,0 +1,188 @@
+import os
+from datetime import datetime
+from typing import Optional
+
+import numpy as np
+import pyarrow as pa
+
+from helpers.columnar_helper import STANDARDIZED_SCHEMA, ColumnarHelper
+from helpers.lichess_api_helper import LichessAPIHelper
+from helpers.pipeline_helper import PGNGameHeaderStandardized, arrow_batch_for, pc
+
+# store folder: games in append-only parts (a part per export), and the players index over all parts
+STORE_PART_FORMAT = "part-{:05d}.arrow"
+STORE_PLAYERS_FILE = "players.arrow"
+
+# canonical row of a game: its id and the game as PGNGameHeaderStandardized (White/Black, not personified)
+STORE_SCHEMA = pa.schema([pa.field("GameId", pa.string()), *STANDARDIZED_SCHEMA])
+
+# players index: a row per (player, game) - both sides of every game - sorted by player and game row
+PLAYERS_SCHEMA = pa.schema(
+    [
+        pa.field("Player", pa.string()),
+        pa.field("Row", pa.uint64()),  # row of the game in all parts, in part order
+    ],
+    metadata={"parts": "0"},  # parts covered by the index, later ones are leftovers of a failed export
+)
+
+
+class GameStore:
+    """
+    Canonical store of games of many players: every game is kept once, keyed by game id, as
+    a PGNGameHeaderStandardized row - games between exported players (e.g. members of a club)
+    are transformed and stored once instead of once per player. A player's view of the games
+    (PGNGameHeaderPersonified columns) is computed on demand by ColumnarHelper.personify_batch.
+
+    The store is a folder of Arrow IPC files, memory-mapped for reading: games in append-only
+    parts, and the players index - (player, game row) pairs sorted by player - so games of
+    a player, or of two players against each other, are found by binary search and taken
+    by row, without scanning the store. Games added by an export are committed together on
+    close: the new part first, then the index which makes it visible.
+    """
+
+    def __init__(self, folder: str, read_only: bool = False):
+        self.folder = folder
+        if not read_only:
+            os.makedirs(folder, exist_ok=True)
+
+        players_path = os.path.join(folder, STORE_PLAYERS_FILE)
+        if os.path.exists(players_path):
+            self.players = pa.ipc.open_file(pa.memory_map(players_path)).read_all()
+        elif read_only:
+            raise FileNotFoundError(f"'{folder}' is not a game store")
+        else:
+            self.players = PLAYERS_SCHEMA.empty_table()
+        self.parts_count = int(self.players.schema.metadata[b"parts"])
+
+        parts = []
+        for part in range(self.parts_count):
+            # zero-copy: only pages of the games read are loaded
+            part_path = os.path.join(folder, STORE_PART_FORMAT.format(part))
+            parts.append(pa.ipc.open_file(pa.memory_map(part_path)).read_all())
+        self.games = pa.concat_tables(parts) if parts else STORE_SCHEMA.empty_table()
+
+        self.writer = None
+        self.new_games = []
+        if not read_only:
+            # only games not in the store yet are added
+            self.game_ids = set(self.games["GameId"].to_pylist())
+
+    @classmethod
+    def to_table(cls, games_std: list[PGNGameHeaderStandardized]) -> pa.Table:
+        """Standardized games (dataclasses) -> table of STANDARDIZED_SCHEMA columns"""
+        if not games_std:
+            return STANDARDIZED_SCHEMA.empty_table()
+        return pa.Table.from_batches([arrow_batch_for(games_std, STANDARDIZED_SCHEMA)])
+
+    def contains(self, game_id: str) -> bool:
+        return game_id in self.game_ids
+
+    def add(self, games_std: pa.Table) -> int:
+        """Adds games (STANDARDIZED_SCHEMA columns) which are not in the store yet, returns their number"""
+        game_ids = [LichessAPIHelper.game_id_from_site(site or "") for site in games_std["Site"].to_pylist()]
+        new_rows = []
+        for row, game_id in enumerate(game_ids):
+            if game_id not in self.game_ids:
+                self.game_ids.add(game_id)
+                new_rows.append(row)
+        if not new_rows:
+            return 0
+
+        new_games = games_std.select(STANDARDIZED_SCHEMA.names).cast(STANDARDIZED_SCHEMA).take(new_rows)
+        new_games = new_games.add_column(0, "GameId", pa.array([game_ids[row] for row in new_rows], pa.string()))
+        if self.writer is None:
+            self.part_path = os.path.join(self.folder, STORE_PART_FORMAT.format(self.parts_count))
+            self.writer = pa.ipc.new_file(f"{self.part_path}.tmp", STORE_SCHEMA)
+        self.writer.write_table(new_games)
+        # players of new games - the new part is read again only by the next GameStore
+        self.new_games.append(new_games.select(["White", "Black"]))
+        return len(new_rows)
+
+    def rows_of(self, player: str, opponent: Optional[str] = None) -> np.ndarray:
+        """Rows of the games of the player (against the opponent, if given), in the order they were added"""
+        rows = self.player_rows(player)
+        if opponent is not None:
+            rows = np.intersect1d(rows, self.player_rows(opponent), assume_unique=True)
+        return rows
+
+    def player_rows(self, player: str) -> np.ndarray:
+        names = self.players["Player"]
+        start, end = self.lower_bound(names, player, 0), self.lower_bound(names, player, 1)
+        return self.players["Row"].slice(start, end - start).to_numpy()
+
+    @classmethod
+    def lower_bound(cls, names: pa.ChunkedArray, name: str, after: int) -> int:
+        """Index of the first name >= name (> name if after) in the sorted names"""
+        low, high = 0, len(names)
+        while low < high:
+            middle = (low + high) // 2
+            value = names[middle].as_py()
+            if value < name or (after and value == name):
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def games_of(self, player: str, opponent: Optional[str] = None) -> pa.Table:
+        """Canonical rows (STORE_SCHEMA) of the player's games, newest first"""
+        games = self.games.take(pa.array(self.rows_of(player, opponent), pa.uint64()))
+        return games.sort_by([("UTCDateTime", "descending")])
+
+    def personified(self, player: str, opponent: Optional[str] = None) -> pa.Table:
+        """The player's games (against the opponent, if given) as PGNGameHeaderPersonified columns"""
+        return ColumnarHelper.personify_batch(self.games_of(player, opponent), player)
+
+    def last_game_time(self, player: str) -> Optional[datetime]:
+        rows = self.rows_of(player)
+        if not len(rows):
+            return None
+        return pc.max(self.games["UTCDateTime"].take(pa.array(rows, pa.uint64()))).as_py()
+
+    def opponents(self, player: str) -> pa.Table:
+        """Opponents of the player with the number of games against each of them, most frequent first"""
+        games = self.games.take(pa.array(self.rows_of(player), pa.uint64())).select(["White", "Black"])
+        opponents = pc.if_else(pc.equal(games["White"], player), games["Black"], games["White"])
+        counts = pc.value_counts(opponents)
+        table = pa.table({"Opponent": counts.field("values"), "Games": counts.field("counts")})
+        return table.sort_by([("Games", "descending"), ("Opponent", "ascending")])
+
+    def close(self) -> None:
+        if self.writer is None:
+            return
+        self.writer.close()
+        os.replace(f"{self.part_path}.tmp", self.part_path)
+
+        first_row = self.games.num_rows
+        new_games = pa.concat_tables(self.new_games)
+        new_rows = pa.array(np.arange(first_row, first_row + new_games.num_rows, dtype=np.uint64))
+        players = pa.concat_tables(
+            [
+                self.players.select(PLAYERS_SCHEMA.names).cast(PLAYERS_SCHEMA.remove_metadata()),
+                pa.table({"Player": new_games["White"], "Row": new_rows}, schema=PLAYERS_SCHEMA.remove_metadata()),
+                pa.table({"Player": new_games["Black"], "Row": new_rows}, schema=PLAYERS_SCHEMA.remove_metadata()),
+            ]
+        )
+        players = players.filter(pc.is_valid(players["Player"]))
+        players = players.sort_by([("Player", "ascending"), ("Row", "ascending")]).combine_chunks()
+        players = players.replace_schema_metadata({"parts": str(self.parts_count + 1)})
+
+        players_path = os.path.join(self.folder, STORE_PLAYERS_FILE)
+        with pa.OSFile(f"{players_path}.tmp", "wb") as sink, pa.ipc.new_file(sink, players.schema) as writer:
+            writer.write_table(players)
+        os.replace(f"{players_path}.tmp", players_path)
+        self.writer = None
+
+    def abort(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            os.remove(f"{self.part_path}.tmp")
+            self.writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
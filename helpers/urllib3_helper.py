@@ -1,26 +1,139 @@
-import urllib3
+import codecs
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterator
+
 from urllib.parse import urljoin, urlencode
 import json
 
+from helpers.imports_helper import lazy_import
+
+urllib3 = lazy_import("urllib3")
+
+# size of raw body chunks read from the socket when streaming a response
+STREAM_CHUNK_SIZE = 64 * 1024
+
 
 class Urllib3Exception(Exception):
     pass
 
 
+class Urllib3StreamError(Urllib3Exception):
+    """Streamed response broke after it had started (dropped connection, incomplete body)"""
+
+    pass
+
+
+@dataclass
+class RetryPolicy:
+    max_retries: int = 5
+    # delay before the first retry (seconds), doubled with every next attempt
+    backoff_base: float = 1.0
+    backoff_max: float = 60.0
+    # random +/- fraction of the delay, so clients don't retry in lockstep
+    jitter: float = 0.5
+    # Lichess asks to wait a full minute after 429 Too Many Requests
+    throttle_cooldown: float = 60.0
+    retry_statuses: frozenset = frozenset({429, 500, 502, 503, 504})
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+
+@dataclass
+class RequestStats:
+    # attempts, retries included
+    requests: int = 0
+    retries: int = 0
+    # 429 Too Many Requests responses, and seconds requests waited for their cool-down
+    throttled: int = 0
+    throttle_wait: float = 0.0
+    # seconds requests waited for the rate limiter (cool-downs excluded)
+    rate_limit_wait: float = 0.0
+    # response bodies, as received (before decoding)
+    bytes_received: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"{self.requests} requests ({self.retries} retries), {self.bytes_received / 2**20:,.1f} MiB received, "
+            f"{self.throttled} throttled (waited {self.throttle_wait:.1f}s), "
+            f"rate limiter waits {self.rate_limit_wait:.1f}s"
+        )
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all threads making requests: allows short bursts of up to `burst`
+    requests, while keeping the average rate at `rate` requests per second.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Blocks until a request is allowed, returns seconds waited"""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if now < self.paused_until:
+                    wait_time = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                else:
+                    wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def pause(self, seconds: float) -> None:
+        """Holds all requests for a while (e.g. server asked to slow down)"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
 class Urllib3Helper:
-    def __init__(self, base_url: str) -> None:
+    def __init__(
+        self,
+        base_url: str,
+        max_connections: int = 1,
+        rate_limiter: RateLimiter | None = None,
+        retry_policy: RetryPolicy | None = None,
+    ) -> None:
         """_summary_
 
         Args:
             base_url (_type_): base url to requests like http://localhost:3000/
+            max_connections (int, optional): Connections kept open for reuse (per host),
+                should be at least the number of threads sharing the helper.
+            rate_limiter (RateLimiter, optional): Limiter every request waits for.
+            retry_policy (RetryPolicy, optional): Retries of failed/throttled requests.
+                Defaults to RetryPolicy() - use RetryPolicy(max_retries=0) to disable.
         """
-        self.http = urllib3.PoolManager()
+        self.http = urllib3.PoolManager(maxsize=max_connections)
         self.base_url = base_url
+        self.rate_limiter = rate_limiter
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        # shared by all threads making requests, updated under stats_lock
+        self.stats = RequestStats()
+        self.stats_lock = threading.Lock()
 
-    def _prep_headers(self, token: str | None = None) -> dict:
+    def _prep_headers(self, token: str | None = None, accept: str | None = None) -> dict:
         headers = {"Content-Type": "application/json"}
         if token:
             headers["Authorization"] = f"Bearer {token}"
+        if accept:
+            headers["Accept"] = accept
         return headers
 
     def _get_api_url(self, api_path: str) -> str:
@@ -31,6 +144,74 @@ class Urllib3Helper:
         url = urljoin(self.base_url, api_path)
         return url
 
+    def _count(self, **counts) -> None:
+        with self.stats_lock:
+            for name, value in counts.items():
+                setattr(self.stats, name, getattr(self.stats, name) + value)
+
+    def _retry_delay(self, attempt: int, response=None) -> float:
+        """Delay before retry; 429 means waiting for the cool-down (or Retry-After) for all requests"""
+        if response is None or response.status != 429:
+            return self.retry_policy.backoff(attempt)
+
+        retry_after = response.headers.get("Retry-After")
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else self.retry_policy.throttle_cooldown
+        if self.rate_limiter:
+            self.rate_limiter.pause(delay)
+        return delay
+
+    def _request(
+        self,
+        method: str,
+        url: str,
+        headers: dict,
+        preload_content: bool = True,
+        body: str | None = None,
+    ):
+        """
+        Makes a request, retrying connection errors and retryable statuses (429, 5xx)
+        with exponential backoff. Returns response with status 200.
+        """
+        attempt = 0
+        while True:
+            waited = self.rate_limiter.acquire() if self.rate_limiter else 0.0
+            self._count(requests=1, rate_limit_wait=waited)
+
+            try:
+                response = self.http.request(
+                    method=method,
+                    url=url,
+                    headers=headers,
+                    body=body.encode("utf-8") if body is not None else None,
+                    preload_content=preload_content,
+                    retries=False,
+                )
+            except Exception as e:
+                if attempt >= self.retry_policy.max_retries:
+                    raise Urllib3Exception(f"An error occurred during {method}: {str(e)}")
+                delay = self._retry_delay(attempt)
+                print(f"{method} request failed ({e}), retrying in {delay:.1f}s...")
+            else:
+                if response.status == 200:
+                    return response
+
+                error_body = response.data.decode("utf-8", errors="replace")
+                self._count(bytes_received=len(response.data))
+                response.release_conn()
+                if (
+                    response.status not in self.retry_policy.retry_statuses
+                    or attempt >= self.retry_policy.max_retries
+                ):
+                    raise Urllib3Exception(f"{method} request failed: {response.status} {error_body}")
+                delay = self._retry_delay(attempt, response)
+                if response.status == 429:
+                    self._count(throttled=1, throttle_wait=delay)
+                print(f"{method} request failed: {response.status}, retrying in {delay:.1f}s...")
+
+            self._count(retries=1)
+            time.sleep(delay)
+            attempt += 1
+
     def get(
         self, api_path: str, params: dict | None = None, token: str | None = None
     ) -> str:
@@ -54,18 +235,99 @@ class Urllib3Helper:
 
         headers = self._prep_headers(token)
 
+        response = self._request("GET", url, headers)
+        self._count(bytes_received=len(response.data))
+        return response.data.decode("utf-8")
+
+    def post(
+        self,
+        api_path: str,
+        body: str,
+        params: dict | None = None,
+        token: str | None = None,
+        accept: str | None = None,
+        content_type: str = "text/plain",
+    ) -> str:
+        """
+        Makes a POST request with a text body to the specified API path.
+
+        Args:
+            api_path (str): API path to append to the base URL.
+            body (str): Request body.
+            params (dict, optional): Query parameters. Defaults to None.
+            token (str, optional): Authorization token. Defaults to None.
+            accept (str, optional): Requested response content type (Accept header).
+            content_type (str, optional): Content type of the body. Defaults to text/plain.
+
+        Returns:
+            str: Decoded response body.
+
+        Raises:
+            Urllib3Exception: If the request fails (after retries).
+        """
+        url = self._get_api_url(api_path)
+        if params:
+            url += f"?{urlencode(params)}"
+
+        headers = self._prep_headers(token, accept)
+        headers["Content-Type"] = content_type
+
+        response = self._request("POST", url, headers, body=body)
+        self._count(bytes_received=len(response.data))
+        return response.data.decode("utf-8")
+
+    def get_stream(
+        self,
+        api_path: str,
+        params: dict | None = None,
+        token: str | None = None,
+        chunk_size: int = STREAM_CHUNK_SIZE,
+        accept: str | None = None,
+    ) -> Iterator[str]:
+        """
+        Makes a GET request and yields the response body as decoded text chunks as it arrives,
+        without buffering the whole response in memory.
+
+        Args:
+            api_path (str): API path to append to the base URL.
+            params (dict, optional): Query parameters for the GET request. Defaults to None.
+            token (str, optional): Authorization token. Defaults to None.
+            chunk_size (int, optional): Size of raw body chunks read from the socket.
+            accept (str, optional): Requested response content type (Accept header).
+
+        Yields:
+            str: Decoded chunks of the response body (not aligned to lines).
+
+        Raises:
+            Urllib3Exception: If the request fails (after retries).
+            Urllib3StreamError: If the response breaks after streaming has started.
+        """
+        url = self._get_api_url(api_path)
+        if params:
+            url += f"?{urlencode(params)}"
+
+        headers = self._prep_headers(token, accept)
+
+        response = self._request("GET", url, headers, preload_content=False)
+
         try:
-            response = self.http.request(
-                method="GET",
-                url=url,
-                headers=headers,
-            )
-
-            if response.status == 200:
-                return response.data.decode("utf-8")
-            else:
-                raise Urllib3Exception(
-                    f"GET request failed: {response.status} {response.data.decode('utf-8')}"
-                )
+            # incremental decoder keeps multi-byte characters split between chunks
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            for chunk in response.stream(chunk_size):
+                self._count(bytes_received=len(chunk))
+                text = decoder.decode(chunk)
+                if text:
+                    yield text
+
+            text = decoder.decode(b"", final=True)
+            if text:
+                yield text
+        except GeneratorExit:
+            # consumer stopped reading early - unread body can't stay on a pooled connection
+            response.close()
+            raise
         except Exception as e:
-            raise Urllib3Exception(f"An error occurred during GET: {str(e)}")
+            response.close()
+            raise Urllib3StreamError(f"GET response stream broke: {str(e)}")
+        finally:
+            response.release_conn()
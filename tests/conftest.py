@@ -0,0 +1,44 @@
+from itertools import islice
+from typing import Callable
+
+import pytest
+
+from benchmarks.fake_lichess_server import FakeLichessServer
+from benchmarks.synthetic_data import PLAYER, game_to_pgn, generate_games
+from helpers.cache_helper import ResponseCache
+from helpers.lichess_api_helper import LichessAPIHelper
+from helpers.pgn_parser_helper import PGNHeaderParser
+from helpers.pipeline_helper import PGNGameHeaderPersonified, PGNGameHeaderStandardized
+from helpers.urllib3_helper import RateLimiter, RetryPolicy
+
+
+@pytest.fixture
+def personified_games() -> Callable[..., list[PGNGameHeaderPersonified]]:
+    """Factory of synthetic games of PLAYER, parsed and transformed row by row like during export"""
+
+    def make(count: int, seed: int = 42, start: int = 0) -> list[PGNGameHeaderPersonified]:
+        games = islice(generate_games(start + count, seed=seed), start, None)
+        headers = PGNHeaderParser.parse_games_headers(["".join(game_to_pgn(game) for game in games)])
+        return [
+            PGNGameHeaderPersonified.from_pgn_header_std(PGNGameHeaderStandardized.from_pgn_header(header), PLAYER)
+            for header in headers
+        ]
+
+    return make
+
+
+@pytest.fixture
+def fake_api_helper() -> Callable[..., LichessAPIHelper]:
+    """Factory of API helpers of a fake Lichess server, retrying with short backoffs (Retry-After is honored)"""
+
+    def make(server: FakeLichessServer, response_cache: ResponseCache | None = None) -> LichessAPIHelper:
+        retry_policy = RetryPolicy(max_retries=5, backoff_base=0.01, backoff_max=0.05)
+        return LichessAPIHelper(
+            "token",
+            rate_limiter=RateLimiter(100),
+            retry_policy=retry_policy,
+            base_url=server.base_url,
+            response_cache=response_cache,
+        )
+
+    return make
@@ -0,0 +1,30 @@
+import pyarrow as pa
+import pytest
+
+from benchmarks.synthetic_data import PLAYER, game_to_pgn, generate_games
+from helpers.archive_helper import PGNArchive, PGNArchiveWriter
+from helpers.columnar_helper import ColumnarHelper
+from helpers.movetext_helper import MovetextAnalyzer
+from helpers.pgn_parser_helper import PGNHeaderParser
+
+
+@pytest.mark.parametrize("with_moves", [False, True])
+def test_reprocess_matches_export(tmp_path, with_moves):
+    """Reprocessing the archive gives the same rows as the export did, movetext features included"""
+    pgn_text = "".join(game_to_pgn(game, moves=with_moves) for game in generate_games(2500))
+    headers = list(PGNHeaderParser.parse_games_headers([pgn_text], keep_movetext=with_moves))
+
+    # the export: movetext analyzed while downloading, raw games archived
+    features = MovetextAnalyzer.to_table(MovetextAnalyzer(1).analyze(headers)) if with_moves else None
+    exported = ColumnarHelper.transform_headers(headers, PLAYER, features)
+    archive_path = str(tmp_path / "games.parquet.pgn.gz")
+    with PGNArchiveWriter(archive_path, PLAYER, with_moves=with_moves) as archive:
+        for game_text, header in zip(PGNHeaderParser.split_games([pgn_text]), headers):
+            archive.add(game_text, header)
+
+    archive = PGNArchive(archive_path)
+    reprocessed = pa.concat_tables(archive.reprocess(workers=2))
+
+    assert archive.with_moves == with_moves
+    assert reprocessed.equals(exported)
+    assert reprocessed["PlyCount"].null_count == (0 if with_moves else len(headers))
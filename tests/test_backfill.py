@@ -0,0 +1,47 @@
+import pyarrow as pa
+
+from benchmarks.fake_lichess_server import FakeLichessServer
+from benchmarks.synthetic_data import PLAYER
+from helpers.backfill_helper import GameDetails
+
+
+def test_backfill_fetches_every_game_once(tmp_path, fake_api_helper):
+    """Throttled and dropped requests of a backfill are retried: details of every game, once"""
+    with FakeLichessServer(1000, throttle_every=3, disconnect_after=0, disconnect_count=2) as server:
+        game_ids = [game["id"] for game in server.user_games(PLAYER)][:700]
+
+        tables = list(GameDetails.fetch(fake_api_helper(server), game_ids, concurrency=2, batch_size=100))
+        details = GameDetails(str(tmp_path / "games.parquet"), "parquet")
+        details.merge(pa.concat_tables(tables))
+
+        fetched_ids = details.load()["GameId"].to_pylist()
+        assert server.disconnected_count == 2 and server.throttled_count >= 1
+        assert len(fetched_ids) == len(set(fetched_ids))
+        assert sorted(fetched_ids) == sorted(game_ids)
+        assert details.backfilled_ids() == set(game_ids)
+
+
+def test_details_added_in_parts_are_compacted_once(tmp_path, fake_api_helper):
+    """Batches go to part files read along with the details file, backfilling a game again replaces its details"""
+    with FakeLichessServer(1000) as server:
+        game_ids = [game["id"] for game in server.user_games(PLAYER)][:500]
+        tables = list(GameDetails.fetch(fake_api_helper(server), game_ids, concurrency=2, batch_size=100))
+
+    output_path = str(tmp_path / "games.parquet")
+    details = GameDetails(output_path, "parquet")
+    details.merge(tables[0])
+    for table in tables[1:]:
+        details.add(table)
+    # backfilled again: the newer details are kept
+    details.add(tables[0].set_column(1, "Moves", pa.array(["e4"] * len(tables[0]))))
+
+    assert len(GameDetails.part_paths(output_path)) == len(tables)
+    loaded = details.load()
+    assert sorted(loaded["GameId"].to_pylist()) == sorted(game_ids)
+
+    details.compact()
+    assert GameDetails.part_paths(output_path) == []
+    compacted = details.load()
+    assert compacted.equals(loaded)
+    moves = dict(zip(compacted["GameId"].to_pylist(), compacted["Moves"].to_pylist()))
+    assert all(moves[game_id] == "e4" for game_id in tables[0]["GameId"].to_pylist())
@@ -0,0 +1,117 @@
+from dataclasses import replace
+
+import pyarrow as pa
+import pytest
+
+from benchmarks.synthetic_data import PLAYER, game_to_pgn, generate_games
+from helpers.columnar_helper import PERSONIFIED_SCHEMA, STANDARDIZED_SCHEMA, ColumnarHelper
+from helpers.pgn_parser_helper import PGNGameHeader, PGNHeaderParser
+from helpers.pipeline_helper import PGNGameHeaderPersonified, PGNGameHeaderStandardized, arrow_batch_for
+
+BASE_HEADER = PGNGameHeader(
+    Event="Rated Blitz game",
+    Site="https://lichess.org/abcdefgh",
+    Date="2024.03.01",
+    Round="-",
+    White=PLAYER,
+    Black="opponent",
+    Result="1-0",
+    UTCDate="2024.03.01",
+    UTCTime="12:30:00",
+    WhiteElo="1500",
+    BlackElo="1520",
+    WhiteRatingDiff="+6",
+    BlackRatingDiff="-6",
+    Variant="Standard",
+    TimeControl="180+2",
+    ECO="B01",
+    Opening="Scandinavian Defense: Mieses-Kotroc Variation",
+    Termination="Normal",
+    GameId="abcdefgh",
+)
+
+# games the synthetic data has none of, each differing from BASE_HEADER in a few tags
+EDGE_CASE_HEADERS = [
+    # provisional / unknown ratings
+    replace(BASE_HEADER, WhiteElo="?", BlackElo="?", WhiteRatingDiff=None, BlackRatingDiff=None),
+    replace(BASE_HEADER, WhiteElo=" 1500 ", BlackElo="", WhiteRatingDiff="+0.5", BlackRatingDiff="abc"),
+    # non-plain numbers go through the reference parsers
+    replace(BASE_HEADER, WhiteElo="1_500", BlackElo="١٥٠٠", WhiteRatingDiff="1e1"),
+    # unknown and missing openings
+    replace(BASE_HEADER, ECO="?", Opening="?"),
+    replace(BASE_HEADER, ECO=None, Opening=None),
+    replace(BASE_HEADER, Opening="Sicilian Defense: Najdorf Variation, English Attack"),
+    # player as Black, draws, unfinished games and missing tags
+    replace(BASE_HEADER, White="opponent", Black=PLAYER, Result="0-1", WhiteTitle="GM", BlackTitle="BOT"),
+    replace(BASE_HEADER, Result="1/2-1/2", Termination=None),
+    replace(BASE_HEADER, Result="*", UTCTime=None),
+    replace(BASE_HEADER, Event=None, Site=None, Date=None, Round=None, Variant=None),
+    # fractional and long time controls
+    replace(BASE_HEADER, TimeControl="30+0", Event="Rated UltraBullet game"),
+    replace(BASE_HEADER, TimeControl="15+0"),
+    replace(BASE_HEADER, TimeControl="5400+30", Event="Rated Classical game"),
+]
+
+
+def synthetic_headers(count: int) -> list[PGNGameHeader]:
+    return list(PGNHeaderParser.parse_games_headers(["".join(game_to_pgn(game) for game in generate_games(count))]))
+
+
+def standardize_rows(headers: list[PGNGameHeader]) -> pa.Table:
+    rows = [PGNGameHeaderStandardized.from_pgn_header(header) for header in headers]
+    return pa.Table.from_batches([arrow_batch_for(rows, STANDARDIZED_SCHEMA)])
+
+
+def transform_rows(headers: list[PGNGameHeader]) -> pa.Table:
+    rows = [
+        PGNGameHeaderPersonified.from_pgn_header_std(PGNGameHeaderStandardized.from_pgn_header(header), PLAYER)
+        for header in headers
+    ]
+    return pa.Table.from_batches([arrow_batch_for(rows, PERSONIFIED_SCHEMA)])
+
+
+@pytest.mark.parametrize(
+    "headers",
+    [synthetic_headers(3000), EDGE_CASE_HEADERS, synthetic_headers(500) + EDGE_CASE_HEADERS],
+    ids=["synthetic", "edge-cases", "mixed"],
+)
+def test_columnar_transform_matches_rows(headers):
+    """Batch transform gives the same table as from_pgn_header + from_pgn_header_std game by game"""
+    raw = ColumnarHelper.headers_to_table(headers)
+    std = ColumnarHelper.standardize_batch(raw)
+
+    assert std.equals(standardize_rows(headers))
+    assert ColumnarHelper.personify_batch(std, PLAYER).equals(transform_rows(headers))
+
+
+def test_synthetic_games_cover_nulls():
+    """The synthetic games have the nulls the comparison above must handle"""
+    table = transform_rows(synthetic_headers(3000))
+
+    assert table["OpeningFamily"].null_count == 0
+    assert table["OpeningFamily"].to_pylist().count("?") > 0
+    assert table["PlayerRatingChange"].null_count > 0
+    assert table["OpponentTitle"].null_count > 0
+
+
+def test_correspondence_games_fail_in_both_transforms():
+    """Correspondence games (TimeControl "-") have no clock to standardize, both transforms reject them"""
+    headers = [BASE_HEADER, replace(BASE_HEADER, TimeControl="-", Event="Rated Correspondence game")]
+
+    with pytest.raises(ValueError):
+        transform_rows(headers)
+    with pytest.raises(ValueError):
+        ColumnarHelper.transform_headers(headers, PLAYER)
+
+
+def test_player_not_in_game_fails_in_both_transforms():
+    headers = [BASE_HEADER, replace(BASE_HEADER, White="someone", Black="else")]
+
+    with pytest.raises(ValueError, match="is not in the game"):
+        transform_rows(headers)
+    with pytest.raises(ValueError, match="is not in the game"):
+        ColumnarHelper.transform_headers(headers, PLAYER)
+
+
+def test_empty_batch():
+    assert ColumnarHelper.transform_headers([], PLAYER).equals(PERSONIFIED_SCHEMA.empty_table())
@@ -0,0 +1,74 @@
+import os
+
+import pyarrow.dataset as ds
+import pytest
+
+from benchmarks.synthetic_data import PLAYER
+from helpers.incremental_helper import IncrementalState
+from helpers.pipeline_helper import DatasetSink
+
+
+def dataset_sites(dir_path: str) -> list[str]:
+    dataset = ds.dataset(dir_path, format="parquet", partitioning="hive")
+    return dataset.to_table(columns=["Site"])["Site"].to_pylist()
+
+
+@pytest.fixture
+def exported_dataset(tmp_path, personified_games) -> str:
+    """Dataset output of 200 games with its incremental state, as left by a finished export"""
+    dir_path = str(tmp_path / f"{PLAYER}.dataset")
+    with DatasetSink(dir_path, row_group_size=50) as sink:
+        sink.write(personified_games(200))
+    state = IncrementalState.from_output(dir_path, PLAYER, "dataset")
+    state.save(dir_path)
+    return dir_path
+
+
+def test_crash_before_commit_leaves_dataset_intact(exported_dataset, personified_games):
+    sink = DatasetSink(exported_dataset, append=True, row_group_size=50)
+    sink.write(personified_games(100, start=200))
+    sink.flush()
+    # the process is killed here: neither close nor abort runs
+
+    assert len(dataset_sites(exported_dataset)) == 200
+    state = IncrementalState.load(exported_dataset, PLAYER, "dataset")
+    assert state.games_count == 200  # the state still matches, the next run continues after game #200
+    assert not [name for name in os.listdir(os.path.dirname(exported_dataset)) if name.endswith(".staging")]
+
+
+def test_crash_during_commit_is_rolled_forward(exported_dataset, personified_games, monkeypatch):
+    new_games = personified_games(100, start=200)
+    sink = DatasetSink(exported_dataset, append=True, row_group_size=50)
+    sink.write(new_games)
+
+    moved = []
+    replace = os.replace
+
+    def replace_then_crash(source, destination):
+        if destination.startswith(exported_dataset + os.sep) and moved:
+            raise KeyboardInterrupt  # killed after the first file is moved into the dataset
+        moved.append(destination)
+        replace(source, destination)
+
+    monkeypatch.setattr(os, "replace", replace_then_crash)
+    with pytest.raises(KeyboardInterrupt):
+        sink.close()
+    monkeypatch.setattr(os, "replace", replace)
+    assert os.path.exists(DatasetSink.journal_path(exported_dataset))
+
+    state = IncrementalState.load(exported_dataset, PLAYER, "dataset")
+    sites = dataset_sites(exported_dataset)
+    assert len(sites) == len(set(sites)) == 300
+    assert state.games_count == 300
+    assert not os.path.exists(DatasetSink.journal_path(exported_dataset))
+
+
+def test_failed_append_is_removed(exported_dataset, personified_games):
+    with pytest.raises(RuntimeError):
+        with DatasetSink(exported_dataset, append=True, row_group_size=50) as sink:
+            sink.write(personified_games(100, start=200))
+            sink.flush()
+            raise RuntimeError("download failed")
+
+    assert len(dataset_sites(exported_dataset)) == 200
+    assert not [name for name in os.listdir(os.path.dirname(exported_dataset)) if name.endswith(".staging")]
@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from benchmarks.fake_lichess_server import FakeLichessServer
+from benchmarks.synthetic_data import PLAYER, START_TIMESTAMP_MSEC
+from helpers.cache_helper import ResponseCache
+from helpers.lichess_api_helper import APIParams_GetGames, LichessAPIHelper
+from helpers.urllib3_helper import RateLimiter, RetryPolicy, Urllib3Exception, Urllib3Helper
+
+# reply of ScriptedServer which closes the connection without a response
+DROP = "drop"
+
+# retries without waiting for long backoffs, Retry-After of 429s is still honored
+FAST_RETRIES = RetryPolicy(max_retries=5, backoff_base=0.01, backoff_max=0.05)
+
+
+class ScriptedServer:
+    """Local HTTP server replying to the n-th request (any path) with the n-th reply, the last one repeated"""
+
+    def __init__(self, replies: list):
+        self.replies = list(replies)
+        self.requests_count = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}/"
+
+    def next_reply(self):
+        with self.lock:
+            self.requests_count += 1
+            return self.replies.pop(0) if len(self.replies) > 1 else self.replies[0]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                reply = server.next_reply()
+                if reply == DROP:
+                    self.close_connection = True
+                    return
+                status, headers, body = reply
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+OK = (200, {}, b"ok")
+
+
+def test_retry_after_of_429_pauses_requests():
+    with ScriptedServer([(429, {"Retry-After": "1"}, b""), OK]) as server:
+        rate_limiter = RateLimiter(100)
+        helper = Urllib3Helper(server.base_url, rate_limiter=rate_limiter, retry_policy=FAST_RETRIES)
+        started = time.monotonic()
+
+        assert helper.get("api/test") == "ok"
+
+        assert time.monotonic() - started >= 1.0
+        assert rate_limiter.paused_until >= started + 1.0
+        assert (helper.stats.requests, helper.stats.retries, helper.stats.throttled) == (2, 1, 1)
+        assert helper.stats.throttle_wait == 1.0
+
+
+def test_dropped_connections_and_server_errors_are_retried():
+    with ScriptedServer([DROP, (503, {}, b"unavailable"), DROP, OK]) as server:
+        helper = Urllib3Helper(server.base_url, retry_policy=FAST_RETRIES)
+
+        assert helper.get("api/test") == "ok"
+        assert (server.requests_count, helper.stats.retries) == (4, 3)
+
+
+def test_client_errors_are_not_retried():
+    with ScriptedServer([(404, {}, b"not found")]) as server:
+        helper = Urllib3Helper(server.base_url, retry_policy=FAST_RETRIES)
+
+        with pytest.raises(Urllib3Exception, match="404"):
+            helper.get("api/test")
+        assert server.requests_count == 1
+
+
+def test_retries_give_up_after_max_retries():
+    with ScriptedServer([DROP]) as server:
+        helper = Urllib3Helper(server.base_url, retry_policy=RetryPolicy(max_retries=2, backoff_base=0.01))
+
+        with pytest.raises(Urllib3Exception):
+            helper.get("api/test")
+        assert server.requests_count == 3
+
+
+def test_backoff_doubles_within_jitter():
+    policy = RetryPolicy(backoff_base=1.0, backoff_max=5.0, jitter=0.5)
+
+    for attempt, delay in enumerate([1.0, 2.0, 4.0, 5.0, 5.0]):
+        assert delay * 0.5 <= policy.backoff(attempt) <= delay * 1.5
+
+
+def test_rate_limiter_allows_bursts_and_keeps_the_rate():
+    rate_limiter = RateLimiter(rate=20, burst=5)
+    started = time.monotonic()
+    for _ in range(5):
+        rate_limiter.acquire()
+    assert time.monotonic() - started < 0.1
+
+    # the bucket is empty now: 10 more requests take at least 10 / 20 seconds
+    for _ in range(10):
+        rate_limiter.acquire()
+    assert time.monotonic() - started >= 0.45
+
+
+def test_rate_limiter_is_shared_by_threads():
+    rate_limiter = RateLimiter(rate=40)
+    started = time.monotonic()
+    threads = [threading.Thread(target=lambda: [rate_limiter.acquire() for _ in range(5)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 20 requests, the first without waiting
+    assert time.monotonic() - started >= 19 / 40 - 0.05
+
+
+@pytest.mark.parametrize("api_format", ["pgn", "json"])
+@pytest.mark.parametrize("sort, max_games", [(None, None), ("dateAsc", None), (None, 1500)])
+def test_resumed_downloads_have_every_game_once(fake_api_helper, api_format, sort, max_games):
+    """Downloads broken midway (and throttled) resume where they stopped: no game is lost or repeated"""
+    with FakeLichessServer(2000, throttle_every=4, disconnect_after=400, disconnect_count=3) as server:
+        params = APIParams_GetGames(max=max_games, sort=sort)
+        helper = fake_api_helper(server)
+        if api_format == "pgn":
+            game_ids = [header.GameId for header in helper.iter_games_headers(PLAYER, params)]
+        else:
+            game_ids = [game["id"] for game in helper.iter_games_json(PLAYER, params)]
+
+        expected = [game["id"] for game in server.select_games(PLAYER, {"sort": sort, "max": max_games})]
+        assert server.disconnected_count == 3 and server.throttled_count >= 1
+        assert not [game_id for game_id, count in Counter(game_ids).items() if count > 1]
+        assert game_ids == expected
+
+
+
+@pytest.mark.parametrize("api_format", ["pgn", "json"])
+def test_resumed_downloads_are_cached_as_one_request(tmp_path, fake_api_helper, api_format):
+    """A download resumed midway is cached under the original request: not downloaded again, served offline"""
+    cache_dir = str(tmp_path / "cache")
+    # a period entirely in the past, so its responses are cached
+    params = APIParams_GetGames(since=START_TIMESTAMP_MSEC, until=START_TIMESTAMP_MSEC + 365 * 24 * 3600 * 1000)
+
+    def download_ids(helper) -> list[str]:
+        if api_format == "pgn":
+            return [header.GameId for header in helper.iter_games_headers(PLAYER, params)]
+        return [game["id"] for game in helper.iter_games_json(PLAYER, params)]
+
+    with FakeLichessServer(2000, disconnect_after=400, disconnect_count=3) as server:
+        expected = [game["id"] for game in server.select_games(PLAYER, params)]
+        assert download_ids(fake_api_helper(server, ResponseCache(cache_dir))) == expected
+        assert server.disconnected_count == 3
+
+        requests_count = server.requests_count
+        assert download_ids(fake_api_helper(server, ResponseCache(cache_dir))) == expected
+        assert server.requests_count == requests_count
+
+    offline_cache = ResponseCache(cache_dir, offline=True)
+    assert download_ids(fake_api_helper(server, offline_cache)) == expected
+    assert offline_cache.stats.hits == 1
+
+
+def test_sharded_downloads_skip_games_repeated_at_window_boundaries():
+    """Games a window gets again from its neighbour's boundary second are yielded once, in order"""
+    games = [(created_at, f"game{created_at}") for created_at in range(0, 100_000, 250)]
+
+    def fetch(params: APIParams_GetGames):
+        # like downloads resumed by PGN time: whole seconds, windows overlap in their boundary seconds
+        since, until = params["since"] // 1000 * 1000, params["until"] // 1000 * 1000 + 999
+        return (game for game in reversed(games) if since <= game[0] <= until)
+
+    sharded = LichessAPIHelper("token").iter_games_sharded(
+        fetch,
+        lambda game: (game[0] // 1000, game[1]),
+        APIParams_GetGames(since=0, until=99_999),
+        shards=7,
+        concurrency=3,
+    )
+    assert list(sharded) == list(reversed(games))
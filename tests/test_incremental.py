@@ -0,0 +1,61 @@
+import pyarrow.parquet as pq
+import pytest
+
+from benchmarks.fake_lichess_server import FakeLichessServer
+from benchmarks.synthetic_data import PLAYER
+from export_games import main
+from helpers.stats_helper import AggregateCube
+
+
+@pytest.fixture
+def export(tmp_path, monkeypatch):
+    """Runs export_games.py against a fake Lichess server into tmp_path, returns the output path"""
+    monkeypatch.setenv("LICHESS_TOKEN", "token")
+
+    def run(server: FakeLichessServer, *options: str, output_format: str = "parquet") -> str:
+        monkeypatch.setenv("LICHESS_BASE_URL", server.base_url)
+        main(
+            [
+                "--username", PLAYER,
+                "--start-date", "2023-01-01",
+                "--end-date", "2025-12-31",
+                "--folder", str(tmp_path),
+                "--format", output_format,
+                "--requests-per-second", "100",
+                *options,
+            ]
+        )
+        return str(tmp_path / f"{PLAYER}.{output_format}")
+
+    return run
+
+
+def test_incremental_runs_with_max_games_export_every_game_once(export):
+    """Each capped incremental run continues after the games of the previous one: nothing is skipped"""
+    with FakeLichessServer(300) as server:
+        for _ in range(4):
+            output_path = export(server, "--incremental", "--max-games", "100")
+
+        expected_sites = [f"https://lichess.org/{game['id']}" for game in server.user_games(PLAYER)]
+
+    exported_sites = pq.read_table(output_path, columns=["Site"])["Site"].to_pylist()
+    assert exported_sites == expected_sites
+
+
+def test_incremental_duckdb_runs_update_the_cube_without_rescans(export, monkeypatch):
+    """Incremental runs add their games to the cube instead of counting the whole database again"""
+    rescans = []
+    from_output = AggregateCube.from_output.__func__
+    monkeypatch.setattr(
+        AggregateCube,
+        "from_output",
+        classmethod(lambda cls, *args: rescans.append(args) or from_output(cls, *args)),
+    )
+
+    with FakeLichessServer(300) as server:
+        for _ in range(3):
+            output_path = export(server, "--incremental", "--max-games", "100", output_format="duckdb")
+
+    assert rescans == []
+    cube = AggregateCube.load(output_path, "duckdb")
+    assert cube.differences(from_output(AggregateCube, output_path, "duckdb")) == []
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+
+from benchmarks.synthetic_data import PLAYER
+from helpers.pipeline_helper import PGNGameHeaderPersonified, arrow_batch_for, arrow_schema_for
+from helpers.service_helper import DATASET_COLUMNS, PERIOD_MEMO_SIZE, DatasetCache, PlayerDataset
+from helpers.stats_helper import AggregateCube
+
+
+def test_period_memos_are_bounded_and_counted(personified_games):
+    """Cubes and reports of many periods (e.g. days=N asked every day) keep the recently used ones only"""
+    schema = arrow_schema_for(PGNGameHeaderPersonified)
+    games = pa.Table.from_batches([arrow_batch_for(personified_games(2000), schema)]).select(DATASET_COLUMNS)
+    dataset = PlayerDataset(PLAYER, games, AggregateCube.from_games([games]))
+    base_nbytes = dataset.nbytes
+
+    first_game_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for period in range(3 * PERIOD_MEMO_SIZE):
+        dataset.report("color", first_game_time + timedelta(hours=4 * period), None)
+
+    assert len(dataset.period_cubes.values) == len(dataset.reports.values) == PERIOD_MEMO_SIZE
+    memos_nbytes = dataset.period_cubes.nbytes + dataset.reports.nbytes
+    assert memos_nbytes == sum(nbytes for _, nbytes in dataset.period_cubes.values.values()) + sum(
+        nbytes for _, nbytes in dataset.reports.values.values()
+    )
+    assert dataset.nbytes == base_nbytes + memos_nbytes > base_nbytes
+
+    # the memos count against the memory of the cache
+    cache = DatasetCache(max_bytes=dataset.nbytes)
+    cache.put(dataset)
+    assert cache.nbytes == dataset.nbytes